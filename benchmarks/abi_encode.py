@@ -0,0 +1,146 @@
+"""
+Encoding benchmark of `encode_function_call`.
+
+Times the calldata of the approve, transfer and swap transactions of
+`app_simulator.ipynb` with two paths:
+
+- web3: the former path, a `w3.eth.contract` built for every call, which validates the
+  ABI, and the addresses checksummed through the `convert_to_checksum_address` tool.
+- compiled: the selector and argument types compiled once per ABI fragment, the
+  arguments encoded by `eth_abi` directly.
+
+The run fails if a path does not produce the calldata of the notebook.
+
+Usage:
+    python -m benchmarks.abi_encode --iterations 2000
+"""
+
+import sys
+import json
+import time
+import argparse
+import statistics
+from typing import Callable, Dict, List, Optional
+
+from web3 import Web3
+
+from graph.tools import get_w3
+from graph.tools.abi import encode_function_call
+from graph.tools.address import convert_to_checksum_address
+
+
+_SENDER = "0xd8da6bf26964af9d7eed9e03e53415d37aa96045"
+_USDT = "0xdAC17F958D2ee523a2206206994597C13D831ec7"
+_USDC = "0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48"
+_ROUTER = "0x7a250d5630B4cF539739dF2C5dAcb4c659F2488D"
+
+
+def _load_abi(path: str) -> list:
+    with open(path) as file:
+        return json.load(file)
+
+
+def _calls() -> Dict[str, tuple]:
+    """Returns the ABI, function name, arguments and expected calldata of each call."""
+    erc20 = _load_abi("abi/erc20.json")
+    router = _load_abi("abi/uniswap_v2_router.json")
+    return {
+        "approve": (
+            erc20,
+            "approve",
+            [_ROUTER.lower(), 100_000_000],
+            "0x095ea7b3"
+            "0000000000000000000000007a250d5630b4cf539739df2c5dacb4c659f2488d"
+            "0000000000000000000000000000000000000000000000000000000005f5e100",
+        ),
+        "transfer": (
+            erc20,
+            "transfer",
+            ["0xb859d7eb5e319e54dc23c83dfe93e649b88202b6", 100_000_000],
+            "0xa9059cbb"
+            "000000000000000000000000b859d7eb5e319e54dc23c83dfe93e649b88202b6"
+            "0000000000000000000000000000000000000000000000000000000005f5e100",
+        ),
+        "swap": (
+            router,
+            "swapExactTokensForTokens",
+            [100_000_000, 0, [_USDT, _USDC], _SENDER, 0x66E46AAD],
+            "0x38ed1739"
+            "0000000000000000000000000000000000000000000000000000000005f5e100"
+            "0000000000000000000000000000000000000000000000000000000000000000"
+            "00000000000000000000000000000000000000000000000000000000000000a0"
+            "000000000000000000000000d8da6bf26964af9d7eed9e03e53415d37aa96045"
+            "0000000000000000000000000000000000000000000000000000000066e46aad"
+            "0000000000000000000000000000000000000000000000000000000000000002"
+            "000000000000000000000000dac17f958d2ee523a2206206994597c13d831ec7"
+            "000000000000000000000000a0b86991c6218b36c1d19d4a2e9eb0ce3606eb48",
+        ),
+    }
+
+
+def _web3_encode(abi: list, function_name: str, arguments: list) -> str:
+    # The former body of `encode_function_call`
+    contract = get_w3().eth.contract(abi=abi)
+    for i, arg in enumerate(arguments):
+        if Web3.is_address(arg):
+            arguments[i] = convert_to_checksum_address.invoke(arg)
+    return contract.encode_abi(function_name, arguments)
+
+
+def _compiled_encode(abi: list, function_name: str, arguments: list) -> str:
+    return encode_function_call.func(abi, function_name, arguments)
+
+
+def _time(
+    encode: Callable[[list, str, list], str], call: tuple, iterations: int
+) -> List[float]:
+    abi, function_name, arguments, _ = call
+    samples = []
+    for _ in range(iterations):
+        # The arguments are checksummed in place, as the tool receives fresh ones
+        args = [list(arg) if isinstance(arg, list) else arg for arg in arguments]
+        start = time.perf_counter()
+        encode(abi, function_name, args)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def measure(iterations: int) -> Dict[str, dict]:
+    """Returns the median encoding time in seconds of each call with each path."""
+    paths = {"web3": _web3_encode, "compiled": _compiled_encode}
+    results = {}
+    for name, call in _calls().items():
+        abi, function_name, arguments, expected = call
+        results[name] = {}
+        for path, encode in paths.items():
+            data = encode(abi, function_name, list(arguments))
+            if data.lower() != expected:
+                raise ValueError(f"{path} encoded {name} as {data}")
+            # Warm up, so the first iterations do not pay for the compilation
+            _time(encode, call, 10)
+            results[name][path] = statistics.median(_time(encode, call, iterations))
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Encoding benchmark of encode_function_call")
+    parser.add_argument("--iterations", type=int, default=2_000)
+    args = parser.parse_args(argv)
+
+    try:
+        results = measure(args.iterations)
+    except ValueError as e:
+        print(f"Wrong calldata: {e}")
+        return 1
+
+    print(f"{'Call':<10} {'web3':>10} {'Compiled':>10} {'Speedup':>8}")
+    for name, timings in results.items():
+        print(
+            f"{name:<10} {timings['web3'] * 1e6:>8.1f}us {timings['compiled'] * 1e6:>8.1f}us "
+            f"{timings['web3'] / timings['compiled']:>7.1f}x"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
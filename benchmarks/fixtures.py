@@ -0,0 +1,159 @@
+"""
+Record and replay HTTP traffic for offline benchmarks.
+
+`RecordingTransport` forwards requests to the network and stores every response, and
+`ReplayTransport` serves the stored responses without any network access. Both are set
+with `utils.http.set_transport`, which also routes the OpenAI models through them.
+
+Requests are matched on method, host, path (without API keys), JSON-RPC method and a
+normalized body. Unix timestamps are masked in bodies, since the converter prompt and
+deadlines change on every run. A request whose body still differs, e.g. a bundle carrying
+an encoded deadline, is served the next unused response of the same endpoint.
+
+Classes:
+- RecordingTransport: Records responses from the network.
+- ReplayTransport: Replays recorded responses.
+"""
+
+import re
+import json
+import hashlib
+import threading
+from collections import defaultdict
+from typing import Dict, List, Tuple
+from urllib.parse import parse_qsl, urlencode
+
+import httpx
+
+
+# Unix timestamps of 2017-2128
+_TIMESTAMP = re.compile(r"(?<!\d)[1-4]\d{9}(?!\d)")
+# Path segments and query parameters that carry API keys
+_SECRET_SEGMENT = re.compile(r"^[0-9A-Za-z_-]{20,}$")
+_SECRET_PARAMS = {"apikey", "api_key", "key"}
+
+
+class FixtureError(Exception):
+    """Error raised when a request has no recorded response."""
+
+
+def _endpoint(request: httpx.Request) -> str:
+    path = "/".join(
+        s for s in request.url.path.split("/") if not _SECRET_SEGMENT.match(s)
+    )
+    endpoint = f"{request.method} {request.url.host}{path}"
+    try:
+        body = json.loads(request.content or b"null")
+    except ValueError:
+        body = None
+    # JSON-RPC requests share one URL, the method tells them apart
+    if isinstance(body, dict) and "jsonrpc" in body:
+        endpoint += f" {body.get('method')}"
+    return endpoint
+
+
+def _body_key(request: httpx.Request) -> str:
+    query = urlencode(
+        sorted(
+            (k, v)
+            for k, v in parse_qsl(request.url.query.decode())
+            if k.lower() not in _SECRET_PARAMS
+        )
+    )
+    body = _TIMESTAMP.sub("<timestamp>", (request.content or b"").decode("utf-8", "replace"))
+    return hashlib.sha256(f"{query}\n{body}".encode()).hexdigest()
+
+
+def _response(interaction: dict, request: httpx.Request) -> httpx.Response:
+    return httpx.Response(
+        interaction["status"],
+        headers={"content-type": interaction["content_type"]},
+        content=interaction["body"].encode(),
+        request=request,
+    )
+
+
+class RecordingTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """
+    Forwards requests to the network and records their responses.
+
+    Args:
+        path (str): The fixture file written by `save`.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.interactions: List[dict] = []
+        self._lock = threading.Lock()
+        self._sync = httpx.HTTPTransport()
+        self._async = httpx.AsyncHTTPTransport()
+
+    def _record(self, request: httpx.Request, response: httpx.Response) -> httpx.Response:
+        interaction = {
+            "endpoint": _endpoint(request),
+            "body_key": _body_key(request),
+            "status": response.status_code,
+            "content_type": response.headers.get("content-type", ""),
+            "body": response.text,
+        }
+        with self._lock:
+            self.interactions.append(interaction)
+        # The body was decoded while reading, the encoding headers no longer apply
+        return _response(interaction, request)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        response = self._sync.handle_request(request)
+        response.read()
+        return self._record(request, response)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        response = await self._async.handle_async_request(request)
+        await response.aread()
+        return self._record(request, response)
+
+    def save(self) -> None:
+        with open(self.path, "w") as file:
+            json.dump(self.interactions, file, indent=1)
+
+
+class ReplayTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """
+    Serves recorded responses, raising `FixtureError` for any request that was not recorded.
+
+    Args:
+        path (str): The fixture file written by `RecordingTransport.save`.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "r") as file:
+            interactions = json.load(file)
+        self._lock = threading.Lock()
+        self._by_body: Dict[Tuple[str, str], List[dict]] = defaultdict(list)
+        self._by_endpoint: Dict[str, List[dict]] = defaultdict(list)
+        for interaction in interactions:
+            key = (interaction["endpoint"], interaction["body_key"])
+            self._by_body[key].append(interaction)
+            self._by_endpoint[interaction["endpoint"]].append(interaction)
+        self._used: set = set()
+
+    def _take(self, candidates: List[dict]) -> dict:
+        for interaction in candidates:
+            if id(interaction) not in self._used:
+                self._used.add(id(interaction))
+                return interaction
+        # Identical requests may be repeated more often than recorded, e.g. cached lookups
+        return candidates[-1]
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        endpoint = _endpoint(request)
+        with self._lock:
+            candidates = self._by_body.get((endpoint, _body_key(request)))
+            if not candidates:
+                candidates = self._by_endpoint.get(endpoint)
+            if not candidates:
+                raise FixtureError(f"No recorded response for {endpoint}")
+            interaction = self._take(candidates)
+        return _response(interaction, request)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return self.handle_request(request)
@@ -0,0 +1,318 @@
+"""
+Offline latency benchmark of the nodes of the plan-simulate graph.
+
+Runs the demo intents of `app.ipynb` through the graph with every HTTP request, including
+the LLM, Tenderly, Etherscan and RPC calls, served from recorded fixtures. Each run
+happens in a fresh interpreter with empty caches, so results do not depend on the order
+of the runs or on the local ABI store.
+
+- Wall time of each node (planner, speculator, converter, simulator, replanner).
+- Tool calls and LLM calls of each case.
+- Memory allocated by each node and peak memory of each case, with tracemalloc.
+
+Results are compared to a stored baseline: a node slower than the baseline by more than
+the tolerance, or a case making more tool or LLM calls, fails the run. A run without
+fixtures or without a baseline fails too, unless it stores the baseline.
+
+Fixtures are recorded once from the network, which needs the API keys of `.env`. The case
+index is built in a temporary directory from the cases of `cases.jsonl` next to the
+fixtures, before the timed run, so its embedding requests are recorded with each case.
+
+Usage:
+    python -m benchmarks.nodes --record           # Record the fixtures
+    python -m benchmarks.nodes --update-baseline  # Store the baseline
+    python -m benchmarks.nodes --runs 5           # Compare to the baseline
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+import statistics
+import subprocess
+import tracemalloc
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+
+FIXTURES_DIR = "benchmarks/fixtures/nodes"
+BASELINE_PATH = "benchmarks/baselines/nodes.json"
+# Converted cases the planner retrieves its context from
+CASES_PATH = os.path.join(FIXTURES_DIR, "cases.jsonl")
+
+_FROM_ADDRESS = "0xd8da6bf26964af9d7eed9e03e53415d37aa96045"
+
+# The demo intents of app.ipynb
+CASES: Dict[str, str] = {
+    "case1": "Send 0.2 ETH to Scott.eth",
+    "case2": "Swap 0.05 USDC to USDT",
+    "case3": "Stake 0.3 ETH with Lido and restake on Eigenpie",
+    "case4": "Send 100 ETH to Scott.eth",
+    "case5a": "Send 0.01 USDC to a random address",
+    "case5b": "Send 0.2 ETH to Scott",
+    "case6": "Send all my USDC to vitalik.eth",
+}
+
+# Timing differences below this are noise
+_MIN_REGRESSION = 0.005
+
+# Keys of the replayed runs, long enough to be masked in the endpoints like real keys
+_REPLAY_KEYS = {
+    "OPENAI_API_KEY": "replay",
+    "INFURA_API_KEY": "replay" * 4,
+    "TENDERLY_API_KEY": "replay" * 4,
+    "ETHERSCAN_API_KEY": "replay" * 4,
+}
+
+
+def _profiler():
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class NodeProfiler(BaseCallbackHandler):
+        """Times the nodes of the graph and counts the tool and LLM calls."""
+
+        # Called on the event loop, so timings are not delayed by a thread pool
+        run_inline = True
+
+        def __init__(self):
+            self.root = None
+            self.nodes = defaultdict(lambda: {"calls": 0, "wall_time": 0.0, "allocated": 0})
+            self.tool_calls: Counter = Counter()
+            self.llm_calls = 0
+            self._starts = {}
+
+        def on_chain_start(
+            self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs
+        ):
+            if parent_run_id is None:
+                self.root = run_id
+            elif parent_run_id == self.root and metadata and "langgraph_node" in metadata:
+                memory = tracemalloc.get_traced_memory()[0]
+                self._starts[run_id] = (metadata["langgraph_node"], time.perf_counter(), memory)
+
+        def _finish(self, run_id) -> None:
+            if run_id not in self._starts:
+                return
+            node, start, memory = self._starts.pop(run_id)
+            self.nodes[node]["calls"] += 1
+            self.nodes[node]["wall_time"] += time.perf_counter() - start
+            self.nodes[node]["allocated"] += tracemalloc.get_traced_memory()[0] - memory
+
+        def on_chain_end(self, outputs, *, run_id, **kwargs):
+            self._finish(run_id)
+
+        def on_chain_error(self, error, *, run_id, **kwargs):
+            self._finish(run_id)
+
+        def on_tool_start(self, serialized, input_str, **kwargs):
+            self.tool_calls[kwargs.get("name") or (serialized or {}).get("name")] += 1
+
+        def on_chat_model_start(self, serialized, messages, **kwargs):
+            self.llm_calls += 1
+
+    return NodeProfiler()
+
+
+def _worker(case_id: str, record: bool) -> dict:
+    """Runs one case in this interpreter and returns its measurements."""
+    from benchmarks.fixtures import RecordingTransport, ReplayTransport
+    from utils.http import set_transport
+
+    fixture = os.path.join(FIXTURES_DIR, f"{case_id}.json")
+    transport = RecordingTransport(fixture) if record else ReplayTransport(fixture)
+    set_transport(transport)
+
+    from case import case_retriever
+    from graph.workflow import get_app
+
+    # The planner enables tracing on import, traces would be sent to LangSmith
+    os.environ["LANGCHAIN_TRACING_V2"] = "false"
+    with tempfile.TemporaryDirectory() as tmp:
+        # The case store writes its index next to the cases, keep it out of the tree
+        cases_path = os.path.join(tmp, "cases.jsonl")
+        shutil.copyfile(CASES_PATH, cases_path)
+        case_retriever.CASE_CONVERTED_PATH = cases_path
+        case_retriever.CASE_INDEX_PATH = os.path.join(tmp, "index")
+        # Built before the timed run, the planner is measured with a warm index
+        case_retriever.get_index()
+
+        app = get_app()
+        profiler = _profiler()
+        tracemalloc.start()
+        start = time.perf_counter()
+        error = None
+        try:
+            asyncio.run(
+                app.ainvoke(
+                    {"input": CASES[case_id], "from_address": _FROM_ADDRESS},
+                    config={"callbacks": [profiler], "recursion_limit": 50},
+                )
+            )
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        wall_time = time.perf_counter() - start
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    if record:
+        transport.save()
+
+    return {
+        "wall_time": wall_time,
+        "peak_memory": peak_memory,
+        "nodes": dict(profiler.nodes),
+        "tool_calls": dict(profiler.tool_calls),
+        "llm_calls": profiler.llm_calls,
+        "error": error,
+    }
+
+
+def _run_case(case_id: str, record: bool) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {
+            **os.environ,
+            # Caches start empty and are not persisted
+            "ABI_STORE_PATH": os.path.join(tmp, "abi_store.sqlite3"),
+            "TOKEN_METADATA_PATH": os.path.join(tmp, "token_metadata.sqlite3"),
+            "PLAN_CACHE_PATH": "",
+            "STEP_TEMPLATES_PATH": "",
+        }
+        if not record:
+            for name, value in _REPLAY_KEYS.items():
+                env.setdefault(name, value)
+        command = [sys.executable, "-m", "benchmarks.nodes", "--worker", case_id]
+        output = subprocess.run(
+            command + (["--record"] if record else []),
+            capture_output=True,
+            text=True,
+            check=True,
+            env=env,
+        ).stdout
+    # The last line is the measurement, anything before is printed by the modules
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure_case(case_id: str, runs: int) -> dict:
+    """Returns the median measurements of a case over several runs."""
+    results = [_run_case(case_id, record=False) for _ in range(runs)]
+    nodes = {}
+    for node in results[0]["nodes"]:
+        samples = [r["nodes"].get(node, {}) for r in results]
+        nodes[node] = {
+            "calls": results[0]["nodes"][node]["calls"],
+            "wall_time": statistics.median(s.get("wall_time", 0.0) for s in samples),
+            "allocated": statistics.median(s.get("allocated", 0) for s in samples),
+        }
+    return {
+        "wall_time": statistics.median(r["wall_time"] for r in results),
+        "peak_memory": statistics.median(r["peak_memory"] for r in results),
+        "nodes": nodes,
+        # Replayed runs are deterministic, the counts of the first run are the counts
+        "tool_calls": results[0]["tool_calls"],
+        "llm_calls": results[0]["llm_calls"],
+        "error": results[0]["error"],
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Returns the regressions of the results compared to the baseline."""
+    regressions = []
+    for case_id, result in results.items():
+        base = baseline.get(case_id)
+        if not base:
+            continue
+        for node, stats in result["nodes"].items():
+            base_time = base["nodes"].get(node, {}).get("wall_time")
+            if base_time is None:
+                continue
+            limit = max(base_time * (1 + tolerance), base_time + _MIN_REGRESSION)
+            if stats["wall_time"] > limit:
+                regressions.append(
+                    f"{case_id}/{node}: {stats['wall_time']:.3f}s > baseline {base_time:.3f}s"
+                )
+        tool_calls = sum(result["tool_calls"].values())
+        base_tool_calls = sum(base["tool_calls"].values())
+        if tool_calls > base_tool_calls:
+            regressions.append(
+                f"{case_id}: {tool_calls} tool calls > baseline {base_tool_calls}"
+            )
+        if result["llm_calls"] > base["llm_calls"]:
+            regressions.append(
+                f"{case_id}: {result['llm_calls']} LLM calls > baseline {base['llm_calls']}"
+            )
+    return regressions
+
+
+def _print_results(results: dict) -> None:
+    print(f"{'Case':<8} {'Node':<12} {'Calls':>5} {'Wall time':>10} {'Allocated':>11}")
+    for case_id, result in results.items():
+        for node, stats in result["nodes"].items():
+            print(
+                f"{case_id:<8} {node:<12} {stats['calls']:>5} "
+                f"{stats['wall_time']:>9.3f}s {stats['allocated'] / 1024:>8.0f} KiB"
+            )
+        print(
+            f"{case_id:<8} {'total':<12} {'':>5} {result['wall_time']:>9.3f}s "
+            f"{result['peak_memory'] / 1024:>8.0f} KiB peak, "
+            f"{sum(result['tool_calls'].values())} tool calls, {result['llm_calls']} LLM calls"
+        )
+        if result["error"]:
+            print(f"{case_id:<8} error: {result['error']}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmark of the graph nodes")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+    parser.add_argument(
+        "--tolerance", type=float, default=0.2, help="Allowed slowdown, e.g. 0.2 for 20%%"
+    )
+    parser.add_argument("--record", action="store_true", help="Record the fixtures")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(_worker(args.worker, args.record)))
+        return 0
+
+    if args.record:
+        os.makedirs(FIXTURES_DIR, exist_ok=True)
+        for case_id in args.cases:
+            _run_case(case_id, record=True)
+            print(f"Recorded {case_id}")
+        return 0
+
+    missing = [
+        c for c in args.cases if not os.path.exists(os.path.join(FIXTURES_DIR, f"{c}.json"))
+    ]
+    if missing:
+        print(f"Missing fixtures for {', '.join(missing)}, record them with --record")
+        return 1
+    if not args.update_baseline and not os.path.exists(BASELINE_PATH):
+        # Without a baseline nothing is compared, the gate must not pass silently
+        print(f"No baseline at {BASELINE_PATH}, store one with --update-baseline")
+        return 1
+
+    results = {case_id: measure_case(case_id, args.runs) for case_id in args.cases}
+    _print_results(results)
+
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+        with open(BASELINE_PATH, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"Baseline saved to {BASELINE_PATH}")
+        return 0
+
+    with open(BASELINE_PATH, "r") as file:
+        regressions = compare(results, json.load(file), args.tolerance)
+    for regression in regressions:
+        print(f"Regression: {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
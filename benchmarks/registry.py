@@ -0,0 +1,174 @@
+"""
+Lookup benchmark of the token and protocol registry.
+
+Builds a registry of the local lists plus synthetic tokens and protocols spread over
+several chains, then times lookups of each kind against it:
+
+- Exact: a symbol, name or alias of an entry.
+- Prefix: the first letters of a name.
+- Fuzzy: a name with a typo.
+- Miss: a name matching nothing.
+
+The hit rate is the share of lookups returning the entry the query was made from, a
+prefix or a typo can match another entry better, or too weakly for `lookup` to settle
+on one. The run fails if the 99th percentile
+of a lookup kind exceeds the budget.
+
+Usage:
+    python -m benchmarks.registry --entries 50000 --budget 1
+"""
+
+import sys
+import time
+import random
+import argparse
+import statistics
+from typing import Callable, Dict, List, Optional, Tuple
+
+from graph.tools.registry import Registry, RegistryEntry, load_registry
+
+
+CHAIN_IDS = [1, 10, 137, 8453, 42161]
+
+_CONSONANTS = "bcdfghjklmnprstvwxz"
+_VOWELS = "aeiouy"
+# Words shared by many names, as in real token lists
+_COMMON_WORDS = ["Token", "Wrapped", "USD", "Staked", "Finance", "Protocol", "DAO"]
+
+
+def _word(rng: random.Random) -> str:
+    # A pronounceable made-up word, e.g. "Kovamu"
+    syllables = (
+        rng.choice(_CONSONANTS) + rng.choice(_VOWELS) for _ in range(rng.randint(2, 4))
+    )
+    return "".join(syllables).capitalize()
+
+
+def synthetic_entries(count: int, seed: int = 0) -> List[RegistryEntry]:
+    """Returns random tokens and protocols, one in ten a protocol."""
+    rng = random.Random(seed)
+    entries = []
+    for i in range(count):
+        name = f"{_word(rng)} {rng.choice(_COMMON_WORDS)}"
+        if rng.random() < 0.3:
+            name = f"{rng.choice(_COMMON_WORDS)} {name}"
+        address = f"0x{rng.getrandbits(160):040x}"
+        if i % 10:
+            symbol = "".join(rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ") for _ in range(4))
+            entries.append(
+                RegistryEntry(
+                    kind="token",
+                    chain_id=rng.choice(CHAIN_IDS),
+                    address=address,
+                    name=name,
+                    symbol=symbol,
+                    decimals=18,
+                )
+            )
+        else:
+            entries.append(
+                RegistryEntry(
+                    kind="protocol",
+                    chain_id=rng.choice(CHAIN_IDS),
+                    address=address,
+                    name=f"{name} Router",
+                    aliases=[name.split()[0].lower()],
+                )
+            )
+    return entries
+
+
+def _typo(name: str, rng: random.Random) -> str:
+    position = rng.randrange(len(name))
+    return name[:position] + rng.choice("abcdefghijklmnopqrstuvwxyz") + name[position + 1 :]
+
+
+def _time(
+    lookup: Callable[[str, int], Optional[RegistryEntry]], queries: List[tuple]
+) -> Tuple[List[float], int]:
+    """Returns the time of each lookup and the number of lookups finding their entry."""
+    samples, hits = [], 0
+    for name, chain_id, expected in queries:
+        start = time.perf_counter()
+        entry = lookup(name, chain_id)
+        samples.append(time.perf_counter() - start)
+        hits += expected is not None and entry is expected
+    return samples, hits
+
+
+def _percentile(samples: List[float], percentile: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percentile))]
+
+
+def measure(registry: Registry, queries: int, seed: int = 0) -> Dict[str, dict]:
+    """Returns the median and 99th percentile in seconds and the hit rate of each kind of lookup."""
+    rng = random.Random(seed)
+    entries = [rng.choice(registry.entries) for _ in range(queries)]
+    workloads = {
+        "exact": (
+            registry.exact,
+            [(entry.symbol or entry.name, entry.chain_id, entry) for entry in entries],
+        ),
+        "prefix": (
+            registry.lookup,
+            [
+                (entry.name[: max(3, len(entry.name) // 2)], entry.chain_id, entry)
+                for entry in entries
+            ],
+        ),
+        "fuzzy": (
+            registry.lookup,
+            [(_typo(entry.name, rng), entry.chain_id, entry) for entry in entries],
+        ),
+        "miss": (
+            registry.lookup,
+            [(f"qqx{i}wvj", rng.choice(CHAIN_IDS), None) for i in range(queries)],
+        ),
+    }
+    results = {}
+    for kind, (lookup, workload) in workloads.items():
+        # Warm up, so the first queries do not pay for lazy allocations
+        _time(lookup, workload[:100])
+        samples, hits = _time(lookup, workload)
+        results[kind] = {
+            "median": statistics.median(samples),
+            "p99": _percentile(samples, 0.99),
+            "hit_rate": hits / len(workload),
+        }
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Lookup benchmark of the registry")
+    parser.add_argument("--entries", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=2_000)
+    parser.add_argument(
+        "--budget", type=float, default=1.0, help="Maximum p99 of a lookup, in milliseconds"
+    )
+    args = parser.parse_args(argv)
+
+    entries = load_registry().entries + synthetic_entries(args.entries)
+    start = time.perf_counter()
+    registry = Registry(entries)
+    build_time = time.perf_counter() - start
+    print(f"Registry of {len(registry)} entries built in {build_time:.2f}s")
+
+    results = measure(registry, args.queries)
+    print(f"{'Lookup':<8} {'Median':>10} {'p99':>10} {'Hit rate':>9}")
+    over_budget = []
+    for kind, stats in results.items():
+        print(
+            f"{kind:<8} {stats['median'] * 1e6:>8.1f}us {stats['p99'] * 1e6:>8.1f}us "
+            f"{stats['hit_rate']:>9.1%}"
+        )
+        if stats["p99"] * 1000 > args.budget:
+            over_budget.append(kind)
+    if over_budget:
+        print(f"Over the {args.budget}ms budget: {', '.join(over_budget)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
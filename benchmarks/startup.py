@@ -0,0 +1,131 @@
+"""
+Startup benchmark for the graph package.
+
+Each measurement runs in a fresh interpreter so module caches from a previous
+measurement do not hide the cost of an import.
+
+- Import time: time to import each module of the graph package.
+- Time to first request: time to import the graph and build every handle needed
+  to serve a request (planner, converter, replanner, Web3) and run a first tool call.
+
+Usage:
+    python -m benchmarks.startup --runs 5 --budget 3
+"""
+
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from typing import List
+
+
+MODULES = [
+    "graph.tools",
+    "graph.state",
+    "graph.converter_tool",
+    "graph.replanner",
+    "graph.planner",
+]
+
+_IMPORT_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import {module}
+print(json.dumps({{"seconds": time.perf_counter() - start}}))
+"""
+
+_FIRST_REQUEST_SCRIPT = """
+import json, time
+start = time.perf_counter()
+from graph.planner import get_planner
+from graph.converter_tool import get_converter
+from graph.replanner import get_replanner
+from graph.tools import get_w3, fetch_contract_abi
+imported = time.perf_counter()
+get_planner()
+get_converter()
+get_replanner()
+get_w3()
+# Served from the local ABI files, no network request
+fetch_contract_abi.invoke(
+    {{"contract_address": "0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48", "function_name": "approve"}}
+)
+ready = time.perf_counter()
+print(json.dumps({{"import": imported - start, "ready": ready - start}}))
+"""
+
+
+def _run(script: str) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", script], capture_output=True, text=True, check=True
+    ).stdout
+    # The last line is the measurement, anything before is printed by the modules
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure_import(module: str, runs: int) -> float:
+    """Returns the median import time of the module in seconds."""
+    script = _IMPORT_SCRIPT.format(module=module)
+    return statistics.median(_run(script)["seconds"] for _ in range(runs))
+
+
+def measure_first_request(runs: int) -> dict:
+    """Returns the median import time and time to first request in seconds."""
+    script = _FIRST_REQUEST_SCRIPT.format()
+    results = [_run(script) for _ in range(runs)]
+    return {
+        "import": statistics.median(r["import"] for r in results),
+        "ready": statistics.median(r["ready"] for r in results),
+    }
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3, help="runs per measurement")
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=None,
+        help="fail if importing any graph module takes longer (seconds)",
+    )
+    parser.add_argument(
+        "--first-request-budget",
+        type=float,
+        default=None,
+        help="fail if the time to first request is longer (seconds)",
+    )
+    parser.add_argument(
+        "--skip-first-request",
+        action="store_true",
+        help="only measure imports (the first request loads the case index)",
+    )
+    args = parser.parse_args(argv)
+
+    failed = False
+    print(f"{'Module':<24} {'Import (s)':>10}")
+    for module in MODULES:
+        seconds = measure_import(module, args.runs)
+        over = args.budget is not None and seconds > args.budget
+        failed |= over
+        print(f"{module:<24} {seconds:>10.3f}{'  OVER BUDGET' if over else ''}")
+
+    if not args.skip_first_request:
+        result = measure_first_request(args.runs)
+        over = (
+            args.first_request_budget is not None
+            and result["ready"] > args.first_request_budget
+        )
+        failed |= over
+        print("-" * 35)
+        print(f"{'Import all':<24} {result['import']:>10.3f}")
+        print(
+            f"{'Time to first request':<24} {result['ready']:>10.3f}"
+            f"{'  OVER BUDGET' if over else ''}"
+        )
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
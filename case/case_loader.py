@@ -1,4 +1,9 @@
-from langchain_community.document_loaders import JSONLoader
+from typing import Iterator
+
+from langchain_core.document_loaders import BaseLoader
+from langchain_core.documents import Document
+
+from case.case_store import CaseStore
 
 
 def _metadata_func(record: dict, metadata: dict) -> dict:
@@ -11,14 +16,29 @@ def _metadata_func(record: dict, metadata: dict) -> dict:
     return metadata
 
 
-def get_case_doc_loader(file_path):
-    return JSONLoader(
-        file_path=file_path,
-        jq_schema=".",
-        content_key="description",
-        json_lines=True,
-        metadata_func=_metadata_func,
-    )
+class CaseDocLoader(BaseLoader):
+    """
+    Loads the converted cases from the case store, one document per case.
+
+    The content is the description of the case. The metadata matches the former
+    `JSONLoader` output, so the persisted case index does not see every case as changed.
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+
+    def lazy_load(self) -> Iterator[Document]:
+        with CaseStore(self.file_path) as store:
+            for seq_num, record in enumerate(store.iter_cases(by_id=False), 1):
+                metadata = {"source": self.file_path, "seq_num": seq_num}
+                yield Document(
+                    page_content=str(record.get("description", "")),
+                    metadata=_metadata_func(record, metadata),
+                )
+
+
+def get_case_doc_loader(file_path) -> CaseDocLoader:
+    return CaseDocLoader(str(file_path))
 
 
 if __name__ == "__main__":
@@ -1,19 +1,146 @@
+import hashlib
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+import chromadb
+from chromadb.api.models.Collection import Collection
+from pydantic import BaseModel
 from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 
 from case.case_loader import get_case_doc_loader
-from case_code import CASE_CONVERTED_PATH
+from case_code import CASE_CONVERTED_PATH, CASE_INDEX_PATH
 from utils.model_selector import get_embedding, get_chat_model
 
 
-# Load the case documents
-model_name = get_chat_model().name
-loader = get_case_doc_loader(CASE_CONVERTED_PATH.format(model=model_name))
-docs = loader.load()
-# Create the embedding model
-embedding_model = get_embedding()
-# Update the vector database
-db = Chroma.from_documents(documents=docs, embedding=embedding_model)
+# Chroma rejects oversized batches, so documents are added in chunks
+_BATCH_SIZE = 1000
+
+_COLLECTION_NAME = "cases"
+
+
+class IndexSyncStats(BaseModel):
+    """Number of cases whose embeddings were reused, recomputed or removed on startup."""
+
+    reused: int = 0
+    embedded: int = 0
+    deleted: int = 0
+
+    def __str__(self) -> str:
+        return f"reused: {self.reused}, embedded: {self.embedded}, deleted: {self.deleted}"
+
+
+def _content_hash(description: str) -> str:
+    """The id of a case in the index is the hash of its description."""
+    return hashlib.sha256(description.encode()).hexdigest()
+
+
+def _embedding_model(embedding: Embeddings) -> str:
+    return getattr(embedding, "model", None) or type(embedding).__name__
+
+
+def open_index(path: str, embedding: Embeddings) -> Tuple[Chroma, Collection]:
+    """
+    Open the persisted collection of the cases.
+
+    The embedding model is stored in the metadata of the collection. A collection
+    embedded with another model is dropped, its vectors are not comparable.
+
+    Args:
+        path (str): The directory of the persisted collection.
+        embedding (Embeddings): The embedding model.
+
+    Returns:
+        Tuple[Chroma, Collection]: The vector store, and its Chroma collection.
+    """
+    model = _embedding_model(embedding)
+    metadata = {"embedding_model": model}
+    client = chromadb.PersistentClient(path=path)
+    collection = client.get_or_create_collection(
+        _COLLECTION_NAME, metadata=metadata, embedding_function=None
+    )
+    embedded_with = (collection.metadata or {}).get("embedding_model")
+    if embedded_with != model:
+        print(f"Case index embedded with {embedded_with}, rebuilding with {model}")
+        client.delete_collection(_COLLECTION_NAME)
+        collection = client.create_collection(
+            _COLLECTION_NAME, metadata=metadata, embedding_function=None
+        )
+    db = Chroma(
+        collection_name=_COLLECTION_NAME,
+        embedding_function=embedding,
+        client=client,
+        collection_metadata=metadata,
+    )
+    return db, collection
+
+
+def sync_index(
+    db: Chroma, collection: Collection, docs: List[Document]
+) -> IndexSyncStats:
+    """
+    Synchronize the persisted collection with the case documents.
+
+    Only cases with a new or changed description are embedded. Cases whose description
+    is unchanged keep their embedding, and only their metadata is refreshed if needed.
+
+    Args:
+        db (Chroma): The persisted collection.
+        collection (Collection): The Chroma collection of `db`, to update metadata
+            without embedding the documents again.
+        docs (List[Document]): The current case documents.
+
+    Returns:
+        IndexSyncStats: The number of reused, embedded and deleted cases.
+    """
+    current: Dict[str, Document] = {}
+    for doc in docs:
+        # Duplicated descriptions share one embedding
+        current.setdefault(_content_hash(doc.page_content), doc)
+
+    existing = db.get(include=["metadatas"])
+    existing_metadata = dict(zip(existing["ids"], existing["metadatas"]))
+
+    added = [id for id in current if id not in existing_metadata]
+    deleted = [id for id in existing_metadata if id not in current]
+    changed = [
+        id
+        for id in current
+        if id in existing_metadata and existing_metadata[id] != current[id].metadata
+    ]
+
+    if deleted:
+        db.delete(ids=deleted)
+    for i in range(0, len(added), _BATCH_SIZE):
+        ids = added[i : i + _BATCH_SIZE]
+        db.add_documents([current[id] for id in ids], ids=ids)
+    if changed:
+        # Metadata changes do not require a new embedding
+        collection.update(
+            ids=changed, metadatas=[current[id].metadata for id in changed]
+        )
+
+    return IndexSyncStats(
+        reused=len(current) - len(added), embedded=len(added), deleted=len(deleted)
+    )
+
+
+@lru_cache
+def get_index() -> Tuple[Chroma, IndexSyncStats]:
+    """Returns the case index and its sync stats, loaded on first use."""
+    # Load the case documents
+    model_name = get_chat_model().name
+    loader = get_case_doc_loader(CASE_CONVERTED_PATH.format(model=model_name))
+    docs = loader.load()
+    # Open the persisted vector database and embed only the new cases
+    index_path = CASE_INDEX_PATH.format(model=model_name)
+    db, collection = open_index(index_path, get_embedding())
+    stats = sync_index(db, collection, docs)
+    print(f"Case index synced ({stats})")
+    return db, stats
 
 
 def get_retriever():
+    db, _ = get_index()
     return db.as_retriever()
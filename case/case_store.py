@@ -0,0 +1,208 @@
+"""
+Indexed, memory-mapped store of the converted cases.
+
+The cases stay in their JSONL file. A sidecar index (`<file>.idx`) maps each case id to the
+byte offset and length of its line, so a case is read by slicing the memory-mapped file
+instead of loading and parsing the whole file. The index also keeps the source of each
+line, so the lines of a source are found without parsing them. The index records the
+size and modification time of the data file and is rebuilt with a single scan when they
+change.
+
+Classes:
+- CaseStore: Random access, ordered iteration and membership checks of the cases by id.
+
+Functions:
+- write_case_file: Atomically writes a case file together with its index.
+"""
+
+import os
+import re
+import json
+import mmap
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+
+INDEX_SUFFIX = ".idx"
+
+# (id, offset, length) of a line, the id is None for a case without one
+_Entry = Tuple[Optional[str], int, int]
+
+
+# The source is the last key of a case, see `case_code.code_converter.process_document`
+_SOURCE = re.compile(rb'"source": ("(?:[^"\\]|\\.)*")\}\s*$')
+
+
+def _line_source(line: bytes) -> Optional[str]:
+    """Returns the source of a case line, parsed only if it is not the last key."""
+    match = _SOURCE.search(line)
+    if match:
+        return json.loads(match.group(1))
+    try:
+        return json.loads(line).get("source")
+    except ValueError:
+        return None
+
+
+def _sort_key(entry: _Entry) -> tuple:
+    # Cases without an id come last, cases sharing an id keep their file order
+    return (entry[0] is None, entry[0] or "", entry[1])
+
+
+def _write_index(
+    path: str, entries: List[_Entry], sources: List[Optional[str]]
+) -> None:
+    stat = os.stat(path)
+    index = {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "entries": entries,
+        "sources": sources,
+    }
+    tmp_path = f"{path}{INDEX_SUFFIX}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(index, file)
+    os.replace(tmp_path, f"{path}{INDEX_SUFFIX}")
+
+
+def write_case_file(path: str, lines: Iterable[Tuple[Optional[str], bytes]]) -> None:
+    """
+    Atomically replace a case file and write its index.
+
+    Args:
+        path (str): The JSONL file of the cases.
+        lines (Iterable[Tuple[Optional[str], bytes]]): The id and JSON line of each case,
+            the lines ending with a newline.
+    """
+    entries: List[_Entry] = []
+    sources: List[Optional[str]] = []
+    offset = 0
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as file:
+        for id, line in lines:
+            file.write(line)
+            entries.append((id, offset, len(line)))
+            sources.append(_line_source(line))
+            offset += len(line)
+    os.replace(tmp_path, path)
+    _write_index(path, entries, sources)
+
+
+class CaseStore:
+    """
+    Read-only store of the cases of a JSONL file, indexed by id.
+
+    Args:
+        path (str): The JSONL file of the cases.
+
+    Example:
+        >>> with CaseStore(CASE_CONVERTED_PATH.format(model="gpt-4o-mini")) as store:
+        ...     case = store.get("ethena-deposit")
+        ...     ids = store.ids()
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        # An empty file cannot be memory-mapped
+        self._data = (
+            mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        )
+        # Entries and sources in file order, and the positions of the entries by id
+        self._entries, self._sources = self._load_index()
+        self._by_id = sorted(
+            range(len(self._entries)), key=lambda i: _sort_key(self._entries[i])
+        )
+        self._first = {}
+        for i in self._by_id:
+            self._first.setdefault(self._entries[i][0], i)
+
+    def _load_index(self) -> Tuple[List[_Entry], List[Optional[str]]]:
+        stat = os.stat(self.path)
+        try:
+            with open(f"{self.path}{INDEX_SUFFIX}", "r") as file:
+                index = json.load(file)
+            if index["size"] == stat.st_size and index["mtime_ns"] == stat.st_mtime_ns:
+                return [tuple(entry) for entry in index["entries"]], index["sources"]
+        except (OSError, ValueError, KeyError):
+            pass
+        entries, sources = self._scan()
+        _write_index(self.path, entries, sources)
+        return entries, sources
+
+    def _scan(self) -> Tuple[List[_Entry], List[Optional[str]]]:
+        """Build the index entries by reading the data file once."""
+        entries: List[_Entry] = []
+        sources: List[Optional[str]] = []
+        offset = 0
+        data = self._data
+        while offset < len(data):
+            end = data.find(b"\n", offset)
+            end = len(data) if end == -1 else end + 1
+            try:
+                case = json.loads(data[offset:end])
+                entries.append((case.get("id"), offset, end - offset))
+                sources.append(case.get("source"))
+            except ValueError:
+                # A truncated last line is not a case
+                pass
+            offset = end
+        return entries, sources
+
+    def __enter__(self) -> "CaseStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, id: str) -> bool:
+        return id is not None and id in self._first
+
+    def _read(self, entry: _Entry) -> dict:
+        _, offset, length = entry
+        return json.loads(self._data[offset : offset + length])
+
+    def get(self, id: str) -> Optional[dict]:
+        """Returns the first case with the id, or None."""
+        if id not in self:
+            return None
+        return self._read(self._entries[self._first[id]])
+
+    def ids(self) -> List[str]:
+        """Returns the distinct case ids in order."""
+        return [id for id in self._first if id is not None]
+
+    def sources(self) -> List[Optional[str]]:
+        """Returns the source of each case in file order."""
+        return list(self._sources)
+
+    def iter_lines(self, by_id: bool = True) -> Iterator[Tuple[Optional[str], bytes]]:
+        """Yields the id and raw JSON line of the cases, in id order or in file order."""
+        positions = self._by_id if by_id else range(len(self._entries))
+        for i in positions:
+            id, offset, length = self._entries[i]
+            line = self._data[offset : offset + length]
+            yield id, line if line.endswith(b"\n") else line + b"\n"
+
+    def iter_sourced_lines(
+        self,
+    ) -> Iterator[Tuple[Optional[str], Optional[str], bytes]]:
+        """Yields the source, id and raw JSON line of the cases in file order."""
+        for source, (id, line) in zip(self._sources, self.iter_lines(by_id=False)):
+            yield source, id, line
+
+    def iter_cases(self, by_id: bool = True) -> Iterator[dict]:
+        """Yields the cases, in id order or in file order."""
+        for _, line in self.iter_lines(by_id):
+            yield json.loads(line)
+
+    def __iter__(self) -> Iterator[dict]:
+        return self.iter_cases()
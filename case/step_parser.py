@@ -5,9 +5,6 @@ from langchain_core.prompts import ChatPromptTemplate
 from utils.model_selector import get_chat_model
 
 
-model = get_chat_model(temperature=0).model
-
-
 class ParsedOutput(BaseModel):
     """The output of the extraction."""
 
@@ -37,5 +34,6 @@ def parse_description(description: str) -> ParsedOutput:
     prompt_template = ChatPromptTemplate.from_messages(
         [system_prompt, HumanMessage(content=description)]
     )
+    model = get_chat_model(temperature=0).model
     chain = prompt_template | model.with_structured_output(ParsedOutput)
     return chain.invoke({"description": description})
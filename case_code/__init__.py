@@ -9,3 +9,12 @@ CASE_CONVERTED_PATH = "data/conversion/case_{model}.jsonl"
 
 # Statistics of the converted data
 CASE_STATS_PATH = "data/conversion/case_{model}_stats.json"
+
+# Persisted vector index of the converted cases
+CASE_INDEX_PATH = "data/conversion/index_{model}"
+
+# Sources already converted by the model, so an interrupted conversion can resume
+CASE_CHECKPOINT_PATH = "data/conversion/case_{model}_checkpoint.jsonl"
+
+# Manifest of the downloaded case files (path -> blob SHA), kept in the download directory
+CASE_MANIFEST_FILE = "case_manifest.json"
@@ -0,0 +1,312 @@
+"""
+Single-writer sink of the converted cases.
+
+Workers hand their cases to the sink, and one writer task appends them in batches to a
+`.partial` file next to the output, flushing when a batch is large enough or old enough.
+The sources of a batch are checkpointed only after the batch is flushed, so the
+checkpoint never claims cases that are not on disk.
+
+When the sink is closed, the cases of the previous runs and the new cases are written to
+a temporary file that replaces the output, so readers never see a partially written
+file, together with the index of `case.case_store`. The cases of the previous runs are
+found by their source in the index and copied without being parsed.
+
+A `.partial` file left by an interrupted run is merged back on the next start.
+
+Classes:
+- ConversionCheckpoint: Sources already processed by a conversion.
+- CaseSink: Buffered JSONL writer of the converted cases.
+"""
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+from enum import Enum
+from itertools import chain
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from langchain_core.documents import Document
+
+from case.case_store import CaseStore, write_case_file
+
+
+DEFAULT_FLUSH_SIZE = 100
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+
+class ConversionStatus(str, Enum):
+    Converted = "converted"
+    NotFound = "not_found"
+
+
+def _content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def source_of(doc: Document) -> str:
+    """Returns the `case/file` source of a code document."""
+    return f"{doc.metadata['case']}/{doc.metadata['file']}"
+
+
+class ConversionCheckpoint:
+    """
+    Sources already processed by a conversion, appended to a JSONL file as they complete.
+
+    The file stays open between marks and is closed by the sink.
+
+    A source is processed again if it is not in the checkpoint, failed, or its content
+    changed since it was converted.
+
+    Args:
+        path (str): The checkpoint file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # Source -> (status, content hash), the last line of a source wins
+        self.entries: Dict[str, tuple] = {}
+        # Kept open between marks, opened by the first one
+        self._file = None
+        if os.path.exists(path):
+            with open(path, "r") as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # The last line may be truncated by a crash
+                        continue
+                    self.entries[entry["source"]] = (entry["status"], entry["hash"])
+
+    def is_done(self, doc: Document) -> bool:
+        entry = self.entries.get(source_of(doc))
+        return entry is not None and entry[1] == _content_hash(doc.page_content)
+
+    def converted_sources(self) -> Set[str]:
+        return {
+            source
+            for source, (status, _) in self.entries.items()
+            if status == ConversionStatus.Converted
+        }
+
+    def _line(self, source: str, status: str, content_hash: str) -> str:
+        entry = {"source": source, "status": status, "hash": content_hash}
+        return json.dumps(entry) + "\n"
+
+    def mark_many(self, marks: List[Tuple[Document, ConversionStatus]]) -> None:
+        """Checkpoint the sources of documents with a single write to the open file."""
+        if not marks:
+            return
+        lines = []
+        for doc, status in marks:
+            source, content_hash = source_of(doc), _content_hash(doc.page_content)
+            self.entries[source] = (status.value, content_hash)
+            lines.append(self._line(source, status.value, content_hash))
+        if self._file is None:
+            self._file = open(self.path, "a")
+        self._file.writelines(lines)
+        self._file.flush()
+
+    def mark(self, doc: Document, status: ConversionStatus) -> None:
+        self.mark_many([(doc, status)])
+
+    def discard(self, sources: Set[str]) -> None:
+        """Forget sources, e.g. whose content changed, and rewrite the checkpoint."""
+        for source in sources:
+            self.entries.pop(source, None)
+        self.close()
+        with open(self.path, "w") as file:
+            file.writelines(
+                self._line(source, status, content_hash)
+                for source, (status, content_hash) in self.entries.items()
+            )
+
+    def close(self) -> None:
+        """Close the checkpoint file, it is reopened by the next mark."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+# The source, id and JSON line of a case
+_Line = Tuple[Optional[str], Optional[str], bytes]
+
+
+def _read_cases(path: str) -> List[_Line]:
+    """Returns the cases of a JSONL file, skipping a truncated last line."""
+    if not os.path.exists(path):
+        return []
+    cases = []
+    with open(path, "rb") as file:
+        for line in file:
+            try:
+                case = json.loads(line)
+            except ValueError:
+                continue
+            line = line if line.endswith(b"\n") else line + b"\n"
+            cases.append((case.get("source"), case.get("id"), line))
+    return cases
+
+
+# A document, its cases and the status its source is checkpointed with
+_Item = Tuple[Document, List[dict], ConversionStatus]
+
+
+class CaseSink:
+    """
+    Buffered JSONL writer of the converted cases, used as an async context manager.
+
+    Args:
+        output_path (str): The JSONL file of the converted cases.
+        checkpoint (ConversionCheckpoint): The checkpoint of the converted sources.
+        flush_size (int): The number of buffered cases that triggers a flush.
+        flush_interval (float): The maximum time in seconds a case stays buffered.
+    """
+
+    def __init__(
+        self,
+        output_path: str,
+        checkpoint: ConversionCheckpoint,
+        flush_size: int = DEFAULT_FLUSH_SIZE,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+    ):
+        self.output_path = output_path
+        self.partial_path = f"{output_path}.partial"
+        self.checkpoint = checkpoint
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        # Number of cases written by this run
+        self.cases_written = 0
+        # Ids of all the cases in the output, set when the sink is closed
+        self.case_ids: Set[str] = set()
+        self._replaced: Set[str] = set()
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._file = None
+
+    def _rewrite(
+        self, keep: Callable[[Optional[str]], bool], new: List[_Line]
+    ) -> None:
+        """
+        Rewrite the output with its cases of the kept sources, then the new cases.
+
+        The sources of the output come from the index of `case.case_store`, its cases are
+        copied without being parsed. The output is left as it is if no case changes.
+        """
+        if not os.path.exists(self.output_path):
+            write_case_file(self.output_path, [])
+        with CaseStore(self.output_path) as store:
+            if not new and all(keep(source) for source in store.sources()):
+                self.case_ids = set(store.ids())
+                return
+            old = (case for case in store.iter_sourced_lines() if keep(case[0]))
+            ids: Set[Optional[str]] = set()
+
+            def lines() -> Iterator[Tuple[Optional[str], bytes]]:
+                for _, id, line in chain(old, new):
+                    ids.add(id)
+                    yield id, line
+
+            # The index is written with the file, readers do not need to scan it
+            write_case_file(self.output_path, lines())
+        ids.discard(None)
+        self.case_ids = ids
+
+    def _recover(self) -> None:
+        """Merge the cases of an interrupted run and drop the cases not checkpointed."""
+        converted = self.checkpoint.converted_sources()
+        partial = _read_cases(self.partial_path)
+        # The cases of the interrupted run are newer than the output for their sources
+        partial_sources = {source for source, _, _ in partial}
+        self._rewrite(
+            lambda source: source in converted and source not in partial_sources,
+            [case for case in partial if case[0] in converted],
+        )
+        if os.path.exists(self.partial_path):
+            os.remove(self.partial_path)
+
+    async def __aenter__(self) -> "CaseSink":
+        os.makedirs(os.path.dirname(self.output_path) or ".", exist_ok=True)
+        self._recover()
+        self._file = open(self.partial_path, "w")
+        self._queue = asyncio.Queue()
+        self._writer = asyncio.create_task(self._write_loop())
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        # Write what was converted even if the conversion was interrupted
+        await self._queue.put(None)
+        await self._writer
+        self._file.close()
+        self.checkpoint.close()
+        self._finalize()
+
+    def _finalize(self) -> None:
+        new = _read_cases(self.partial_path)
+        dropped = self._replaced | {source for source, _, _ in new}
+        self._rewrite(lambda source: source not in dropped, new)
+        os.remove(self.partial_path)
+
+    async def write(
+        self,
+        doc: Document,
+        cases: List[dict],
+        status: ConversionStatus = ConversionStatus.Converted,
+    ) -> None:
+        """Queue the cases converted from a document, its source is checkpointed once flushed."""
+        self._raise_if_failed()
+        await self._queue.put((doc, cases, status))
+
+    async def drain(self) -> None:
+        """Wait until every queued case is flushed."""
+        flushed = asyncio.get_running_loop().create_future()
+        await self._queue.put(flushed)
+        await asyncio.wait({flushed, self._writer}, return_when=asyncio.FIRST_COMPLETED)
+        self._raise_if_failed()
+
+    def _raise_if_failed(self) -> None:
+        # The writer stops on an error, e.g. a full disk, the cases would be lost
+        if self._writer.done():
+            self._writer.result()
+
+    def replace(self, source: str) -> None:
+        """Drop the cases of a source from the previous runs, e.g. because its content changed."""
+        self._replaced.add(source)
+
+    def _flush(self, batch: List[_Item]) -> None:
+        if not batch:
+            return
+        self._file.writelines(
+            json.dumps(case) + "\n" for _, cases, _ in batch for case in cases
+        )
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.cases_written += sum(len(cases) for _, cases, _ in batch)
+        self.checkpoint.mark_many([(doc, status) for doc, _, status in batch])
+
+    async def _write_loop(self) -> None:
+        batch: List[_Item] = []
+        size = 0
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                item = ()
+            # None closes the sink, a future asks for a flush
+            drain = item is None or isinstance(item, asyncio.Future)
+            if item and not drain:
+                batch.append(item)
+                size += len(item[1])
+                deadline = deadline or time.monotonic() + self.flush_interval
+            if drain or size >= self.flush_size or (
+                deadline is not None and time.monotonic() >= deadline
+            ):
+                self._flush(batch)
+                batch, size, deadline = [], 0, None
+            if isinstance(item, asyncio.Future):
+                item.set_result(None)
+            elif item is None:
+                return
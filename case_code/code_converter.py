@@ -1,82 +1,180 @@
 import os
 import json
 import time
+import random
+import asyncio
 from enum import Enum
-from typing import Dict, Optional
-from tqdm.asyncio import tqdm_asyncio
+from typing import AsyncIterator, Dict, List, Optional, Set
+from tqdm import tqdm
 
+from pydantic import ValidationError
 from langchain_core.documents import Document
 from langchain_core.document_loaders import BaseLoader
+from langchain_core.exceptions import OutputParserException
 from langchain_core.runnables import RunnablePassthrough, Runnable
 from langchain_core.prompts import ChatPromptTemplate
 
+from case.case_store import CaseStore, write_case_file
+from case_code.case_sink import CaseSink, ConversionCheckpoint, ConversionStatus, source_of
 from case_code.code_downloader import get_metadata
+from case_code.code_loader import CASE_MARKER
 from models.case import CaseOutput
 from utils.model_selector import ChatModelProvider, get_chat_model, model_names
 
 
-from case_code import CASE_CONVERTED_PATH, CASE_METADATA_PATH, CASE_STATS_PATH
+from case_code import (
+    CASE_CHECKPOINT_PATH,
+    CASE_CONVERTED_PATH,
+    CASE_METADATA_PATH,
+    CASE_STATS_PATH,
+)
+
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_MAX_RETRIES = 3
+# Base delay of the exponential backoff, in seconds
+RETRY_BACKOFF = 1.0
 
 
 class ConversionMetadata(Enum):
     TotalCases = "Total cases"
     NotFoundError = "Skipped: case not found"
     ParseError = "Skipped: parse error"
+    AlreadyConverted = "Skipped: already converted"
+    ProviderError = "Failed: provider error"
+
+
+async def _ainvoke_with_retry(chain: Runnable, content: str, max_retries: int):
+    """Invoke the chain, retrying provider errors with exponential backoff and jitter."""
+    for attempt in range(max_retries + 1):
+        try:
+            return await chain.ainvoke(content)
+        except (OutputParserException, ValidationError):
+            # The model answered, asking again would most likely fail the same way
+            raise
+        except Exception:
+            if attempt == max_retries:
+                raise
+            delay = RETRY_BACKOFF * 2**attempt
+            await asyncio.sleep(delay + random.uniform(0, delay))
 
 
 async def process_document(
     doc: Document,
     chain: Runnable,
-    output_path: str,
+    sink: CaseSink,
     conversion_metadata: Dict[ConversionMetadata, int],
+    max_retries: int = DEFAULT_MAX_RETRIES,
 ):
-    metadata = doc.metadata
-    meta_str = f"{metadata['case']}/{metadata['file']}"
     # Skip documents that do not match the criteria
-    if "PartialBatchCase" not in doc.page_content:
+    if CASE_MARKER not in doc.page_content:
         conversion_metadata[ConversionMetadata.NotFoundError] += 1
+        await sink.write(doc, [], ConversionStatus.NotFound)
         return
     try:
         # Run the chain on the document
-        result = await chain.ainvoke(doc.page_content)
-        # Add the source metadata to the result
-        rd = result.dict()
-        for case in rd["cases"]:
-            case["source"] = meta_str
-            with open(output_path, "a") as f:
-                f.write(json.dumps(case) + "\n")
-
-            conversion_metadata[ConversionMetadata.TotalCases] += 1
-    except Exception:
+        result = await _ainvoke_with_retry(chain, doc.page_content, max_retries)
+    except (OutputParserException, ValidationError):
         conversion_metadata[ConversionMetadata.ParseError] += 1
+        return
+    except Exception:
+        conversion_metadata[ConversionMetadata.ProviderError] += 1
+        return
 
+    # Add the source metadata to the result
+    cases: List[dict] = result.dict()["cases"]
+    for case in cases:
+        case["source"] = source_of(doc)
+    # The source is checkpointed by the sink once its cases are on disk
+    await sink.write(doc, cases)
 
-async def convert(
-    loader: BaseLoader,
-    model_provider: ChatModelProvider = get_chat_model(),
-    save_stats: bool = True,
+
+async def convert_documents(
+    documents: AsyncIterator[Document],
+    chain: Runnable,
+    sink: CaseSink,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    total: Optional[int] = None,
 ) -> Dict[ConversionMetadata, int]:
     """
-    Asynchronously convert code documents into structured case outputs.
-
-    This function processes documents loaded by the given loader, uses a language model
-    to interpret the code, and saves the structured outputs to a JSONL file.
+    Convert documents with a pool of workers, skipping the documents already checkpointed.
 
     Args:
-        loader (BaseLoader): The document loader to use for fetching code documents.
-        model (BaseChatModel, optional): The chat model to use for code interpretation.
-            Defaults to the model returned by get_chat_model().
+        documents (AsyncIterator[Document]): The code documents.
+        chain (Runnable): The chain converting the code of a document into a `CaseOutput`.
+        sink (CaseSink): The open sink the cases are written to.
+        concurrency (int): The number of documents converted at the same time.
+        max_retries (int): The number of retries of a document on provider errors.
+        total (Optional[int]): The number of documents, for the progress bar.
 
     Returns:
-        Dict[ConversionMetadata, int]: A dictionary containing metadata about the conversion process,
-        including total cases processed, cases not found, and parse errors.
+        Dict[ConversionMetadata, int]: The number of cases and skipped documents.
     """
+    conversion_stats = {metadata: 0 for metadata in ConversionMetadata}
+    checkpoint = sink.checkpoint
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    progress = tqdm(desc="Converting", unit="file", total=total)
+    cases_written = sink.cases_written
+
+    async def worker():
+        while True:
+            doc = await queue.get()
+            try:
+                if doc is None:
+                    return
+                await process_document(
+                    doc, chain, sink, conversion_stats, max_retries
+                )
+                progress.update()
+            finally:
+                queue.task_done()
+
+    async def produce():
+        async for doc in documents:
+            if checkpoint.is_done(doc):
+                conversion_stats[ConversionMetadata.AlreadyConverted] += 1
+                progress.update()
+                continue
+            source = source_of(doc)
+            if source in checkpoint.entries:
+                # The content changed, the cases of the previous content are replaced
+                checkpoint.discard({source})
+                sink.replace(source)
+            await queue.put(doc)
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    tasks = [asyncio.create_task(produce())]
+    tasks += [asyncio.create_task(worker()) for _ in range(concurrency)]
+    try:
+        # A failed worker would leave the producer waiting for room in the queue
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        progress.close()
+    # Queued cases are counted by the sink as they are flushed
+    await sink.drain()
+    conversion_stats[ConversionMetadata.TotalCases] = sink.cases_written - cases_written
+    return conversion_stats
 
-    # Set the output path based on the model name
-    output_path = CASE_CONVERTED_PATH.format(model=model_provider.name)
-    # Ensure the output directory exists
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
+def drop_sources(sources: Set[str], sink: CaseSink) -> None:
+    """Drop the cases converted from sources that no longer declare a case, or were removed."""
+    stale = sources & sink.checkpoint.converted_sources()
+    if not stale:
+        return
+    sink.checkpoint.discard(stale)
+    for source in stale:
+        sink.replace(source)
+
+
+def get_conversion_chain(model_provider: ChatModelProvider) -> Runnable:
+    """Returns the chain converting the code of a document into a `CaseOutput`."""
     prompt = ChatPromptTemplate.from_messages(
         [
             (
@@ -98,45 +196,95 @@ Follow these rules to provide accurate responses.""",
         | prompt
         | model_provider.model.with_structured_output(CaseOutput)
     )
+    return chain
+
 
-    # Check if the file exists, and delete it if it does
-    if os.path.exists(output_path):
-        os.remove(output_path)
+async def convert(
+    loader: BaseLoader,
+    model_provider: Optional[ChatModelProvider] = None,
+    save_stats: bool = True,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    removed_sources: Optional[Set[str]] = None,
+) -> Dict[ConversionMetadata, int]:
+    """
+    Asynchronously convert code documents into structured case outputs.
 
-    conversion_stats: Dict[ConversionMetadata, int] = {}
-    conversion_stats[ConversionMetadata.TotalCases] = 0
-    conversion_stats[ConversionMetadata.NotFoundError] = 0
-    conversion_stats[ConversionMetadata.ParseError] = 0
+    This function processes documents loaded by the given loader, uses a language model
+    to interpret the code, and saves the structured outputs to a JSONL file.
+    The conversion is resumable: sources already converted by a previous run are
+    skipped, only new, changed or failed sources are converted.
 
-    # Get the total number of downloads
-    total = get_metadata()["total_files"]
+    Args:
+        loader (BaseLoader): The document loader to use for fetching code documents.
+        model_provider (ChatModelProvider, optional): The chat model to use for code interpretation.
+            Defaults to the model returned by get_chat_model().
+        save_stats (bool): Whether to save the conversion stats.
+        concurrency (int): The number of documents converted at the same time.
+        max_retries (int): The number of retries of a document on provider errors.
+        removed_sources (Optional[Set[str]]): Sources deleted from the codebase, e.g. by
+            the last sync, whose cases are dropped from the output.
+
+    Returns:
+        Dict[ConversionMetadata, int]: A dictionary containing metadata about the conversion process,
+        including total cases processed, cases not found, and parse errors.
+    """
+
+    model_provider = model_provider or get_chat_model()
+    # Set the output path based on the model name
+    output_path = CASE_CONVERTED_PATH.format(model=model_provider.name)
+
+    chain = get_conversion_chain(model_provider)
+
+    checkpoint = ConversionCheckpoint(
+        CASE_CHECKPOINT_PATH.format(model=model_provider.name)
+    )
+
+    # The sink keeps only the cases of checkpointed sources
+    if removed_sources:
+        checkpoint.discard(removed_sources)
+
+    # Get the total number of downloads, or of the paths the loader is restricted to
+    paths = getattr(loader, "paths", None)
+    total = len(paths) if paths is not None else get_metadata()["total_files"]
 
     print(f"Start converting with {model_provider.name}...")
 
     start_time = int(time.time())
 
-    async for doc in tqdm_asyncio(
-        loader.alazy_load(), desc="Converting", unit="file", total=total
-    ):
-        await process_document(doc, chain, output_path, conversion_stats)
+    async with CaseSink(output_path, checkpoint) as sink:
+        conversion_stats = await convert_documents(
+            loader.alazy_load(),
+            chain,
+            sink,
+            concurrency=concurrency,
+            max_retries=max_retries,
+            total=total,
+        )
+        # Files without a case are skipped by the loader before they reach the workers
+        skipped_sources = getattr(loader, "skipped_sources", set())
+        drop_sources(skipped_sources, sink)
+        conversion_stats[ConversionMetadata.NotFoundError] += len(skipped_sources)
 
     duration = int(time.time()) - start_time
     if save_stats:
-        save_conversion_stats(duration)
+        save_conversion_stats(duration, model_provider.name, sink.case_ids)
 
     return conversion_stats
 
 
-def save_conversion_stats(duration: int):
+def save_conversion_stats(
+    duration: int,
+    model_name: Optional[str] = None,
+    converted_cases: Optional[Set[str]] = None,
+):
     # Initialize model and JSONL file path
-    model = get_chat_model()
-    jsonl_file = CASE_CONVERTED_PATH.format(model=model.name)
+    name = model_name or get_chat_model().name
 
-    # Extract case IDs from the JSONL file
-    with open(jsonl_file, "r") as file:
-        converted_cases = {
-            json.loads(line)["id"] for line in file if "id" in json.loads(line)
-        }
+    # Extract case IDs from the index of the JSONL file, unless the sink already collected them
+    if converted_cases is None:
+        with CaseStore(CASE_CONVERTED_PATH.format(model=name)) as store:
+            converted_cases = set(store.ids())
 
     # Read case_metadata.json
     with open(CASE_METADATA_PATH, "r") as file:
@@ -160,7 +308,7 @@ def save_conversion_stats(duration: int):
         if not convertible:
             stats["failed_cases"] += 1
     # Save the stats to a JSON file
-    with open(CASE_STATS_PATH.format(model=model.name), "w") as file:
+    with open(CASE_STATS_PATH.format(model=name), "w") as file:
         json.dump(stats, file)
 
     return stats
@@ -189,12 +337,14 @@ def get_all_conversion_stats():
 
 
 def sort_converted_cases(model_name: Optional[str] = None):
-    """Sort the converted cases for a given model."""
+    """
+    Sort the converted cases for a given model.
+
+    Readers iterate the cases in id order through the index of the case store, sorting
+    only makes the file easier to read. The lines are copied as they are, without parsing.
+    """
     name = model_name or get_chat_model().name
     file_path = CASE_CONVERTED_PATH.format(model=name)
-    with open(file_path, "r") as file:
-        lines = [json.loads(line) for line in file]
-    sorted_lines = sorted(lines, key=lambda x: x["id"])
-    with open(file_path, "w") as file:
-        for line in sorted_lines:
-            file.write(json.dumps(line) + "\n")
+    with CaseStore(file_path) as store:
+        lines = list(store.iter_lines())
+    write_case_file(file_path, lines)
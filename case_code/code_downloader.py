@@ -1,28 +1,92 @@
 import os
-import requests
 import json
 import base64
 from dotenv import load_dotenv
-from tqdm import tqdm
-from typing import Dict
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from pydantic import BaseModel
+from typing import Callable, Dict, List, Optional, Set
 
-from case_code import RAW_DIR, CASE_METADATA_PATH
+from case_code import RAW_DIR, CASE_METADATA_PATH, CASE_MANIFEST_FILE
+from case_code.download_scheduler import DEFAULT_MAX_WORKERS, DownloadScheduler
+
+
+class TruncatedTreeError(Exception):
+    """The repository tree is too large to be listed in one response."""
+
+
+class SyncReport(BaseModel):
+    """
+    Paths of the case files added, changed, removed or unchanged by a sync, and the
+    error of each path that failed to download.
+    """
+
+    added: List[str] = []
+    changed: List[str] = []
+    removed: List[str] = []
+    unchanged: List[str] = []
+    failed: Dict[str, str] = {}
+
+    @staticmethod
+    def _source(path: str) -> str:
+        # Same `case/file` source as the code loader and the converter
+        components = path.split("/")
+        return f"{components[1]}/{components[-1]}"
+
+    @property
+    def updated_sources(self) -> Set[str]:
+        """Sources of the added and changed files, to be converted again."""
+        return {self._source(path) for path in self.added + self.changed}
+
+    @property
+    def removed_sources(self) -> Set[str]:
+        return {self._source(path) for path in self.removed}
+
+    def __str__(self) -> str:
+        return (
+            f"added: {len(self.added)}, changed: {len(self.changed)}, "
+            f"removed: {len(self.removed)}, unchanged: {len(self.unchanged)}, "
+            f"failed: {len(self.failed)}"
+        )
 
 
 class CodeDownloader:
     """
     Download the source code (`.ts` files) for all Bento cases from the repository.
+
+    Downloads are incremental: a manifest of path → blob SHA is kept next to the files,
+    and only the blobs added or changed since the last sync are downloaded.
+
+    Args:
+        is_dev (bool): Download the `develop` branch instead of `main`.
+        output_dir (str): The directory of the downloaded files.
+        github_api_url (Optional[str]): The GitHub API, `GITHUB_API_URL` or api.github.com by default.
+        meta_api_url (Optional[str]): The case metadata API, the Bento deployment by default.
+        max_workers (int): The maximum number of concurrent downloads.
     """
 
-    def __init__(self, is_dev: bool = True, output_dir: str = RAW_DIR):
+    def __init__(
+        self,
+        is_dev: bool = True,
+        output_dir: str = RAW_DIR,
+        github_api_url: Optional[str] = None,
+        meta_api_url: Optional[str] = None,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+    ):
         load_dotenv()
         self.is_dev: bool = is_dev
         self.access_token: str = os.getenv("GITHUB_ACCESS_TOKEN")
         self.repo: str = "blocto/bento-interface"
         self.branch: str = "develop" if self.is_dev else "main"
-        self.github_api_url: str = "https://api.github.com"
+        self.github_api_url: str = github_api_url or os.getenv(
+            "GITHUB_API_URL", "https://api.github.com"
+        )
+        env = "dev" if self.is_dev else "release"
+        self.meta_api_url: str = (
+            meta_api_url or f"https://bento-batch-{env}.netlify.app/case/api/meta"
+        )
         self.output_dir: str = output_dir
+        self.manifest_path: str = os.path.join(output_dir, CASE_MANIFEST_FILE)
+        # Shared connections and rate-limit state of every request
+        self.scheduler = DownloadScheduler(max_workers=max_workers)
 
     @property
     def headers(self) -> dict[str, str]:
@@ -31,39 +95,134 @@ class CodeDownloader:
             "Authorization": f"Bearer {self.access_token}",
         }
 
-    def _get_case_path(self) -> list[str]:
-        """Get all case paths from the repository."""
+    def _get_case_tree(self) -> Dict[str, str]:
+        """
+        Get the blob SHA of every case file in the repository.
+
+        Raises:
+            TruncatedTreeError: GitHub listed only part of the tree, the files it left
+                out would be deleted as removed.
+        """
         base_url = (
             f"{self.github_api_url}/repos/{self.repo}/git/trees/"
             f"{self.branch}?recursive=1"
         )
-        response = requests.get(base_url, headers=self.headers)
-        response.raise_for_status()
-        all_files = response.json()["tree"]
-        return [
-            file["path"]
+        response = self.scheduler.get(base_url, headers=self.headers)
+        body = response.json()
+        if body.get("truncated"):
+            raise TruncatedTreeError(
+                f"The tree of {self.repo}@{self.branch} is truncated, nothing was synced"
+            )
+        all_files = body["tree"]
+        return {
+            file["path"]: file["sha"]
             for file in all_files
-            if file["path"].startswith("cases/")
+            if file.get("type", "blob") == "blob"
+            and file["path"].startswith("cases/")
             and file["path"].endswith(".ts")
             and len(file["path"].split("/")) > 2
-        ]
+            # Never write outside of the output directory
+            and ".." not in file["path"].split("/")
+        }
+
+    def _local_path(self, path: str) -> str:
+        return os.path.join(self.output_dir, *path.split("/"))
+
+    def _load_manifest(self) -> Dict[str, str]:
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path, "r") as f:
+            return json.load(f)["files"]
+
+    def _save_manifest(self, files: Dict[str, str]) -> None:
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"branch": self.branch, "files": files}, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
 
-    def _download_file(self, file_info: dict, path: str) -> None:
-        """Download a single file from the repository."""
+    def _download_file(self, file_info: dict, path: str) -> bytes:
+        """Write a downloaded file, replacing the previous version atomically."""
         content_encoded = file_info["content"]
         file_content = base64.b64decode(content_encoded)
 
-        with open(os.path.join(self.output_dir, path), "wb") as f:
+        local_path = self._local_path(path)
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        with open(f"{local_path}.tmp", "wb") as f:
             f.write(file_content)
+        os.replace(f"{local_path}.tmp", local_path)
+        return file_content
+
+    def _download_blob(
+        self, path: str, sha: str, on_file: Optional[Callable[[str, bytes], None]] = None
+    ) -> None:
+        """Download a file by its blob SHA, which also works for files over 1 MB."""
+        url = f"{self.github_api_url}/repos/{self.repo}/git/blobs/{sha}"
+        response = self.scheduler.get(url, headers=self.headers)
+        content = self._download_file(response.json(), path)
+        if on_file:
+            on_file(path, content)
+
+    def _remove_file(self, path: str) -> None:
+        local_path = self._local_path(path)
+        if os.path.exists(local_path):
+            os.remove(local_path)
+        # Remove the case directory once its last file is gone
+        directory = os.path.dirname(local_path)
+        if os.path.isdir(directory) and not os.listdir(directory):
+            os.rmdir(directory)
+
+    def sync(self, on_file: Optional[Callable[[str, bytes], None]] = None) -> SyncReport:
+        """
+        Download the case files added or changed since the last sync and delete removed ones.
+
+        Args:
+            on_file (Optional[Callable[[str, bytes], None]]): Called from the download
+                workers with the path and content of each file once it is written.
+
+        Returns:
+            SyncReport: The paths added, changed, removed, unchanged or failed to download.
 
-    def _download_single_case(self, path, base_url):
-        local_dir = os.path.dirname(os.path.join(self.output_dir, path))
-        os.makedirs(local_dir, exist_ok=True)
-        url = f"{base_url}/{path}"
-        response = requests.get(url, headers=self.headers)
-        response.raise_for_status()
-        file_info = response.json()
-        self._download_file(file_info, path)
+        Raises:
+            TruncatedTreeError: The tree is truncated, the local files are left as they are.
+        """
+        tree = self._get_case_tree()
+        manifest = self._load_manifest()
+        report = SyncReport()
+
+        to_download = []
+        for path, sha in tree.items():
+            if path not in manifest:
+                report.added.append(path)
+            elif manifest[path] != sha or not os.path.exists(self._local_path(path)):
+                report.changed.append(path)
+            else:
+                report.unchanged.append(path)
+                continue
+            to_download.append(path)
+        report.removed = [path for path in manifest if path not in tree]
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        # The manifest only records what is on disk, failed files are retried next time
+        files = {path: manifest[path] for path in report.unchanged}
+        report.failed = self.scheduler.run(
+            {
+                path: lambda path=path: self._download_blob(path, tree[path], on_file)
+                for path in to_download
+            },
+            desc=f"Syncing {self.branch} branch files",
+        )
+        for path, error in report.failed.items():
+            print(f"Failed to download {path}: {error}")
+        files.update(
+            {path: tree[path] for path in to_download if path not in report.failed}
+        )
+        report.added = [path for path in report.added if path not in report.failed]
+        report.changed = [path for path in report.changed if path not in report.failed]
+
+        for path in report.removed:
+            self._remove_file(path)
+        self._save_manifest(files)
+        return report
 
     def _download_metadata(self, total_files: int) -> None:
         """Download the metadata file."""
@@ -71,10 +230,8 @@ class CodeDownloader:
         import time
         import csv
 
-        env = "dev" if self.is_dev else "release"
-        url = f"https://bento-batch-{env}.netlify.app/case/api/meta"
-        response = requests.get(url)
-        response.raise_for_status()
+        # Without the GitHub token, which is not for this host
+        response = self.scheduler.get(self.meta_api_url)
         cases = response.json()["cases"]
 
         metadata: Dict = {}
@@ -88,34 +245,29 @@ class CodeDownloader:
         with open(CASE_METADATA_PATH, "w") as f:
             json.dump(metadata, f)
 
-    def download(self) -> None:
-        """Download the source code for all Bento cases from the repository."""
-        case_paths = self._get_case_path()
-        base_url = f"{self.github_api_url}/repos/{self.repo}/contents"
-
-        # Check if output directory exists
-        if not os.path.exists(self.output_dir):
-            os.makedirs(self.output_dir)
-
-        # Use a session for requests
-        with requests.Session() as session:
-            session.headers.update(self.headers)
-            futures = []
-            with ThreadPoolExecutor(max_workers=10) as executor:
-                for path in case_paths:
-                    futures.append(
-                        executor.submit(self._download_single_case, path, base_url)
-                    )
-                for future in tqdm(
-                    as_completed(futures),
-                    total=len(case_paths),
-                    desc=f"Downloading {self.branch} branch files",
-                    unit="file",
-                ):
-                    future.result()
+    def download(
+        self, on_file: Optional[Callable[[str, bytes], None]] = None
+    ) -> SyncReport:
+        """
+        Download the source code for all Bento cases from the repository.
+
+        Only the files added or changed since the last download are fetched.
+
+        Args:
+            on_file (Optional[Callable[[str, bytes], None]]): Called with the path and
+                content of each downloaded file, see `sync`.
+
+        Returns:
+            SyncReport: What changed since the last download.
+        """
+        report = self.sync(on_file)
 
         # Download metadata
-        self._download_metadata(total_files=len(case_paths))
+        self._download_metadata(
+            total_files=len(report.added + report.changed + report.unchanged)
+            + len(report.failed)
+        )
+        return report
 
 
 def get_metadata():
@@ -128,7 +280,8 @@ def get_metadata():
 
 if __name__ == "__main__":
     downloader = CodeDownloader(is_dev=False)
-    downloader.download()
+    report = downloader.download()
+    print(f"{'Synced:':<14} {report}")
 
     metadata = get_metadata()
     print(f"{'Total cases:':<14} {metadata['total_cases']}")
@@ -1,24 +1,59 @@
 import os
 import glob
-from typing import List, Iterator
+import mmap
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, List, Iterator, Optional, Set
 from langchain_core.document_loaders import BaseLoader
 from langchain_core.documents import Document
 
-from case_code import RAW_DIR
+from case_code import RAW_DIR, CASE_METADATA_PATH
+
+
+# Only the files declaring a case are converted
+CASE_MARKER = "PartialBatchCase"
+
+DEFAULT_MAX_WORKERS = 8
+
+
+def has_case_marker(file_path: str) -> bool:
+    """Whether a file contains the case marker, searched in the memory-mapped file."""
+    with open(file_path, "rb") as file:
+        # An empty file cannot be memory-mapped
+        if os.fstat(file.fileno()).st_size == 0:
+            return False
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return data.find(CASE_MARKER.encode()) != -1
 
 
 class CodeLoader(BaseLoader):
     """
     Loads code snippets from the batch case codebase.
+
+    Files without a `PartialBatchCase` are skipped before they are read, their sources
+    are collected in `skipped_sources`.
+
+    Args:
+        paths (Optional[List[str]]): Load only these repository paths, e.g. the files
+            updated by the last sync, instead of every downloaded file.
+        max_workers (int): The number of threads reading files in `alazy_load`.
     """
 
+    def __init__(
+        self, paths: Optional[List[str]] = None, max_workers: int = DEFAULT_MAX_WORKERS
+    ):
+        self.paths = paths
+        self.max_workers = max_workers
+        self.skipped_sources: Set[str] = set()
+
     def _get_cases(self):
         import json
 
-        with open("raw_data/meta.json", "r") as f:
-            cases = json.load(f)
-            # Convert the list of dictionaries into the desired dictionary format
+        with open(CASE_METADATA_PATH, "r") as f:
+            cases = json.load(f)["cases"]
 
+        # Convert the list of dictionaries into the desired dictionary format
         converted_data = {
             case["id"]: {
                 "chain_id": case["chain_id"],
@@ -37,18 +72,55 @@ class CodeLoader(BaseLoader):
         """Load data into Document objects."""
         return list(self.lazy_load())
 
-    def lazy_load(self) -> Iterator[Document]:
+    def _file_paths(self) -> Iterator[str]:
+        if self.paths is not None:
+            for path in self.paths:
+                yield os.path.join(RAW_DIR, *path.split("/"))
+            return
         case_dir_path = os.path.join(RAW_DIR, "cases")
         file_pattern = os.path.join(case_dir_path, "**", "*")
-        for file_path in glob.iglob(file_pattern, recursive=True):
-            if os.path.isfile(file_path):
-                with open(file_path, "r") as file:
-                    content = file.read()
-                    case_name, file_name = self._extract_case_name(file_path)
-                    yield Document(
-                        page_content=content,
-                        metadata={"case": case_name, "file": file_name},
-                    )
+        yield from glob.iglob(file_pattern, recursive=True)
+
+    def _load_file(self, file_path: str) -> Optional[Document]:
+        """Returns the document of a file, or None if it is not a case file."""
+        if not os.path.isfile(file_path):
+            return None
+        case_name, file_name = self._extract_case_name(file_path)
+        if not has_case_marker(file_path):
+            self.skipped_sources.add(f"{case_name}/{file_name}")
+            return None
+        with open(file_path, "r") as file:
+            content = file.read()
+        return Document(
+            page_content=content,
+            metadata={"case": case_name, "file": file_name},
+        )
+
+    def lazy_load(self) -> Iterator[Document]:
+        for file_path in self._file_paths():
+            doc = self._load_file(file_path)
+            if doc is not None:
+                yield doc
+
+    async def alazy_load(self) -> AsyncIterator[Document]:
+        """Load the files in a thread pool, a bounded number ahead of the consumer, in order."""
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            file_paths = await loop.run_in_executor(
+                executor, lambda: list(self._file_paths())
+            )
+            pending: deque = deque()
+            for file_path in file_paths:
+                pending.append(loop.run_in_executor(executor, self._load_file, file_path))
+                if len(pending) < self.max_workers * 2:
+                    continue
+                doc = await pending.popleft()
+                if doc is not None:
+                    yield doc
+            while pending:
+                doc = await pending.popleft()
+                if doc is not None:
+                    yield doc
 
 
 async def async_code_loader():
@@ -0,0 +1,217 @@
+"""
+Download scheduler of the case files.
+
+Every worker sends its requests through one `requests.Session`, whose connection pool is
+sized for the workers, so connections to GitHub are reused instead of reopened per file.
+The number of requests in flight adapts to the rate-limit headers of the responses:
+
+- A rate-limited response (429, or 403 with `Retry-After` or no remaining requests)
+  halves the concurrency and pauses every worker until `Retry-After` or
+  `X-RateLimit-Reset`.
+- A successful response raises the concurrency by one, up to the number of workers and
+  never above `X-RateLimit-Remaining`.
+
+Transient failures (connection errors, timeouts, rate limits and 5xx responses) are
+retried with jittered exponential backoff. A file that still fails is reported with its
+error, the other files are downloaded.
+
+Classes:
+- RateLimitExceeded: The rate limit resets later than the scheduler is willing to wait.
+- DownloadScheduler: Runs downloads on a shared session with adaptive concurrency.
+"""
+
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+from tqdm import tqdm
+
+
+DEFAULT_MAX_WORKERS = 10
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_TIMEOUT = 30.0
+
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class RateLimitExceeded(requests.RequestException):
+    """The rate limit resets later than the scheduler is willing to wait."""
+
+
+def _retry_after(response: requests.Response) -> Optional[float]:
+    """Returns the seconds to wait before the next request, from the rate-limit headers."""
+    retry_after = response.headers.get("Retry-After")
+    if retry_after is not None:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            # An HTTP date instead of seconds
+            try:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                return None
+    if response.headers.get("X-RateLimit-Remaining") == "0":
+        reset = response.headers.get("X-RateLimit-Reset")
+        if reset is not None and reset.isdigit():
+            return max(0.0, int(reset) - time.time())
+    return None
+
+
+def _is_rate_limited(response: requests.Response) -> bool:
+    if response.status_code == 429:
+        return True
+    # GitHub answers the primary and secondary rate limits with a 403
+    return response.status_code == 403 and (
+        "Retry-After" in response.headers
+        or response.headers.get("X-RateLimit-Remaining") == "0"
+    )
+
+
+class DownloadScheduler:
+    """
+    Runs downloads on a shared session, adapting the concurrency to the rate limits.
+
+    Args:
+        max_workers (int): The maximum number of requests in flight.
+        max_retries (int): The number of retries of a request on transient failures.
+        backoff (float): The delay in seconds before the first retry, doubled on each retry.
+        max_backoff (float): The maximum delay in seconds between retries.
+        max_wait (float): The longest rate-limit pause in seconds. A request that would
+            wait longer fails with `RateLimitExceeded`, to be retried on the next run.
+        timeout (float): The timeout in seconds of a request.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        max_wait: float = 300.0,
+        timeout: float = DEFAULT_TIMEOUT,
+    ):
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_wait = max_wait
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        # One pool per host, with a connection per worker
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        # Current concurrency, requests in flight and end of the rate-limit pause
+        self.limit = max_workers
+        self._active = 0
+        self._resume_at = 0.0
+        self._condition = threading.Condition()
+
+    def close(self) -> None:
+        self.session.close()
+
+    def _acquire(self) -> None:
+        with self._condition:
+            while True:
+                wait = self._resume_at - time.monotonic()
+                if wait > self.max_wait:
+                    raise RateLimitExceeded(f"Rate limit resets in {wait:.0f}s")
+                if wait <= 0 and self._active < self.limit:
+                    self._active += 1
+                    return
+                self._condition.wait(timeout=wait if wait > 0 else None)
+
+    def _release(self, response: Optional[requests.Response]) -> None:
+        with self._condition:
+            self._active -= 1
+            if response is not None:
+                self._adapt(response)
+            self._condition.notify_all()
+
+    def _adapt(self, response: requests.Response) -> None:
+        """Update the concurrency and the pause from a response, under the condition lock."""
+        retry_after = _retry_after(response)
+        if retry_after:
+            self._resume_at = max(self._resume_at, time.monotonic() + retry_after)
+        if _is_rate_limited(response):
+            self.limit = max(1, self.limit // 2)
+            return
+        if response.ok:
+            self.limit = min(self.max_workers, self.limit + 1)
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        if remaining is not None and remaining.isdigit():
+            self.limit = max(1, min(self.limit, int(remaining)))
+
+    def _delay(self, attempt: int, response: Optional[requests.Response]) -> float:
+        if response is not None and _retry_after(response) is not None:
+            # The rate-limit pause holds back this worker as well as the others
+            return 0.0
+        delay = min(self.max_backoff, self.backoff * 2**attempt)
+        # Full jitter, so retrying workers do not hit the server in lockstep
+        return random.uniform(0, delay)
+
+    def get(self, url: str, headers: Optional[Dict[str, str]] = None) -> requests.Response:
+        """
+        Send a GET request, retrying transient failures.
+
+        Args:
+            url (str): The URL.
+            headers (Optional[Dict[str, str]]): The request headers.
+
+        Returns:
+            requests.Response: The successful response.
+
+        Raises:
+            requests.RequestException: The request failed or was retried too many times.
+        """
+        for attempt in range(self.max_retries + 1):
+            self._acquire()
+            response = None
+            try:
+                response = self.session.get(url, headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+            finally:
+                self._release(response)
+
+            if response is not None:
+                if response.ok:
+                    return response
+                retryable = response.status_code in _RETRY_STATUS or _is_rate_limited(
+                    response
+                )
+                if not retryable or attempt == self.max_retries:
+                    response.raise_for_status()
+            time.sleep(self._delay(attempt, response))
+
+    def run(self, tasks: Dict[str, Callable[[], None]], desc: str = "") -> Dict[str, str]:
+        """
+        Run downloads on the workers, a failed download does not stop the others.
+
+        Args:
+            tasks (Dict[str, Callable[[], None]]): The download of each path.
+            desc (str): The description of the progress bar.
+
+        Returns:
+            Dict[str, str]: The error of each path that failed.
+        """
+        failures: Dict[str, str] = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(task): path for path, task in tasks.items()}
+            for future in tqdm(
+                as_completed(futures), total=len(futures), desc=desc, unit="file"
+            ):
+                path = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    failures[path] = f"{type(e).__name__}: {e}"
+        return failures
@@ -0,0 +1,152 @@
+"""
+Streaming refresh of the converted cases.
+
+The download and the conversion run at the same time instead of one after the other:
+each file written by the download workers is handed to the conversion workers through
+a bounded queue, so the conversion starts with the first downloaded file and the
+downloads wait when the conversion falls behind. A refresh then takes about as long as
+the slower of the two stages rather than their sum.
+
+Files without a `PartialBatchCase` are not handed to the conversion workers, unchanged
+files that were never converted are converted after the download, and the cases of
+removed files are dropped from the output.
+
+Functions:
+- refresh: Downloads the changed case files and converts them as they arrive.
+"""
+
+import time
+import asyncio
+import threading
+from typing import AsyncIterator, Dict, Optional, Set, Tuple
+
+from langchain_core.documents import Document
+
+from case_code import CASE_CHECKPOINT_PATH, CASE_CONVERTED_PATH
+from case_code.case_sink import CaseSink, ConversionCheckpoint, source_of
+from case_code.code_converter import (
+    DEFAULT_CONCURRENCY,
+    DEFAULT_MAX_RETRIES,
+    ConversionMetadata,
+    convert_documents,
+    drop_sources,
+    get_conversion_chain,
+    save_conversion_stats,
+)
+from case_code.code_downloader import CodeDownloader, SyncReport
+from case_code.code_loader import CASE_MARKER, CodeLoader
+from utils.model_selector import ChatModelProvider, get_chat_model
+
+
+# Downloaded documents waiting for a conversion worker
+DEFAULT_QUEUE_SIZE = 32
+
+
+def _code_document(path: str, content: bytes) -> Document:
+    # Same metadata as the code loader
+    components = path.split("/")
+    return Document(
+        page_content=content.decode("utf-8"),
+        metadata={"case": components[1], "file": components[-1]},
+    )
+
+
+async def refresh(
+    downloader: Optional[CodeDownloader] = None,
+    model_provider: Optional[ChatModelProvider] = None,
+    save_stats: bool = True,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+) -> Tuple[SyncReport, Dict[ConversionMetadata, int]]:
+    """
+    Download the changed case files and convert them while the download runs.
+
+    Args:
+        downloader (Optional[CodeDownloader]): The downloader, of the `develop` branch by default.
+        model_provider (Optional[ChatModelProvider]): The chat model of the conversion.
+            Defaults to the model returned by get_chat_model().
+        save_stats (bool): Whether to save the conversion stats.
+        concurrency (int): The number of documents converted at the same time.
+        max_retries (int): The number of retries of a document on provider errors.
+        queue_size (int): The number of downloaded documents waiting for conversion
+            before the downloads wait.
+
+    Returns:
+        Tuple[SyncReport, Dict[ConversionMetadata, int]]: What the download changed, and
+        the conversion stats.
+    """
+    downloader = downloader or CodeDownloader()
+    model_provider = model_provider or get_chat_model()
+    chain = get_conversion_chain(model_provider)
+    checkpoint = ConversionCheckpoint(
+        CASE_CHECKPOINT_PATH.format(model=model_provider.name)
+    )
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    # Set when the conversion stops, the downloads then stop handing over documents
+    stopped = threading.Event()
+    # Sources of the files without a case
+    skipped_sources: Set[str] = set()
+
+    def on_file(path: str, content: bytes) -> None:
+        # Called from a download worker, which waits while the queue is full
+        if stopped.is_set():
+            return
+        doc = _code_document(path, content)
+        if CASE_MARKER not in doc.page_content:
+            skipped_sources.add(source_of(doc))
+            return
+        asyncio.run_coroutine_threadsafe(queue.put(doc), loop).result()
+
+    async def documents() -> AsyncIterator[Document]:
+        while (doc := await queue.get()) is not None:
+            yield doc
+
+    async def produce(sink: CaseSink) -> SyncReport:
+        try:
+            report = await asyncio.to_thread(downloader.download, on_file)
+            # Files left unconverted by a previous run, the converted ones are skipped
+            loader = CodeLoader(paths=report.unchanged)
+            async for doc in loader.alazy_load():
+                await queue.put(doc)
+            skipped_sources.update(loader.skipped_sources)
+            # The cases of these files are dropped when the sink is closed
+            drop_sources(report.removed_sources | skipped_sources, sink)
+            return report
+        finally:
+            await queue.put(None)
+
+    print(f"Start refreshing with {model_provider.name}...")
+    start_time = int(time.time())
+
+    output_path = CASE_CONVERTED_PATH.format(model=model_provider.name)
+    async with CaseSink(output_path, checkpoint) as sink:
+        download = asyncio.create_task(produce(sink))
+        try:
+            conversion_stats = await convert_documents(
+                documents(), chain, sink, concurrency=concurrency, max_retries=max_retries
+            )
+        finally:
+            stopped.set()
+            # Unblock the download workers waiting for room in the queue
+            while not download.done():
+                while not queue.empty():
+                    queue.get_nowait()
+                await asyncio.wait({download}, timeout=0.1)
+        report = download.result()
+    conversion_stats[ConversionMetadata.NotFoundError] += len(skipped_sources)
+
+    duration = int(time.time()) - start_time
+    if save_stats:
+        save_conversion_stats(duration, model_provider.name, sink.case_ids)
+
+    return report, conversion_stats
+
+
+if __name__ == "__main__":
+    report, conversion_stats = asyncio.run(refresh())
+    print(f"{'Synced:':<14} {report}")
+    for metadata, count in conversion_stats.items():
+        print(f"{metadata.value + ':':<28} {count}")
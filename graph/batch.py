@@ -0,0 +1,231 @@
+"""
+Batch runner of the plan-simulate graph.
+
+Reads intents from a JSONL file, one `{"from_address": ..., "input": ...}` object per line,
+runs them concurrently through the compiled graph and writes one result per line as soon
+as each intent completes. Concurrency is bounded by `--concurrency`, and the calls to the
+LLM provider, Tenderly, Etherscan and the RPC endpoint are limited by the token buckets of
+`utils.rate_limit`. Each result carries the metrics of its run (see `graph.metrics`), and
+the summary reports how many steps the compiler converted without the LLM.
+
+Usage:
+    python -m graph.batch intents.jsonl --output results.jsonl --concurrency 16
+
+Functions:
+- arun_batch: Runs intents through the graph and streams the results to a JSONL file.
+"""
+
+import json
+import time
+import asyncio
+import argparse
+from typing import Any, Iterable, List, Optional
+
+from pydantic import BaseModel
+
+from graph.compiler import CompilerStats, get_compiler_stats
+from graph.metrics import ainvoke_with_metrics
+from graph.workflow import get_app
+from utils.http import aclose
+
+
+DEFAULT_CONCURRENCY = 16
+# Enough supersteps for the replan loop of a long plan
+DEFAULT_RECURSION_LIMIT = 50
+
+
+class BatchSummary(BaseModel):
+    """Throughput, latency and compiler hits of a batch run."""
+
+    total: int
+    succeeded: int
+    failed: int
+    wall_time: float
+    latencies: List[float]
+    # Steps compiled without the LLM (hits) or left to the converter (misses)
+    compiler: CompilerStats = CompilerStats()
+
+    @property
+    def throughput(self) -> float:
+        """Completed intents per hour."""
+        return self.total / self.wall_time * 3600 if self.wall_time else 0.0
+
+    def percentile(self, p: float) -> float:
+        """The latency below which `p` percent of the intents completed (nearest rank)."""
+        if not self.latencies:
+            return 0.0
+        latencies = sorted(self.latencies)
+        rank = max(0, min(len(latencies) - 1, round(p / 100 * len(latencies)) - 1))
+        return latencies[rank]
+
+    def __str__(self) -> str:
+        return (
+            f"Intents: {self.total} ({self.succeeded} succeeded, {self.failed} failed)\n"
+            f"Wall time: {self.wall_time:.1f}s, throughput: {self.throughput:.0f} intents/hour\n"
+            f"Latency p50: {self.percentile(50):.2f}s, p90: {self.percentile(90):.2f}s, "
+            f"p99: {self.percentile(99):.2f}s\n"
+            f"Compiler: {self.compiler}"
+        )
+
+
+def _to_jsonable(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    if isinstance(value, dict):
+        return {k: _to_jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_jsonable(v) for v in value]
+    return value
+
+
+def _format_result(intent: dict, state: dict, latency: float) -> dict:
+    return {
+        "id": intent.get("id"),
+        "input": intent["input"],
+        "from_address": intent["from_address"],
+        # Steps left in the state could not be simulated
+        "succeeded": not state.get("steps") and not state.get("error"),
+        "error": state.get("error"),
+        "simulated_txs": [
+            {"description": step, "tx_params": tx_params, "asset_changes": changes}
+            for step, tx_params, changes in state.get("simulated_txs", [])
+        ],
+        "remaining_steps": state.get("steps", []),
+        "latency": round(latency, 3),
+        "metrics": state.get("metrics"),
+    }
+
+
+def read_intents(path: str) -> Iterable[dict]:
+    """
+    Yields the intents of a JSONL file, skipping blank lines.
+
+    A line that is not a JSON object is yielded as an intent with an `error`, which is
+    reported as a failed result instead of stopping the batch.
+    """
+    with open(path, "r") as file:
+        for number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            try:
+                intent = json.loads(line)
+            except ValueError as e:
+                yield {"error": f"Line {number} is not valid JSON: {e}"}
+                continue
+            if not isinstance(intent, dict):
+                yield {"error": f"Line {number} is not a JSON object"}
+                continue
+            yield intent
+
+
+async def arun_batch(
+    intents: Iterable[dict],
+    output_path: str,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    recursion_limit: int = DEFAULT_RECURSION_LIMIT,
+) -> BatchSummary:
+    """
+    Run intents through the plan-simulate graph concurrently.
+
+    Args:
+        intents (Iterable[dict]): The intents, each with `from_address` and `input`, and an
+            optional `id` copied to the result.
+        output_path (str): The JSONL file the results are written to, in completion order.
+        concurrency (int): The maximum number of intents in flight.
+        recursion_limit (int): The maximum number of graph supersteps per intent.
+
+    Returns:
+        BatchSummary: The throughput, latency and compiler hits of the run.
+    """
+    app = get_app()
+    # The counters are shared by the process, only the steps of this batch are reported
+    compiler_stats = get_compiler_stats().model_copy(deep=True)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    succeeded = 0
+    failed = 0
+
+    with open(output_path, "w") as sink:
+
+        async def run(intent: dict) -> None:
+            nonlocal succeeded, failed
+            start = time.perf_counter()
+            try:
+                if "error" in intent:
+                    # Not an intent, e.g. a malformed line of the input file
+                    raise ValueError(intent["error"])
+                state = await ainvoke_with_metrics(
+                    app,
+                    {"input": intent["input"], "from_address": intent["from_address"]},
+                    config={"recursion_limit": recursion_limit},
+                )
+                result = _format_result(intent, state, time.perf_counter() - start)
+            except Exception as e:
+                result = {
+                    "id": intent.get("id"),
+                    "input": intent.get("input"),
+                    "from_address": intent.get("from_address"),
+                    "succeeded": False,
+                    "error": f"{type(e).__name__}: {e}",
+                    "latency": round(time.perf_counter() - start, 3),
+                }
+            finally:
+                # The slot was acquired when the intent was started
+                semaphore.release()
+            latencies.append(result["latency"])
+            if result["succeeded"]:
+                succeeded += 1
+            else:
+                failed += 1
+            # Writes happen on the event loop thread, so lines are never interleaved
+            sink.write(json.dumps(_to_jsonable(result), default=str) + "\n")
+            sink.flush()
+
+        start = time.perf_counter()
+        tasks: List[asyncio.Task] = []
+        try:
+            for intent in intents:
+                # Intents are read only when a slot is free, so a large file is not
+                # held in memory
+                await semaphore.acquire()
+                tasks.append(asyncio.create_task(run(intent)))
+                tasks = [t for t in tasks if not t.done()]
+        finally:
+            # The intents in flight are written even if reading the next one failed
+            await asyncio.gather(*tasks)
+            await aclose()
+        wall_time = time.perf_counter() - start
+
+    return BatchSummary(
+        total=succeeded + failed,
+        succeeded=succeeded,
+        failed=failed,
+        wall_time=wall_time,
+        latencies=latencies,
+        compiler=get_compiler_stats().since(compiler_stats),
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("intents", help="JSONL file of intents")
+    parser.add_argument("-o", "--output", default="results.jsonl")
+    parser.add_argument("-c", "--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument(
+        "--recursion-limit", type=int, default=DEFAULT_RECURSION_LIMIT
+    )
+    args = parser.parse_args(argv)
+
+    summary = asyncio.run(
+        arun_batch(
+            read_intents(args.intents),
+            args.output,
+            concurrency=args.concurrency,
+            recursion_limit=args.recursion_limit,
+        )
+    )
+    print(summary)
+
+
+if __name__ == "__main__":
+    main()
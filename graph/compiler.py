@@ -0,0 +1,321 @@
+"""
+The intent compiler builds transaction parameters for well-formed step descriptions without the LLM.
+
+It recognizes the imperative form emitted by the planner for the most common actions and
+builds `TransactionParams` with the same tools the converter model would call:
+
+- "Send 0.1 ETH to vitalik.eth"                    → ETH transfer
+- "Transfer 100 USDT to 0x8c57...B360"             → ERC-20 `transfer`
+- "Approve 100 USDT for Uniswap"                   → ERC-20 `approve`
+- "Stake 0.3 ETH to Lido"                          → Lido `submit`
+- "Swap 100 USDT to USDC on Uniswap"               → Uniswap V2 `swapExactTokensForTokens`
+
+Swaps are only compiled when the step names Uniswap, with `amountOutMin` quoted by the
+router's `getAmountsOut` less `SWAP_SLIPPAGE_BPS`.
+
+Any description that does not match, or whose token, recipient or protocol cannot be
+resolved unambiguously, is left to the LLM converter.
+
+Functions:
+- acompile_step: Compiles a step description into transaction parameters, or returns None.
+- get_compiler_stats: Returns the hit and miss counters of the compiler.
+"""
+
+import os
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+from eth_abi import decode, encode
+from pydantic import BaseModel
+from web3 import Web3
+
+from graph.tools import (
+    fetch_contract_abi,
+    encode_function_call,
+    resolve_ens,
+    convert_to_checksum_address,
+    get_token_info,
+    convert_to_smallest_unit,
+    convert_dec_to_hex,
+    get_deadline,
+)
+from graph.tools.registry import get_registry
+from graph.tools.rpc import aeth_call
+from models.tx_params import TransactionParams
+
+
+# ABI of Lido's `submit(address _referral)`, stETH is cached with the ERC-20 ABI
+_LIDO_SUBMIT_ABI = [
+    {
+        "inputs": [{"name": "_referral", "type": "address"}],
+        "name": "submit",
+        "outputs": [{"name": "", "type": "uint256"}],
+        "stateMutability": "payable",
+        "type": "function",
+    }
+]
+
+_ZERO_ADDRESS = "0x0000000000000000000000000000000000000000"
+
+# getAmountsOut(uint256 amountIn, address[] path) of the Uniswap V2 router
+_GET_AMOUNTS_OUT_SELECTOR = bytes.fromhex("d06ca61f")
+
+# Slippage accepted on the quoted output of a swap, in basis points
+SWAP_SLIPPAGE_BPS = int(os.getenv("SWAP_SLIPPAGE_BPS", 50))
+
+_AMOUNT = r"(?P<amount>\d+(?:\.\d+)?)"
+_RECIPIENT = r"(?:the address )?(?P<recipient>0x[0-9a-fA-F]{40}|[\w.-]+\.eth)"
+_TOKEN = r"(?P<token>[A-Za-z][A-Za-z0-9]*)"
+# A protocol name, e.g. "Uniswap", "Uniswap V2" or "Eigenpie"
+_PROTOCOL = r"(?P<spender>[A-Za-z][\w-]*(?: [Vv]\d)?(?: [Rr]outer)?)"
+_END = r"\.?$"
+
+
+class CompileError(Exception):
+    """Error raised when a step matches a rule but cannot be compiled safely."""
+
+
+class CompilerStats(BaseModel):
+    """Hit and miss counters of the compiler."""
+
+    hits: int = 0
+    misses: int = 0
+    hits_by_rule: Dict[str, int] = {}
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def since(self, earlier: "CompilerStats") -> "CompilerStats":
+        """Returns the counts added since an earlier copy of the counters."""
+        return CompilerStats(
+            hits=self.hits - earlier.hits,
+            misses=self.misses - earlier.misses,
+            hits_by_rule={
+                rule: hits - earlier.hits_by_rule.get(rule, 0)
+                for rule, hits in self.hits_by_rule.items()
+                if hits > earlier.hits_by_rule.get(rule, 0)
+            },
+        )
+
+    def __str__(self) -> str:
+        return f"hits: {self.hits}, misses: {self.misses}, hit rate: {self.hit_rate:.1%}"
+
+
+_stats = CompilerStats()
+
+
+def get_compiler_stats() -> CompilerStats:
+    """Returns the hit and miss counters of the compiler since the process started."""
+    return _stats
+
+
+async def _resolve_recipient(recipient: str) -> str:
+    if Web3.is_address(recipient):
+        return await convert_to_checksum_address.ainvoke({"address": recipient})
+    address = await resolve_ens.ainvoke({"name": recipient.lower()})
+    if not address:
+        raise CompileError(f"ENS name not resolved: {recipient}")
+    return address
+
+
+def _registry_address(name: str, kind: Optional[str] = None) -> str:
+    """Resolve a name with an exact registry lookup, a fuzzy match is left to the LLM."""
+    entry = get_registry().exact(name, kind=kind)
+    if entry is None:
+        raise CompileError(f"No unambiguous {kind or 'contract'} named {name}")
+    return Web3.to_checksum_address(entry.address)
+
+
+async def _resolve_token(symbol: str) -> Tuple[str, int]:
+    """Resolve a token symbol to its checksum address and decimals."""
+    address = _registry_address(symbol, kind="token")
+    info = await get_token_info.ainvoke({"token_address": address})
+    # Only accept the token if the symbol matches on-chain
+    if info["symbol"].lower() != symbol.lower():
+        raise CompileError(f"Token symbol mismatch: {symbol} != {info['symbol']}")
+    return address, info["decimals"]
+
+
+async def _encode(abi: list, function_name: str, arguments: list) -> str:
+    return await encode_function_call.ainvoke(
+        {"abi": abi, "function_name": function_name, "arguments": arguments}
+    )
+
+
+async def _erc20_abi(token: str, function_name: str) -> list:
+    return await fetch_contract_abi.ainvoke(
+        {
+            "contract_address": token,
+            "contract_type": "erc20",
+            "function_name": function_name,
+        }
+    )
+
+
+async def _compile_eth_transfer(match: re.Match, from_address: str) -> TransactionParams:
+    amount = await convert_to_smallest_unit.ainvoke(
+        {"amount": match["amount"], "decimals": 18}
+    )
+    return TransactionParams(
+        from_address=from_address,
+        to_address=await _resolve_recipient(match["recipient"]),
+        data="0x",
+        value=await convert_dec_to_hex.ainvoke({"integer": amount}),
+    )
+
+
+async def _compile_token_transfer(
+    match: re.Match, from_address: str
+) -> TransactionParams:
+    token, decimals = await _resolve_token(match["token"])
+    amount = await convert_to_smallest_unit.ainvoke(
+        {"amount": match["amount"], "decimals": decimals}
+    )
+    recipient = await _resolve_recipient(match["recipient"])
+    abi = await _erc20_abi(token, "transfer")
+    return TransactionParams(
+        from_address=from_address,
+        to_address=token,
+        data=await _encode(abi, "transfer", [recipient, amount]),
+    )
+
+
+async def _compile_approve(match: re.Match, from_address: str) -> TransactionParams:
+    token, decimals = await _resolve_token(match["token"])
+    amount = await convert_to_smallest_unit.ainvoke(
+        {"amount": match["amount"], "decimals": decimals}
+    )
+    spender = _registry_address(match["spender"])
+    abi = await _erc20_abi(token, "approve")
+    return TransactionParams(
+        from_address=from_address,
+        to_address=token,
+        data=await _encode(abi, "approve", [spender, amount]),
+    )
+
+
+async def _compile_lido_stake(match: re.Match, from_address: str) -> TransactionParams:
+    amount = await convert_to_smallest_unit.ainvoke(
+        {"amount": match["amount"], "decimals": 18}
+    )
+    return TransactionParams(
+        from_address=from_address,
+        to_address=_registry_address("lido"),
+        data=await _encode(_LIDO_SUBMIT_ABI, "submit", [_ZERO_ADDRESS]),
+        value=await convert_dec_to_hex.ainvoke({"integer": amount}),
+    )
+
+
+async def _quote_amount_out_min(router: str, amount: int, path: List[str]) -> int:
+    """The minimum output of a swap, the router's quote less the accepted slippage."""
+    data = _GET_AMOUNTS_OUT_SELECTOR + encode(["uint256", "address[]"], [amount, path])
+    try:
+        output = await aeth_call(router, "0x" + data.hex())
+        (amounts,) = decode(["uint256[]"], output)
+    except Exception as e:
+        raise CompileError(f"Swap quote failed: {e}")
+    if not amounts or amounts[-1] == 0:
+        raise CompileError("No liquidity for the swap")
+    return amounts[-1] * (10_000 - SWAP_SLIPPAGE_BPS) // 10_000
+
+
+async def _compile_uniswap_swap(
+    match: re.Match, from_address: str
+) -> TransactionParams:
+    if "eth" in (match["token"].lower(), match["token_out"].lower()):
+        # Native ETH swaps use other router functions
+        raise CompileError("ETH swaps are not supported")
+    token_in, decimals = await _resolve_token(match["token"])
+    token_out, _ = await _resolve_token(match["token_out"])
+    amount = await convert_to_smallest_unit.ainvoke(
+        {"amount": match["amount"], "decimals": decimals}
+    )
+    router = _registry_address("uniswap_v2_router")
+    abi = await fetch_contract_abi.ainvoke(
+        {
+            "contract_address": router,
+            "contract_type": "swap",
+            "function_name": "swapExactTokensForTokens",
+        }
+    )
+    path = [token_in, token_out]
+    amount_out_min = await _quote_amount_out_min(router, amount, path)
+    deadline = await get_deadline.ainvoke({})
+    arguments = [amount, amount_out_min, path, from_address, deadline]
+    return TransactionParams(
+        from_address=from_address,
+        to_address=router,
+        data=await _encode(abi, "swapExactTokensForTokens", arguments),
+    )
+
+
+# Rules are tried in order, the first matching rule compiles the step
+_RULES: List[Tuple[str, re.Pattern, Callable]] = [
+    (
+        "eth_transfer",
+        re.compile(rf"^(?:send|transfer) {_AMOUNT} eth to {_RECIPIENT}{_END}", re.I),
+        _compile_eth_transfer,
+    ),
+    (
+        "token_transfer",
+        re.compile(
+            rf"^(?:send|transfer) {_AMOUNT} {_TOKEN} to {_RECIPIENT}{_END}", re.I
+        ),
+        _compile_token_transfer,
+    ),
+    (
+        "approve",
+        re.compile(
+            rf"^approve {_AMOUNT} {_TOKEN} (?:to|for)(?: be used by)? {_PROTOCOL}{_END}",
+            re.I,
+        ),
+        _compile_approve,
+    ),
+    (
+        "lido_stake",
+        re.compile(rf"^stake {_AMOUNT} eth (?:to|with|on|in) lido{_END}", re.I),
+        _compile_lido_stake,
+    ),
+    (
+        "uniswap_swap",
+        re.compile(
+            rf"^swap {_AMOUNT} {_TOKEN} (?:to|for) (?P<token_out>[A-Za-z][A-Za-z0-9]*)"
+            rf" on uniswap(?: v2)?{_END}",
+            re.I,
+        ),
+        _compile_uniswap_swap,
+    ),
+]
+
+
+async def acompile_step(
+    description: str, from_address: str
+) -> Optional[TransactionParams]:
+    """
+    Compile a step description into transaction parameters without the LLM.
+
+    Args:
+        description (str): The step description, e.g. "Transfer 100 USDT to vitalik.eth".
+        from_address (str): The sender address.
+
+    Returns:
+        Optional[TransactionParams]: The transaction parameters, or None if the step is
+        not recognized or cannot be compiled, in which case the LLM should be used.
+    """
+    description = " ".join(description.split())
+    for name, pattern, compile_rule in _RULES:
+        match = pattern.match(description)
+        if not match:
+            continue
+        try:
+            tx_params = await compile_rule(match, from_address)
+        except Exception as e:
+            print(f"Compiler rule '{name}' failed for '{description}': {e}")
+            break
+        _stats.hits += 1
+        _stats.hits_by_rule[name] = _stats.hits_by_rule.get(name, 0) + 1
+        return tx_params
+    _stats.misses += 1
+    return None
@@ -1,22 +1,33 @@
 import os
 from datetime import datetime
+from functools import lru_cache
 from typing import Literal
 
 from langchain_core.messages import HumanMessage, SystemMessage
 from langgraph.graph import StateGraph, MessagesState
+from langgraph.graph.graph import CompiledGraph
 from langgraph.prebuilt import ToolNode
-from langchain_openai import ChatOpenAI
 
 from graph.tools import tools
 from graph.tools.simulation import TransactionParams
+from utils.model_selector import get_openai_model
 
 
 os.environ["LANGCHAIN_TRACING_V2"] = "true"
 os.environ["LANGCHAIN_PROJECT"] = "converter"
 
-model = ChatOpenAI(model="gpt-4o", temperature=0)
-model_with_tools = model.bind_tools(tools)
-model_with_structured_output = model.with_structured_output(TransactionParams)
+
+@lru_cache
+def get_model_with_tools():
+    """Returns the model bound to the tools, created on first use."""
+    return get_openai_model("gpt-4o", temperature=0).bind_tools(tools)
+
+
+@lru_cache
+def get_model_with_structured_output():
+    """Returns the model producing transaction parameters, created on first use."""
+    model = get_openai_model("gpt-4o", temperature=0)
+    return model.with_structured_output(TransactionParams)
 
 
 class AgentInput(MessagesState):
@@ -32,14 +43,14 @@ class AgentState(MessagesState):
 
 
 def call_model(state: AgentState):
-    response = model_with_tools.invoke(state["messages"])
+    response = get_model_with_tools().invoke(state["messages"])
     return {"messages": [response]}
 
 
 def convert(state: AgentState):
     messages = state["messages"]
     # Construct tx params from the arguments of the last tool call
-    tx_params = model_with_structured_output.invoke(messages)
+    tx_params = get_model_with_structured_output().invoke(messages)
     return {"response": tx_params}
 
 
@@ -52,21 +63,24 @@ def should_continue(state: AgentState) -> Literal["convert", "continue"]:
     return "continue"
 
 
-workflow = StateGraph(AgentState)
+@lru_cache
+def get_converter() -> CompiledGraph:
+    """Returns the compiled converter graph, built on first use."""
+    workflow = StateGraph(AgentState)
 
-# Define the two nodes we will cycle between
-workflow.add_node("agent", call_model)
-workflow.add_node("converter", convert)
-workflow.add_node("tools", ToolNode(tools))
+    # Define the two nodes we will cycle between
+    workflow.add_node("agent", call_model)
+    workflow.add_node("converter", convert)
+    workflow.add_node("tools", ToolNode(tools))
 
-workflow.set_entry_point("agent")
-workflow.add_conditional_edges(
-    "agent", should_continue, {"convert": "converter", "continue": "tools"}
-)
-workflow.add_edge("tools", "agent")
-workflow.set_finish_point("converter")
+    workflow.set_entry_point("agent")
+    workflow.add_conditional_edges(
+        "agent", should_continue, {"convert": "converter", "continue": "tools"}
+    )
+    workflow.add_edge("tools", "agent")
+    workflow.set_finish_point("converter")
 
-converter = workflow.compile()
+    return workflow.compile()
 
 
 system_prompt = """
@@ -96,6 +110,6 @@ async def generate_tx_params(description: str, from_address: str) -> Transaction
         system_prompt.format(from_address=from_address, current_time=datetime.now())
     )
     input = {"messages": [system_message, HumanMessage(description)]}
-    result = await converter.ainvoke(input)
+    result = await get_converter().ainvoke(input)
     # print(f"generate_tx_params result: {result}")
     return result["response"]
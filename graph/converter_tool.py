@@ -1,15 +1,20 @@
 import os
 import time
+from functools import lru_cache
 from typing import Literal
 
 from langchain_core.messages import HumanMessage, SystemMessage
-from langchain_openai import ChatOpenAI
 from langgraph.graph import StateGraph, MessagesState
+from langgraph.graph.graph import CompiledGraph
 from langgraph.prebuilt import ToolNode
 
 
+from graph.compiler import acompile_step
+from graph.step_templates import get_step_template_store
 from graph.tools import tools
+from graph.tx_validator import check_tx_params
 from models.tx_params import TransactionParams
+from utils.model_selector import get_openai_model
 
 # Set up tracing
 os.environ["LANGCHAIN_TRACING_V2"] = "true"
@@ -17,8 +22,12 @@ os.environ["LANGCHAIN_PROJECT"] = "converter"
 
 
 tools = tools + [TransactionParams]
-model = ChatOpenAI(model="gpt-4o", temperature=0)
-model_with_tools = model.bind_tools(tools)
+
+
+@lru_cache
+def get_model_with_tools():
+    """Returns the model bound to the tools, created on first use."""
+    return get_openai_model("gpt-4o", temperature=0).bind_tools(tools)
 
 
 class AgentInput(MessagesState):
@@ -34,7 +43,7 @@ class AgentState(MessagesState):
 
 
 def call_model(state: AgentState):
-    response = model_with_tools.invoke(state["messages"])
+    response = get_model_with_tools().invoke(state["messages"])
     return {"messages": [response]}
 
 
@@ -57,21 +66,24 @@ def should_continue(state: AgentState) -> Literal["convert", "continue"]:
     return "continue"
 
 
-workflow = StateGraph(AgentState)
+@lru_cache
+def get_converter() -> CompiledGraph:
+    """Returns the compiled converter graph, built on first use."""
+    workflow = StateGraph(AgentState)
 
-# Define the two nodes we will cycle between
-workflow.add_node("agent", call_model)
-workflow.add_node("converter", convert)
-workflow.add_node("tools", ToolNode(tools))
+    # Define the two nodes we will cycle between
+    workflow.add_node("agent", call_model)
+    workflow.add_node("converter", convert)
+    workflow.add_node("tools", ToolNode(tools))
 
-workflow.set_entry_point("agent")
-workflow.add_conditional_edges(
-    "agent", should_continue, {"convert": "converter", "continue": "tools"}
-)
-workflow.add_edge("tools", "agent")
-workflow.set_finish_point("converter")
+    workflow.set_entry_point("agent")
+    workflow.add_conditional_edges(
+        "agent", should_continue, {"convert": "converter", "continue": "tools"}
+    )
+    workflow.add_edge("tools", "agent")
+    workflow.set_finish_point("converter")
 
-converter = workflow.compile()
+    return workflow.compile()
 
 
 system_prompt = """
@@ -95,10 +107,25 @@ Current time: {current_time}
 
 
 async def generate_tx_params(description: str, from_address: str) -> TransactionParams:
+    # Well-formed steps are compiled directly, without the model round trips
+    tx_params = await acompile_step(description, from_address)
+    if tx_params:
+        return tx_params
+    # Steps similar to an earlier conversion replay its tool calls
+    template_store = get_step_template_store()
+    tx_params = await template_store.areplay(description, from_address)
+    if tx_params:
+        mismatches = check_tx_params(description, tx_params)
+        if not mismatches:
+            return tx_params
+        # The template does not fit this step, e.g. another token with other decimals
+        print(f"Template replay rejected for '{description}': {'; '.join(mismatches)}")
+
     system_message = SystemMessage(
         system_prompt.format(from_address=from_address, current_time=int(time.time()))
     )
     input = {"messages": [system_message, HumanMessage(description)]}
-    result = await converter.ainvoke(input)
+    result = await get_converter().ainvoke(input)
     # print(f"generate_tx_params result: {result}")
+    await template_store.arecord(description, from_address, result["messages"])
     return result["response"]
@@ -0,0 +1,315 @@
+"""
+Per-run metrics of the plan-simulate graph.
+
+A `MetricsCallbackHandler` attached to a run records where the run spent its time and
+tokens: wall time of each node, LLM prompt and completion tokens by node, tool calls by
+tool name and iterations of the converter loop. Simulation payload sizes are recorded
+by the simulation backend through the metrics of the current run, held in a context
+variable so they do not need to be threaded through the tools.
+
+Classes:
+- RunMetrics: The metrics of one run, exportable in Prometheus text format.
+- MetricsCallbackHandler: Callback handler accumulating the metrics of a run.
+
+Functions:
+- ainvoke_with_metrics: Runs the graph and returns the final state with its metrics.
+- record_simulation_payload: Records the size of a simulation request and response.
+"""
+
+import time
+import threading
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from pydantic import BaseModel
+
+
+# Name of the subgraph node running the converter model, one call per loop iteration
+CONVERTER_AGENT_NODE = "agent"
+
+_current_metrics: ContextVar[Optional["RunMetrics"]] = ContextVar(
+    "current_metrics", default=None
+)
+
+
+def _escape(value: Any) -> str:
+    # Label values escape backslashes, double quotes and newlines
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class RunMetrics(BaseModel):
+    """The metrics of one run of the graph."""
+
+    wall_time: float = 0.0
+    node_calls: Dict[str, int] = {}
+    node_wall_time: Dict[str, float] = {}
+    prompt_tokens: Dict[str, int] = {}
+    completion_tokens: Dict[str, int] = {}
+    tool_calls: Dict[str, int] = {}
+    converter_iterations: int = 0
+    simulation_requests: int = 0
+    simulation_request_bytes: int = 0
+    simulation_response_bytes: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(self.prompt_tokens.values()) + sum(self.completion_tokens.values())
+
+    def to_prometheus(
+        self, prefix: str = "tx_generator", labels: Optional[Dict[str, str]] = None
+    ) -> str:
+        """
+        Export the metrics in the Prometheus text exposition format.
+
+        Args:
+            prefix (str): The prefix of the metric names.
+            labels (Optional[Dict[str, str]]): Labels added to every sample, e.g. a run id.
+
+        Returns:
+            str: The metrics, one sample per line.
+        """
+        labels = labels or {}
+
+        def sample(name: str, value: Any, **extra: str) -> str:
+            pairs = {**labels, **extra}
+            if not pairs:
+                return f"{prefix}_{name} {value}"
+            escaped = ",".join(f'{k}="{_escape(v)}"' for k, v in pairs.items())
+            return f"{prefix}_{name}{{{escaped}}} {value}"
+
+        def metric(name: str, help: str, samples: list) -> list:
+            return [
+                f"# HELP {prefix}_{name} {help}",
+                f"# TYPE {prefix}_{name} gauge",
+                *samples,
+            ]
+
+        lines = [
+            *metric(
+                "run_seconds", "Wall time of the run.", [sample("run_seconds", self.wall_time)]
+            ),
+            *metric(
+                "node_seconds",
+                "Wall time spent in each node.",
+                [sample("node_seconds", v, node=k) for k, v in self.node_wall_time.items()],
+            ),
+            *metric(
+                "node_calls",
+                "Number of times each node ran.",
+                [sample("node_calls", v, node=k) for k, v in self.node_calls.items()],
+            ),
+            *metric(
+                "llm_tokens",
+                "LLM tokens used by each node.",
+                [
+                    sample("llm_tokens", v, node=k, type="prompt")
+                    for k, v in self.prompt_tokens.items()
+                ]
+                + [
+                    sample("llm_tokens", v, node=k, type="completion")
+                    for k, v in self.completion_tokens.items()
+                ],
+            ),
+            *metric(
+                "tool_calls",
+                "Number of calls of each tool.",
+                [sample("tool_calls", v, tool=k) for k, v in self.tool_calls.items()],
+            ),
+            *metric(
+                "converter_iterations",
+                "Model calls of the converter loop.",
+                [sample("converter_iterations", self.converter_iterations)],
+            ),
+            *metric(
+                "simulation_requests",
+                "Number of bundle simulation requests.",
+                [sample("simulation_requests", self.simulation_requests)],
+            ),
+            *metric(
+                "simulation_payload_bytes",
+                "Size of the bundle simulation payloads.",
+                [
+                    sample(
+                        "simulation_payload_bytes",
+                        self.simulation_request_bytes,
+                        direction="request",
+                    ),
+                    sample(
+                        "simulation_payload_bytes",
+                        self.simulation_response_bytes,
+                        direction="response",
+                    ),
+                ],
+            ),
+        ]
+        return "\n".join(lines) + "\n"
+
+
+def record_simulation_payload(request_bytes: int, response_bytes: int) -> None:
+    """Record the size of a simulation request and response in the metrics of the current run."""
+    metrics = _current_metrics.get()
+    if metrics is None:
+        return
+    metrics.simulation_requests += 1
+    metrics.simulation_request_bytes += request_bytes
+    metrics.simulation_response_bytes += response_bytes
+
+
+def _token_usage(response: LLMResult) -> tuple:
+    """Returns the prompt and completion tokens of a model response."""
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """
+    Accumulates the metrics of a run of the graph.
+
+    The first run seen is the graph itself, its direct children are the nodes. LLM and
+    tool runs are attributed to the node they are nested in.
+
+    Args:
+        metrics (RunMetrics): The metrics to update.
+    """
+
+    # Called on the event loop, so timings are not delayed by a thread pool
+    run_inline = True
+
+    def __init__(self, metrics: RunMetrics):
+        self.metrics = metrics
+        self._root: Optional[UUID] = None
+        self._root_start = 0.0
+        self._parents: Dict[UUID, Optional[UUID]] = {}
+        self._nodes: Dict[UUID, str] = {}
+        self._starts: Dict[UUID, float] = {}
+        self._lock = threading.Lock()
+
+    def _node_of(self, run_id: Optional[UUID]) -> str:
+        # Walk up to the child of the graph run
+        while run_id is not None and run_id not in self._nodes:
+            run_id = self._parents.get(run_id)
+        return self._nodes.get(run_id, "unknown")
+
+    def _start(self, run_id: UUID, parent_run_id: Optional[UUID]) -> None:
+        self._parents[run_id] = parent_run_id
+
+    def on_chain_start(
+        self,
+        serialized: Optional[Dict[str, Any]],
+        inputs: Any,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> None:
+        with self._lock:
+            self._start(run_id, parent_run_id)
+            if self._root is None and parent_run_id is None:
+                self._root = run_id
+                self._root_start = time.perf_counter()
+            elif parent_run_id == self._root and metadata and "langgraph_node" in metadata:
+                # The entry point of the graph, e.g. `__start__`, is not a node
+                if metadata["langgraph_node"].startswith("__"):
+                    return
+                self._nodes[run_id] = metadata["langgraph_node"]
+                self._starts[run_id] = time.perf_counter()
+
+    def _end_chain(self, run_id: UUID) -> None:
+        with self._lock:
+            if run_id == self._root:
+                self.metrics.wall_time = time.perf_counter() - self._root_start
+            elif run_id in self._starts:
+                node = self._nodes[run_id]
+                elapsed = time.perf_counter() - self._starts.pop(run_id)
+                metrics = self.metrics
+                metrics.node_wall_time[node] = metrics.node_wall_time.get(node, 0.0) + elapsed
+                metrics.node_calls[node] = metrics.node_calls.get(node, 0) + 1
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end_chain(run_id)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end_chain(run_id)
+
+    def on_chat_model_start(
+        self,
+        serialized: Optional[Dict[str, Any]],
+        messages: Any,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> None:
+        with self._lock:
+            self._start(run_id, parent_run_id)
+            if metadata and metadata.get("langgraph_node") == CONVERTER_AGENT_NODE:
+                self.metrics.converter_iterations += 1
+
+    def on_llm_start(
+        self,
+        serialized: Optional[Dict[str, Any]],
+        prompts: Any,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        **kwargs: Any,
+    ) -> None:
+        with self._lock:
+            self._start(run_id, parent_run_id)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        prompt_tokens, completion_tokens = _token_usage(response)
+        with self._lock:
+            node = self._node_of(run_id)
+            metrics = self.metrics
+            metrics.prompt_tokens[node] = metrics.prompt_tokens.get(node, 0) + prompt_tokens
+            metrics.completion_tokens[node] = (
+                metrics.completion_tokens.get(node, 0) + completion_tokens
+            )
+
+    def on_tool_start(
+        self,
+        serialized: Optional[Dict[str, Any]],
+        input_str: str,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        **kwargs: Any,
+    ) -> None:
+        name = kwargs.get("name") or (serialized or {}).get("name", "unknown")
+        with self._lock:
+            self._start(run_id, parent_run_id)
+            self.metrics.tool_calls[name] = self.metrics.tool_calls.get(name, 0) + 1
+
+
+async def ainvoke_with_metrics(app, input: dict, config: Optional[dict] = None) -> dict:
+    """
+    Run the graph and return the final state with the metrics of the run under `metrics`.
+
+    Args:
+        app (CompiledGraph): The compiled graph.
+        input (dict): The input of the graph.
+        config (Optional[dict]): The run config, the metrics handler is added to its callbacks.
+
+    Returns:
+        dict: The final state of the graph and its `metrics`.
+    """
+    metrics = RunMetrics()
+    config = dict(config or {})
+    config["callbacks"] = [*(config.get("callbacks") or []), MetricsCallbackHandler(metrics)]
+    token = _current_metrics.set(metrics)
+    try:
+        state = await app.ainvoke(input, config=config)
+    finally:
+        _current_metrics.reset(token)
+    return {**state, "metrics": metrics}
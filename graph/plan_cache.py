@@ -0,0 +1,379 @@
+"""
+The plan cache reuses planner outputs for intents that only differ by their concrete values.
+
+Intents are normalized before lookup: amounts, addresses and ENS names are replaced by
+placeholders, so "Stake 0.3 ETH with Lido" and "Stake 2 ETH with Lido" share the entry
+"stake <amount_0> eth with lido". Cached steps are stored with the same placeholders and
+the concrete values of the new intent are substituted back on a hit.
+
+A normalized intent matches an entry exactly, or by embedding similarity above a threshold
+when both mention the same tokens, protocols and direction words ("to", "from") in the
+same order.
+
+The cache is best-effort: a failed embedding or write is printed and the planner goes on
+without it. Entries are written one by one to SQLite in a worker thread, off the event loop.
+
+Classes:
+- PlanCache: Bounded LRU cache of plans, persisted to SQLite.
+
+Functions:
+- normalize_intent: Replaces the concrete values of an intent with placeholders.
+- intent_entities: Returns the ordered token and protocol words of a normalized intent.
+- get_plan_cache: Returns the plan cache shared by the process.
+"""
+
+import os
+import re
+import json
+import math
+import time
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from models.case import BatchCase, Transaction
+
+
+# An empty path keeps the cache in memory only
+PLAN_CACHE_PATH = os.getenv("PLAN_CACHE_PATH", "data/plan_cache.sqlite3")
+
+_ADDRESS = re.compile(r"0x[0-9a-fA-F]{40}")
+_ENS = re.compile(r"(?<![\w.-])[\w-]+(?:\.[\w-]+)*\.eth\b", re.IGNORECASE)
+_AMOUNT = re.compile(r"(?<![\w.])\d+(?:\.\d+)?(?![\w])")
+_PLACEHOLDER = re.compile(r"<(amount|address|ens)_(\d+)>")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS plans (
+    intent TEXT PRIMARY KEY,
+    entry TEXT NOT NULL,
+    used_at REAL NOT NULL
+);
+"""
+
+# Words ignored when comparing the entities of two intents. "to" and "from" are kept,
+# they give the placeholders their roles, e.g. the sender and recipient of a transfer.
+_STOPWORDS = {
+    "a", "an", "and", "the", "with", "on", "in", "into", "for", "of",
+    "at", "then", "after", "via", "using", "my", "me", "i", "please", "some",
+}  # fmt: skip
+
+
+def _strip_period(value: str) -> str:
+    # A sentence may end right after an amount or an ENS name
+    return value[:-1] if value.endswith(".") else value
+
+
+def normalize_intent(text: str) -> Tuple[str, Dict[str, str]]:
+    """
+    Replace the amounts, addresses and ENS names of an intent with placeholders.
+
+    Args:
+        text (str): The user's intent.
+
+    Returns:
+        Tuple[str, Dict[str, str]]: The normalized intent and the concrete value of each placeholder.
+
+    Example:
+        >>> normalize_intent("Send 0.2 ETH to Scott.eth")
+        ('send <amount_0> eth to <ens_0>', {'<amount_0>': '0.2', '<ens_0>': 'Scott.eth'})
+    """
+    values: Dict[str, str] = {}
+
+    def replacer(kind: str):
+        def replace(match: re.Match) -> str:
+            placeholder = f"<{kind}_{sum(k.startswith(f'<{kind}_') for k in values)}>"
+            values[placeholder] = _strip_period(match.group(0))
+            return placeholder
+
+        return replace
+
+    text = _ADDRESS.sub(replacer("address"), text)
+    text = _ENS.sub(replacer("ens"), text)
+    text = _AMOUNT.sub(replacer("amount"), text)
+    normalized = " ".join(text.lower().split()).rstrip(".")
+    return normalized, values
+
+
+def intent_entities(normalized: str) -> List[str]:
+    """
+    The ordered words of a normalized intent that are not placeholders or stopwords.
+
+    Example:
+        >>> intent_entities("send <amount_0> eth from <address_0> to <address_1>")
+        ['send', 'eth', 'from', 'to']
+    """
+    words = re.findall(r"<[a-z]+_\d+>|[a-z0-9]+", normalized)
+    return [w for w in words if w not in _STOPWORDS and not _PLACEHOLDER.match(w)]
+
+
+def _same_value(kind: str, a: str, b: str) -> bool:
+    if kind == "amount":
+        try:
+            return Decimal(a) == Decimal(b)
+        except InvalidOperation:
+            return False
+    return a.lower() == b.lower()
+
+
+def _template_step(step: str, values: Dict[str, str]) -> Optional[str]:
+    """
+    Replace the concrete values of a step with the placeholders of the intent.
+
+    Returns None if the step contains a value that does not come from the intent, or a value
+    matching several placeholders, since the plan could not be reused for other values.
+    """
+    failed = False
+
+    def replacer(kind: str):
+        def replace(match: re.Match) -> str:
+            nonlocal failed
+            value = _strip_period(match.group(0))
+            suffix = match.group(0)[len(value) :]
+            placeholders = {
+                p
+                for p, v in values.items()
+                if p.startswith(f"<{kind}_") and _same_value(kind, v, value)
+            }
+            if len(placeholders) != 1:
+                failed = True
+                return match.group(0)
+            return placeholders.pop() + suffix
+
+        return replace
+
+    step = _ADDRESS.sub(replacer("address"), step)
+    step = _ENS.sub(replacer("ens"), step)
+    step = _AMOUNT.sub(replacer("amount"), step)
+    return None if failed else step
+
+
+def _substitute(step: str, values: Dict[str, str]) -> str:
+    return _PLACEHOLDER.sub(lambda m: values.get(m.group(0), m.group(0)), step)
+
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class PlanCacheEntry(BaseModel):
+    id: str
+    steps: List[str]
+    embedding: Optional[List[float]] = None
+
+
+class PlanCacheStats(BaseModel):
+    """Hit and miss counters of the plan cache."""
+
+    exact_hits: int = 0
+    similar_hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    def __str__(self) -> str:
+        return (
+            f"exact hits: {self.exact_hits}, similar hits: {self.similar_hits}, "
+            f"misses: {self.misses}, evictions: {self.evictions}"
+        )
+
+
+class PlanCache:
+    """
+    Bounded LRU cache of plans keyed by the normalized intent.
+
+    Args:
+        path (Optional[str]): The SQLite database the cache is persisted to. None disables
+            persistence.
+        max_size (int): The maximum number of entries, least recently used entries are evicted.
+        similarity_threshold (Optional[float]): The minimum cosine similarity of the embeddings
+            of two normalized intents for a similar match. None disables similar matches.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = PLAN_CACHE_PATH,
+        max_size: int = 1000,
+        similarity_threshold: Optional[float] = 0.95,
+    ):
+        self.path = path
+        self.max_size = max_size
+        self.similarity_threshold = similarity_threshold
+        self.stats = PlanCacheStats()
+        self._entries: "OrderedDict[str, PlanCacheEntry]" = OrderedDict()
+        # The embedding of the last missed intent, reused when its plan is stored
+        self._missed: Optional[Tuple[str, List[float]]] = None
+        self._conn: Optional[sqlite3.Connection] = None
+        # Writes run in worker threads, so the connection is shared behind a lock
+        self._lock = threading.Lock()
+        if path:
+            try:
+                self._open(path)
+            except Exception as e:
+                print(f"Plan cache not loaded from {path}: {e}")
+                self._conn = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _open(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+        rows = self._conn.execute("SELECT intent, entry FROM plans ORDER BY used_at")
+        for key, entry in rows:
+            self._entries[key] = PlanCacheEntry(**json.loads(entry))
+
+    def _write(
+        self, key: str, entry: Optional[PlanCacheEntry], evicted: List[str]
+    ) -> None:
+        """Store or touch the entry of an intent and delete the evicted entries."""
+        with self._lock, self._conn:
+            if entry is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO plans (intent, entry, used_at) "
+                    "VALUES (?, ?, ?)",
+                    (key, entry.model_dump_json(), time.time()),
+                )
+            else:
+                self._conn.execute(
+                    "UPDATE plans SET used_at = ? WHERE intent = ?", (time.time(), key)
+                )
+            self._conn.executemany(
+                "DELETE FROM plans WHERE intent = ?", [(k,) for k in evicted]
+            )
+
+    async def _apersist(
+        self,
+        key: str,
+        entry: Optional[PlanCacheEntry] = None,
+        evicted: Optional[List[str]] = None,
+    ) -> None:
+        if self._conn is None:
+            return
+        try:
+            await asyncio.to_thread(self._write, key, entry, evicted or [])
+        except Exception as e:
+            print(f"Plan cache not persisted for '{key}': {e}")
+
+    async def _aembed(self, normalized: str) -> Optional[List[float]]:
+        if self.similarity_threshold is None:
+            return None
+        if self._missed and self._missed[0] == normalized:
+            return self._missed[1]
+        from utils.model_selector import get_embedding
+
+        try:
+            embedding = await get_embedding().aembed_query(normalized)
+        except Exception as e:
+            print(f"Plan cache embedding failed for '{normalized}': {e}")
+            return None
+        self._missed = (normalized, embedding)
+        return embedding
+
+    async def _afind_similar(self, normalized: str) -> Optional[str]:
+        entities = intent_entities(normalized)
+        placeholders = set(_PLACEHOLDER.findall(normalized))
+        candidates = [
+            key
+            for key, entry in self._entries.items()
+            if entry.embedding
+            and intent_entities(key) == entities
+            and set(_PLACEHOLDER.findall(key)) == placeholders
+        ]
+        if not candidates:
+            return None
+        embedding = await self._aembed(normalized)
+        if embedding is None:
+            return None
+        scored = [(_cosine(embedding, self._entries[k].embedding), k) for k in candidates]
+        score, key = max(scored)
+        return key if score >= self.similarity_threshold else None
+
+    async def aget(self, intent: str) -> Optional[BatchCase]:
+        """
+        Look up the plan of an intent.
+
+        Args:
+            intent (str): The user's intent.
+
+        Returns:
+            Optional[BatchCase]: The cached plan with the values of the intent, or None.
+        """
+        normalized, values = normalize_intent(intent)
+        key = normalized if normalized in self._entries else None
+        if key:
+            self.stats.exact_hits += 1
+        elif self.similarity_threshold is not None:
+            key = await self._afind_similar(normalized)
+            if key:
+                self.stats.similar_hits += 1
+        if not key:
+            self.stats.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        entry = self._entries[key]
+        await self._apersist(key)
+        return BatchCase(
+            id=entry.id,
+            description=intent,
+            steps=[
+                Transaction(description=_substitute(step, values))
+                for step in entry.steps
+            ],
+        )
+
+    async def aput(self, intent: str, plan: BatchCase) -> bool:
+        """
+        Store the plan of an intent.
+
+        Plans containing values that cannot be traced back to the intent are not stored.
+
+        Returns:
+            bool: True if the plan was stored.
+        """
+        normalized, values = normalize_intent(intent)
+        steps = [_template_step(step.description, values) for step in plan.steps]
+        if not steps or any(step is None for step in steps):
+            return False
+
+        # Without an embedding the entry is still found by an exact match
+        entry = PlanCacheEntry(
+            id=plan.id, steps=steps, embedding=await self._aembed(normalized)
+        )
+        self._missed = None
+        self._entries[normalized] = entry
+        self._entries.move_to_end(normalized)
+        evicted = []
+        while len(self._entries) > self.max_size:
+            evicted.append(self._entries.popitem(last=False)[0])
+            self.stats.evictions += 1
+        await self._apersist(normalized, entry, evicted)
+        return True
+
+
+@lru_cache
+def get_plan_cache() -> PlanCache:
+    """Returns the plan cache shared by the process."""
+    return PlanCache()
+
+
+if __name__ == "__main__":
+    assert normalize_intent("Send 0.2 ETH to Scott.eth") == (
+        "send <amount_0> eth to <ens_0>",
+        {"<amount_0>": "0.2", "<ens_0>": "Scott.eth"},
+    )
+    _, values = normalize_intent("Stake 0.3 ETH with Lido and restake on Eigenpie")
+    assert _template_step("Stake 0.3 ETH to Lido.", values) == "Stake <amount_0> ETH to Lido."
+    assert _template_step("Approve 0.299999 stETH to Eigenpie.", values) is None
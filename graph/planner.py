@@ -1,11 +1,13 @@
 import os
+from functools import lru_cache
 
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnablePassthrough
-from langchain_openai import ChatOpenAI
+from langchain_core.runnables import Runnable, RunnablePassthrough
 
 from case.case_retriever import get_retriever
+from graph.plan_cache import get_plan_cache
 from models.case import BatchCase
+from utils.model_selector import get_openai_model
 
 os.environ["LANGCHAIN_TRACING_V2"] = "true"
 os.environ["LANGCHAIN_PROJECT"] = "planner"
@@ -38,16 +40,44 @@ def format_docs(docs) -> str:
     return "\n\n".join(str(doc.metadata) for doc in docs)
 
 
-retriever = get_retriever()
-
 planner_prompt = ChatPromptTemplate.from_messages(
     [("system", system_prompt), ("user", user_prompt)]
 )
 
-planner_model = ChatOpenAI(model="gpt-4o", temperature=0)
 
-planner = (
-    {"context": retriever | format_docs, "description": RunnablePassthrough()}
-    | planner_prompt
-    | planner_model.with_structured_output(BatchCase)
-)
+@lru_cache
+def get_planner() -> Runnable:
+    """Returns the planner chain, built on first use since the retriever loads the case index."""
+    planner_model = get_openai_model("gpt-4o", temperature=0)
+    return (
+        {"context": get_retriever() | format_docs, "description": RunnablePassthrough()}
+        | planner_prompt
+        | planner_model.with_structured_output(BatchCase)
+    )
+
+
+async def aplan(description: str) -> BatchCase:
+    """
+    Plan the steps of a description, reusing the plan of a description that only differs by
+    its amounts, addresses or ENS names.
+
+    Args:
+        description (str): The user's intent.
+
+    Returns:
+        BatchCase: The planned steps.
+    """
+    plan_cache = get_plan_cache()
+    plan = await plan_cache.aget(description)
+    if plan is not None:
+        return plan
+    plan = await get_planner().ainvoke(description)
+    await plan_cache.aput(description, plan)
+    return plan
+
+
+def __getattr__(name: str):
+    # Keep `from graph.planner import planner` working without building it at import
+    if name == "planner":
+        return get_planner()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
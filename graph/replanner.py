@@ -1,15 +1,16 @@
 import os
+from functools import lru_cache
 from typing import List, Union
 from decimal import Decimal
 
 import asyncio
 from pydantic import BaseModel, Field
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnablePassthrough
-from langchain_openai import ChatOpenAI
+from langchain_core.runnables import Runnable, RunnablePassthrough
 
 from graph.state import PlanSimulateState
-from graph.tools.simulation import AssetChange
+from graph.tools.simulation import AssetChange, aannotate_asset_changes
+from utils.model_selector import get_openai_model
 
 
 os.environ["LANGCHAIN_TRACING_V2"] = "true"
@@ -78,8 +79,20 @@ system_prompt = "You are a blockchain expert specializing in EVM transactions."
 prompt = ChatPromptTemplate.from_messages(
     [("system", system_prompt), ("user", user_prompt)]
 )
-model = ChatOpenAI(model="gpt-4o", temperature=0)
-replanner = RunnablePassthrough() | prompt | model.with_structured_output(Plan)
+
+
+@lru_cache
+def get_replanner() -> Runnable:
+    """Returns the replanner chain, built on first use."""
+    model = get_openai_model("gpt-4o", temperature=0)
+    return RunnablePassthrough() | prompt | model.with_structured_output(Plan)
+
+
+def __getattr__(name: str):
+    # Keep `from graph.replanner import replanner` working without building it at import
+    if name == "replanner":
+        return get_replanner()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 async def replan_step(state: PlanSimulateState):
@@ -88,7 +101,7 @@ async def replan_step(state: PlanSimulateState):
     # Build the simulated transactions list
     simulated_txs = await _build_simulated_txs(state["simulated_txs"], from_address)
     # Run the chain and await the response
-    response = await replanner.ainvoke(
+    response = await get_replanner().ainvoke(
         {
             "from_address": from_address,
             "simulated_txs": "\n".join(simulated_txs),
@@ -100,6 +113,10 @@ async def replan_step(state: PlanSimulateState):
 
 async def _build_simulated_txs(simulated_txs_data, from_address):
     simulated_txs = []
+    # Fill in the tokens missing a symbol or decimals with one lookup for all transactions
+    await aannotate_asset_changes(
+        [asset for _, _, asset_changes in simulated_txs_data for asset in asset_changes]
+    )
 
     # Process each simulated transaction
     for index, (desc, _, asset_changes) in enumerate(simulated_txs_data, 1):
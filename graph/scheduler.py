@@ -0,0 +1,76 @@
+"""
+The scheduler decides which plan steps can be converted without waiting for the simulation of earlier steps.
+
+A step depends on earlier outputs when its description has to be refined by the replanner
+with values only known after simulation, e.g. "Approve stETH to Eigenpie" after staking ETH
+to Lido. Independent steps, e.g. "Send 0.1 ETH to A" and "Send 100 USDC to B", can be
+converted concurrently and validated with a single bundle simulation.
+
+Functions:
+- analyze_dependencies: Flags the steps that depend on outputs of earlier steps.
+- count_independent_steps: Counts the leading steps that can be converted concurrently.
+"""
+
+import re
+from typing import List
+
+# Actions that only move an explicit amount and do not produce an unknown output
+_PASSIVE_ACTIONS = {"send", "transfer", "approve"}
+
+# Words referring to an amount that is only known once earlier steps are executed
+_IMPLICIT_AMOUNT = re.compile(
+    r"\b(all|entire|remaining|received|resulting|output|balance|it|them)\b",
+    re.IGNORECASE,
+)
+
+_AMOUNT = re.compile(r"(?<![\w.])\d+(?:\.\d+)?(?![\w.])")
+
+
+def _action(step: str) -> str:
+    words = step.strip().split()
+    return words[0].strip(".,:;").lower() if words else ""
+
+
+def _has_explicit_amount(step: str) -> bool:
+    return bool(_AMOUNT.search(step)) and not _IMPLICIT_AMOUNT.search(step)
+
+
+def analyze_dependencies(steps: List[str]) -> List[bool]:
+    """
+    Flag the steps that depend on the outputs of earlier steps.
+
+    The analysis is conservative: a step is independent only if it states an explicit
+    amount and every earlier step is a plain transfer or approval, whose effects are fully
+    described by its own description.
+
+    Args:
+        steps (List[str]): The step descriptions generated by the planner.
+
+    Returns:
+        List[bool]: For each step, True if it depends on earlier outputs.
+
+    Example:
+        >>> analyze_dependencies(["Send 0.1 ETH to a.eth", "Transfer 100 USDC to b.eth"])
+        [False, False]
+        >>> analyze_dependencies(["Stake 0.3 ETH to Lido", "Approve stETH to Eigenpie"])
+        [False, True]
+    """
+    dependencies = []
+    producer_seen = False
+    for index, step in enumerate(steps):
+        depends = index > 0 and (producer_seen or not _has_explicit_amount(step))
+        dependencies.append(depends)
+        if _action(step) not in _PASSIVE_ACTIONS:
+            producer_seen = True
+    return dependencies
+
+
+def count_independent_steps(steps: List[str]) -> int:
+    """Count the leading steps that do not depend on the outputs of earlier steps."""
+    count = 0
+    for depends in analyze_dependencies(steps):
+        if depends:
+            break
+        count += 1
+    return count
+
@@ -1,6 +1,7 @@
 import operator
 from typing import Annotated, List, Tuple, TypedDict
 from graph.converter_tool import TransactionParams
+from graph.tools.simulation import SimulationSession
 
 
 class PlanSimulateState(TypedDict):
@@ -16,5 +17,7 @@ class PlanSimulateState(TypedDict):
     error: str
     # List of transactions that have been successfully simulated; each tuple contains (description, transaction_params, asset_changes)
     simulated_txs: Annotated[List[Tuple[str, TransactionParams, List]], operator.add]
+    # Simulation pinned to a block, carrying the post-state of the simulated transactions
+    simulation_session: SimulationSession
     # The final response.
     response: str
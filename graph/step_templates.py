@@ -0,0 +1,420 @@
+"""
+Step templates record the tool calls of a successful conversion and replay them for similar steps.
+
+When the converter model produces `TransactionParams` for a step, the tool calls it made
+(e.g. `get_contract_address_by_name`, `fetch_contract_abi`, `encode_function_call`) are
+stored as a template. Arguments are parameterized: a value of the step, such as an amount
+or a recipient, becomes a `$param` reference and a value returned by an earlier call
+becomes an `$output` reference. A later step with the same action and target replays the
+tool calls locally with its own values, without any model round trip.
+
+Templates are keyed by a `ParsedOutput` built from the step without the model: the action
+is the leading verb and the target is the ordered token and protocol words of the step.
+
+The store is best-effort: a failed write is printed and the conversion goes on.
+Templates are written one by one to SQLite in a worker thread, off the event loop.
+
+Classes:
+- StepTemplate: The parameterized tool calls of a conversion.
+- StepTemplateStore: Bounded LRU store of templates, persisted to SQLite.
+
+Functions:
+- parse_step: Builds the template key of a step description.
+- get_step_template_store: Returns the template store shared by the process.
+"""
+
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+from pydantic import BaseModel
+
+from case.step_parser import ParsedOutput
+from graph.plan_cache import intent_entities, normalize_intent
+from graph.tools import tools
+from models.tx_params import TransactionParams
+
+
+# An empty path keeps the templates in memory only
+STEP_TEMPLATES_PATH = os.getenv("STEP_TEMPLATES_PATH", "data/step_templates.sqlite3")
+
+_TOOLS = {t.name: t for t in tools}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS templates (
+    key TEXT PRIMARY KEY,
+    template TEXT NOT NULL,
+    used_at REAL NOT NULL
+);
+"""
+
+# Placeholder of the sender address, which is not part of the step description
+_FROM_ADDRESS = "<from_address>"
+
+# Integers in this range are Unix timestamps of 2017-2128, which must not be replayed
+_TIMESTAMP_RANGE = (1_500_000_000, 5_000_000_000)
+
+
+class TemplateError(Exception):
+    """Error raised when a conversion cannot be recorded or replayed as a template."""
+
+
+class ToolCallTemplate(BaseModel):
+    name: str
+    args: Dict[str, Any]
+
+
+class StepTemplate(BaseModel):
+    """The parameterized tool calls of a conversion and the final transaction parameters."""
+
+    calls: List[ToolCallTemplate]
+    tx_params: Dict[str, Any]
+
+
+class StepTemplateStats(BaseModel):
+    """Replay and record counters of the template store."""
+
+    replays: int = 0
+    replay_failures: int = 0
+    misses: int = 0
+    recorded: int = 0
+    refused: int = 0
+
+    def __str__(self) -> str:
+        return (
+            f"replays: {self.replays}, replay failures: {self.replay_failures}, "
+            f"misses: {self.misses}, recorded: {self.recorded}, refused: {self.refused}"
+        )
+
+
+def parse_step(description: str) -> Tuple[ParsedOutput, Dict[str, str]]:
+    """
+    Build the template key of a step description without the model.
+
+    Args:
+        description (str): The step description, e.g. "Approve 100 USDT for Uniswap".
+
+    Returns:
+        Tuple[ParsedOutput, Dict[str, str]]: The action and target of the step, and the
+        concrete value of each placeholder of the step.
+
+    Example:
+        >>> parse_step("Approve 100 USDT for Uniswap")[0]
+        ParsedOutput(action='approve', interact_with='usdt uniswap')
+    """
+    normalized, values = normalize_intent(description)
+    entities = intent_entities(normalized)
+    action = entities[0] if entities else ""
+    return ParsedOutput(action=action, interact_with=" ".join(entities[1:])), values
+
+
+def _template_key(parsed: ParsedOutput, values: Dict[str, str]) -> str:
+    # Steps with a recipient ENS name and a recipient address need different tool calls
+    kinds = ",".join(sorted(values))
+    return f"{parsed.action}|{parsed.interact_with}|{kinds}"
+
+
+def _parse_tool_output(content: Any) -> Any:
+    # ToolNode serializes non-string outputs to JSON
+    if not isinstance(content, str):
+        return content
+    try:
+        return json.loads(content)
+    except ValueError:
+        return content
+
+
+def _scalars(value: Any) -> List[Any]:
+    if isinstance(value, dict):
+        return [s for v in value.values() for s in _scalars(v)]
+    if isinstance(value, list):
+        return [s for v in value for s in _scalars(v)]
+    return [value]
+
+
+def _matches_param(value: Any, param: str, param_value: str) -> bool:
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        return False
+    if param.startswith("<amount_"):
+        try:
+            return Decimal(str(value)) == Decimal(param_value)
+        except InvalidOperation:
+            return False
+    return isinstance(value, str) and value.lower() == param_value.lower()
+
+
+def _parameterize(value: Any, params: Dict[str, str], outputs: List[Any]) -> Any:
+    """Replace the values of the step and of earlier outputs with references."""
+    if isinstance(value, dict):
+        return {k: _parameterize(v, params, outputs) for k, v in value.items()}
+    # The most recent output wins, e.g. the checksum address over the raw address
+    for i in reversed(range(len(outputs))):
+        if outputs[i] == value and not isinstance(value, bool):
+            return {"$output": i}
+    if isinstance(value, list):
+        return [_parameterize(v, params, outputs) for v in value]
+    matched = [p for p, v in params.items() if _matches_param(value, p, v)]
+    if len(matched) > 1:
+        raise TemplateError(f"Ambiguous value {value!r} matches {matched}")
+    if matched:
+        return {"$param": matched[0], "type": type(value).__name__}
+    if isinstance(value, int) and _TIMESTAMP_RANGE[0] <= value < _TIMESTAMP_RANGE[1]:
+        raise TemplateError(f"Literal timestamp {value} cannot be replayed")
+    return value
+
+
+def _resolve(value: Any, params: Dict[str, str], outputs: List[Any]) -> Any:
+    """Replace the references of a template with the values of the step and outputs."""
+    if isinstance(value, dict):
+        if "$output" in value:
+            return outputs[value["$output"]]
+        if "$param" in value:
+            param = params[value["$param"]]
+            if value["type"] == "int":
+                return int(Decimal(param))
+            if value["type"] == "float":
+                return float(param)
+            return param
+        return {k: _resolve(v, params, outputs) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_resolve(v, params, outputs) for v in value]
+    return value
+
+
+def _references(value: Any) -> List[str]:
+    if isinstance(value, dict):
+        if "$param" in value:
+            return [value["$param"]]
+        return [r for v in value.values() for r in _references(v)]
+    if isinstance(value, list):
+        return [r for v in value for r in _references(v)]
+    return []
+
+
+def record_template(
+    messages: List[BaseMessage], params: Dict[str, str]
+) -> StepTemplate:
+    """
+    Build a template from the messages of a successful conversion.
+
+    Args:
+        messages (List[BaseMessage]): The messages of the converter, ending with the
+            `TransactionParams` tool call.
+        params (Dict[str, str]): The value of each placeholder of the step and the sender.
+
+    Returns:
+        StepTemplate: The parameterized tool calls.
+
+    Raises:
+        TemplateError: If a value cannot be traced back to the step or an earlier call,
+        or a value of the step is not used by any call.
+    """
+    tool_outputs = {
+        m.tool_call_id: m
+        for m in messages
+        if isinstance(m, ToolMessage) and getattr(m, "status", "success") != "error"
+    }
+
+    calls: List[ToolCallTemplate] = []
+    outputs: List[Any] = []
+    for message in messages[:-1]:
+        if not isinstance(message, AIMessage):
+            continue
+        for tool_call in message.tool_calls:
+            output = tool_outputs.get(tool_call["id"])
+            # Failed calls were retried by the model with other arguments
+            if output is None or tool_call["name"] not in _TOOLS:
+                continue
+            args = _parameterize(tool_call["args"], params, outputs)
+            calls.append(ToolCallTemplate(name=tool_call["name"], args=args))
+            outputs.append(_parse_tool_output(output.content))
+
+    tx_params = _parameterize(messages[-1].tool_calls[0]["args"], params, outputs)
+    template = StepTemplate(calls=calls, tx_params=tx_params)
+
+    references = set(_references([c.args for c in calls] + [tx_params]))
+    unused = set(params) - references - {_FROM_ADDRESS}
+    if unused:
+        raise TemplateError(f"Values of the step not used by the tool calls: {unused}")
+    # An amount of the step that also appears in an output, e.g. an amount of 18 and the
+    # decimals of a token, could be replayed in the wrong place
+    output_scalars = [s for output in outputs for s in _scalars(output)]
+    for param in references:
+        if param.startswith("<amount_") and any(
+            _matches_param(s, param, params[param]) for s in output_scalars
+        ):
+            raise TemplateError(f"Amount {params[param]} also appears in a tool output")
+    return template
+
+
+async def areplay_template(
+    template: StepTemplate, params: Dict[str, str]
+) -> TransactionParams:
+    """
+    Replay the tool calls of a template with the values of a new step.
+
+    Raises:
+        TemplateError: If a tool call fails or the transaction parameters are invalid.
+    """
+    outputs: List[Any] = []
+    for call in template.calls:
+        args = _resolve(call.args, params, outputs)
+        try:
+            outputs.append(await _TOOLS[call.name].ainvoke(args))
+        except Exception as e:
+            raise TemplateError(f"Tool call {call.name} failed: {e}") from e
+    try:
+        return TransactionParams(**_resolve(template.tx_params, params, outputs))
+    except Exception as e:
+        raise TemplateError(f"Invalid transaction parameters: {e}") from e
+
+
+class StepTemplateStore:
+    """
+    Bounded LRU store of step templates keyed by action and target.
+
+    Args:
+        path (Optional[str]): The SQLite database the store is persisted to. None disables
+            persistence.
+        max_size (int): The maximum number of templates, least recently used ones are evicted.
+    """
+
+    def __init__(self, path: Optional[str] = STEP_TEMPLATES_PATH, max_size: int = 1000):
+        self.path = path
+        self.max_size = max_size
+        self.stats = StepTemplateStats()
+        self._templates: "OrderedDict[str, StepTemplate]" = OrderedDict()
+        self._conn: Optional[sqlite3.Connection] = None
+        # Writes run in worker threads, so the connection is shared behind a lock
+        self._lock = threading.Lock()
+        if path:
+            try:
+                self._open(path)
+            except Exception as e:
+                print(f"Step templates not loaded from {path}: {e}")
+                self._templates.clear()
+                self._conn = None
+
+    def __len__(self) -> int:
+        return len(self._templates)
+
+    def _open(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+        rows = self._conn.execute(
+            "SELECT key, template FROM templates ORDER BY used_at"
+        )
+        for key, template in rows:
+            self._templates[key] = StepTemplate(**json.loads(template))
+
+    def _write(
+        self, key: str, template: Optional[StepTemplate], evicted: List[str]
+    ) -> None:
+        """Store or touch the template of a key and delete the evicted templates."""
+        with self._lock, self._conn:
+            if template is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO templates (key, template, used_at) "
+                    "VALUES (?, ?, ?)",
+                    (key, template.model_dump_json(), time.time()),
+                )
+            else:
+                self._conn.execute(
+                    "UPDATE templates SET used_at = ? WHERE key = ?", (time.time(), key)
+                )
+            self._conn.executemany(
+                "DELETE FROM templates WHERE key = ?", [(k,) for k in evicted]
+            )
+
+    async def _apersist(
+        self,
+        key: str,
+        template: Optional[StepTemplate] = None,
+        evicted: Optional[List[str]] = None,
+    ) -> None:
+        if self._conn is None:
+            return
+        try:
+            await asyncio.to_thread(self._write, key, template, evicted or [])
+        except Exception as e:
+            print(f"Step template not persisted for '{key}': {e}")
+
+    async def areplay(
+        self, description: str, from_address: str
+    ) -> Optional[TransactionParams]:
+        """
+        Convert a step by replaying the template of a similar step.
+
+        Args:
+            description (str): The step description.
+            from_address (str): The sender address.
+
+        Returns:
+            Optional[TransactionParams]: The transaction parameters, or None if there is no
+            template for the step or the replay failed, in which case the model should be used.
+        """
+        parsed, params = parse_step(description)
+        key = _template_key(parsed, params)
+        template = self._templates.get(key)
+        if template is None:
+            self.stats.misses += 1
+            return None
+
+        try:
+            tx_params = await areplay_template(
+                template, {**params, _FROM_ADDRESS: from_address}
+            )
+        except TemplateError as e:
+            print(f"Template replay failed for '{description}': {e}")
+            self.stats.replay_failures += 1
+            return None
+        self._templates.move_to_end(key)
+        await self._apersist(key)
+        self.stats.replays += 1
+        return tx_params
+
+    async def arecord(
+        self, description: str, from_address: str, messages: List[BaseMessage]
+    ) -> bool:
+        """
+        Record the tool calls of a successful conversion as the template of the step.
+
+        Returns:
+            bool: True if the template was recorded.
+        """
+        parsed, params = parse_step(description)
+        try:
+            template = record_template(messages, {**params, _FROM_ADDRESS: from_address})
+        except (TemplateError, KeyError, IndexError) as e:
+            print(f"Template not recorded for '{description}': {e}")
+            self.stats.refused += 1
+            return False
+
+        key = _template_key(parsed, params)
+        self._templates[key] = template
+        self._templates.move_to_end(key)
+        evicted = []
+        while len(self._templates) > self.max_size:
+            evicted.append(self._templates.popitem(last=False)[0])
+        await self._apersist(key, template, evicted)
+        self.stats.recorded += 1
+        return True
+
+
+@lru_cache
+def get_step_template_store() -> StepTemplateStore:
+    """Returns the template store shared by the process."""
+    return StepTemplateStore()
@@ -1,8 +1,15 @@
 import os
+from functools import lru_cache
 from web3 import Web3
 
 INFURA_API_KEY = os.getenv("INFURA_API_KEY")
-w3 = Web3(Web3.HTTPProvider(f"https://mainnet.infura.io/v3/{INFURA_API_KEY}"))
+RPC_URL = f"https://mainnet.infura.io/v3/{INFURA_API_KEY}"
+
+
+@lru_cache
+def get_w3() -> Web3:
+    """Returns the Web3 instance shared by all tools, created on first use."""
+    return Web3(Web3.HTTPProvider(RPC_URL))
 
 
 from graph.tools.abi import fetch_contract_abi, encode_function_call
@@ -1,13 +1,21 @@
 import os
-import requests
 import json
 
-from functools import lru_cache
-from typing import Optional, List
+import threading
+from collections import OrderedDict
+from typing import Optional, List, Tuple
+from eth_abi import encode
+from eth_abi.exceptions import EncodingError
 from langchain_core.tools import tool
+from web3 import Web3
 
-from graph.tools import w3
+from graph.tools import get_w3
 from graph.tools.address import convert_to_checksum_address
+from graph.tools.abi_store import get_abi_store
+from graph.tools.selector_index import FunctionSignature, get_selector_index
+from utils.abi_hash import hash_abi
+from utils.http import request, arequest
+from utils.steps import Io, Steps, arun, run
 
 etherscan_api_key = os.getenv("ETHERSCAN_API_KEY")
 etherscan_base_url = "https://api.etherscan.io/api"
@@ -44,8 +52,52 @@ def _load_abi_files():
     _ABI_CACHE["0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48"] = _ABI_CACHE["erc20"]
 
 
-# Load the ABIs once when the module is loaded
-_load_abi_files()
+class _FunctionEncoder:
+    """The selector and argument types of a function, to encode calls with eth_abi directly."""
+
+    def __init__(self, signature: FunctionSignature):
+        self.types = signature.types
+        self.selector = bytes.fromhex(signature.selector[2:])
+
+    def encode(self, arguments: list) -> str:
+        return "0x" + (self.selector + encode(self.types, arguments)).hex()
+
+
+# Encoders by ABI fragment hash and function name, None when web3 has to pick an overload
+_ENCODERS: "OrderedDict[Tuple[str, str], Optional[_FunctionEncoder]]" = OrderedDict()
+# Least recently used encoders are dropped, ABIs of arbitrary contracts come and go
+_MAX_ENCODERS = 1024
+# Tools run in worker threads
+_ENCODERS_LOCK = threading.Lock()
+
+
+def _get_encoder(abi: list, function_name: str) -> Optional[_FunctionEncoder]:
+    """Returns the compiled encoder of a function, built on first use."""
+    fragment = [
+        entry
+        for entry in abi
+        if entry.get("type") == "function" and entry.get("name") == function_name
+    ]
+    key = (hash_abi(fragment), function_name)
+    with _ENCODERS_LOCK:
+        if key in _ENCODERS:
+            _ENCODERS.move_to_end(key)
+            return _ENCODERS[key]
+    signatures = [FunctionSignature.from_abi(entry) for entry in fragment]
+    # Seen once, so calldata of the function can be decoded later
+    for signature in signatures:
+        get_selector_index().add(signature)
+    encoder = _FunctionEncoder(signatures[0]) if len(signatures) == 1 else None
+    with _ENCODERS_LOCK:
+        _ENCODERS[key] = encoder
+        while len(_ENCODERS) > _MAX_ENCODERS:
+            _ENCODERS.popitem(last=False)
+    return encoder
+
+
+def _encode_with_web3(abi: list, function_name: str, arguments: list) -> str:
+    contract = get_w3().eth.contract(abi=abi)
+    return contract.encode_abi(function_name, arguments)
 
 
 @tool
@@ -67,12 +119,19 @@ def encode_function_call(abi: list, function_name: str, arguments: list) -> str:
     Example:
         data = encode_function_call(abi, 'approve', ['0xUniswapContractAddress', 400])
     """
-    contract = w3.eth.contract(abi=abi)
     # Convert any addresses in the arguments to checksum format
     for i, arg in enumerate(arguments):
-        if w3.is_address(arg):
-            arguments[i] = convert_to_checksum_address.invoke(arg)
-    return contract.encode_abi(function_name, arguments)
+        if Web3.is_address(arg):
+            arguments[i] = Web3.to_checksum_address(arg)
+
+    encoder = _get_encoder(abi, function_name)
+    if encoder is not None:
+        try:
+            return encoder.encode(arguments)
+        except EncodingError:
+            # e.g. bytes given as a hex string, which web3 normalizes before encoding
+            pass
+    return _encode_with_web3(abi, function_name, arguments)
 
 
 @tool
@@ -84,7 +143,7 @@ def fetch_contract_abi(
 ) -> str:
     """
     Fetch the ABI (Application Binary Interface) for a given Ethereum contract address
-    either from local cache or from the Etherscan API if not found locally.
+    either from local cache, the persistent ABI store or from the Etherscan API if not found locally.
 
     Args:
         contract_address (str): The Ethereum address of the smart contract.
@@ -95,22 +154,12 @@ def fetch_contract_abi(
     Returns:
         str: A JSON string representing the ABI of the contract.
     """
-    # First try to fetch the ABI from local cache
-    cached_abi = _fetch_cached_abi(
-        contract_address=contract_address,
-        contract_name=contract_name,
-        contract_type=contract_type,
-        function_name=function_name,
+    return run(
+        _fetch_contract_abi(contract_address, contract_name, contract_type, function_name)
     )
-    if cached_abi:
-        return cached_abi
 
-    # If no local ABI is available, fetch the ABI from the Etherscan API
-    return _fetch_abi_from_remote(contract_address, function_name)
 
-
-# Optimized function
-@lru_cache
+# Not memoized: the aliases of the ABI store can be added while running
 def _fetch_cached_abi(
     contract_address: str,
     contract_name: Optional[str] = None,
@@ -119,6 +168,7 @@ def _fetch_cached_abi(
 ) -> Optional[str]:
     """
     Fetches cached ABI for a specific contract address, name, or type.
+    Names and types are also looked up in the aliases of the persistent ABI store.
 
     Args:
         contract_address (str): The contract address.
@@ -130,6 +180,9 @@ def _fetch_cached_abi(
         Optional[str]: The ABI or specific function ABI if found, otherwise None.
     """
 
+    # Load the ABI files on first use
+    _load_abi_files()
+
     # Convert the contract address to checksum format
     checksum_address = convert_to_checksum_address.invoke(contract_address)
     # Normalize the contract name and type
@@ -142,14 +195,20 @@ def _fetch_cached_abi(
         normalized_contract_type,  # Normalized contract type
     ]
 
-    # Look up ABI in cache
+    # Look up ABI in cache, then the names seeded into the ABI store (e.g. 'erc20')
     for key in cache_keys:
         if key and key in _ABI_CACHE:
             abi = _ABI_CACHE[key]
             break
     else:
-        # No cached ABI found
-        return None
+        store = get_abi_store()
+        for key in (normalized_contract_name, normalized_contract_type):
+            abi = store.get_alias(key) if key else None
+            if abi is not None:
+                break
+        else:
+            # No cached ABI found
+            return None
 
     # If a specific function name is provided, extract the function's ABI
     if function_name:
@@ -178,35 +237,78 @@ def _extract_function_abi(abi: list, function_name: str) -> Optional[List]:
     return None
 
 
-@lru_cache
-def _get_abi_from_etherscan(address: str) -> dict:
-    # print(f"Fetching ABI from Etherscan for address: {address}")
-    api_url = f"{etherscan_base_url}?module=contract&action=getabi&address={address}&apikey={etherscan_api_key}"
-    response = requests.get(api_url)
-    data = response.json()
+def _etherscan_params(action: str, address: str) -> dict:
+    return {
+        "module": "contract",
+        "action": action,
+        "address": address,
+        "apikey": etherscan_api_key,
+    }
+
+
+def _etherscan_request(action: str, address: str) -> Io:
+    params = _etherscan_params(action, address)
+    return Io(request, arequest, "GET", etherscan_base_url, params=params)
+
+
+def _parse_abi_response(data: dict) -> list:
     if data["status"] == "1":
         return json.loads(data["result"])
     else:
         raise ValueError(f"ABI not found: {data['result']}")
 
 
-@lru_cache
-def _get_implementation_from_etherscan(address: str) -> Optional[str]:
-    """Get the implementation address from the proxy contract address. Returns empty string if not found."""
-    url = f"{etherscan_base_url}?module=contract&action=getsourcecode&address={address}&apikey={etherscan_api_key}"
-    response = requests.get(url).json()
-    impl_address = response["result"][0]["Implementation"]
-    return w3.to_checksum_address(impl_address) if impl_address else None
+def _parse_implementation_response(data: dict) -> Optional[str]:
+    impl_address = data["result"][0]["Implementation"]
+    return Web3.to_checksum_address(impl_address) if impl_address else None
+
+
+def _get_abi(address: str) -> Steps[list]:
+    """Get the ABI from the persistent store, falling back to Etherscan when missing or stale."""
+    store = get_abi_store()
+    abi = store.get_abi(address)
+    if abi is not None:
+        return abi
+    try:
+        response = yield _etherscan_request("getabi", address)
+        abi = _parse_abi_response(response.json())
+    except Exception:
+        # Serve the stale copy if Etherscan is unavailable or rate limited
+        abi = store.get_abi(address, allow_stale=True)
+        if abi is None:
+            raise
+        return abi
+    store.put_abi(address, abi)
+    get_selector_index().add_abi(abi)
+    return abi
+
+
+def _get_implementation(address: str) -> Steps[Optional[str]]:
+    """Get the implementation address from the persistent store, falling back to Etherscan."""
+    store = get_abi_store()
+    impl_address = store.get_implementation(address)
+    if impl_address is not None:
+        return impl_address or None
+    try:
+        response = yield _etherscan_request("getsourcecode", address)
+        impl_address = _parse_implementation_response(response.json())
+    except Exception:
+        impl_address = store.get_implementation(address, allow_stale=True)
+        if impl_address is None:
+            raise
+        return impl_address or None
+    store.put_implementation(address, impl_address)
+    return impl_address
 
 
-@lru_cache
 def _fetch_abi_from_remote(
     contract_address: str,
     function_name: Optional[str] = None,
     max_redirects: int = 2,
-) -> str:
+) -> Steps[str]:
     """
     Fetches ABI from the contract address and handles redirects for proxy contracts.
+    The persistent ABI store is consulted before any Etherscan request.
 
     Args:
         contract_address (str): The address of the contract.
@@ -219,17 +321,53 @@ def _fetch_abi_from_remote(
     current_address = contract_address
     for _ in range(max_redirects):
         # print(f"Checking for proxy at {current_address}")
-        impl_address = _get_implementation_from_etherscan(current_address)
+        impl_address = yield from _get_implementation(current_address)
         if impl_address:
             # print(f"Proxy found, redirecting to {impl_address}")
             current_address = impl_address
             continue
         else:
             # print(f"No proxy found, fetching ABI for {current_address}")
-            abi = _get_abi_from_etherscan(current_address)
+            abi = yield from _get_abi(current_address)
             break
 
     # If a specific function name is requested, filter the ABI
     if function_name:
         return _extract_function_abi(abi, function_name) or abi
     return abi
+
+
+def _fetch_contract_abi(
+    contract_address: str,
+    contract_name: Optional[str] = None,
+    contract_type: Optional[str] = None,
+    function_name: Optional[str] = None,
+) -> Steps[str]:
+    # First try to fetch the ABI from local cache
+    cached_abi = _fetch_cached_abi(
+        contract_address=contract_address,
+        contract_name=contract_name,
+        contract_type=contract_type,
+        function_name=function_name,
+    )
+    if cached_abi:
+        return cached_abi
+
+    # If no local ABI is available, fetch the ABI from the store or the Etherscan API
+    return (yield from _fetch_abi_from_remote(contract_address, function_name))
+
+
+async def afetch_contract_abi(
+    contract_address: str,
+    contract_name: Optional[str] = None,
+    contract_type: Optional[str] = None,
+    function_name: Optional[str] = None,
+) -> str:
+    """Async version of `fetch_contract_abi`, requests go through the shared async HTTP client."""
+    return await arun(
+        _fetch_contract_abi(contract_address, contract_name, contract_type, function_name)
+    )
+
+
+# Native async entry point, used by `ainvoke` (e.g. from the ToolNode of the converter)
+fetch_contract_abi.coroutine = afetch_contract_abi
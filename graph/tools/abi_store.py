@@ -0,0 +1,250 @@
+"""
+The ABI store persists contract ABIs on disk so they survive process restarts.
+
+ABIs are stored once per content hash and shared by every address that uses them,
+and proxy contracts keep a mapping to their implementation address so redirects
+can be resolved without asking Etherscan again.
+
+Classes:
+- AbiStore: SQLite-backed store keyed by checksum address.
+
+Functions:
+- get_abi_store: Returns the shared store for the process.
+"""
+
+import os
+import json
+import glob
+import time
+import sqlite3
+import threading
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional
+
+from web3 import Web3
+
+from utils.abi_hash import hash_abi
+
+
+# Location of the store, can be overridden for tests and workers with a shared volume
+ABI_STORE_PATH = os.getenv("ABI_STORE_PATH", "data/abi_store.sqlite3")
+
+# Entries older than this (in seconds) are revalidated against Etherscan
+ABI_STORE_TTL = int(os.getenv("ABI_STORE_TTL", 7 * 24 * 60 * 60))
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS abis (
+    hash TEXT PRIMARY KEY,
+    abi TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS contracts (
+    address TEXT PRIMARY KEY,
+    abi_hash TEXT REFERENCES abis(hash),
+    abi_updated_at INTEGER,
+    implementation TEXT,
+    implementation_updated_at INTEGER
+);
+CREATE TABLE IF NOT EXISTS aliases (
+    name TEXT PRIMARY KEY,
+    abi_hash TEXT NOT NULL REFERENCES abis(hash)
+);
+"""
+
+
+class AbiStore:
+    """
+    Persistent ABI store.
+
+    Addresses are always stored in checksum format. The implementation of a contract
+    is stored as an empty string when the contract is known not to be a proxy, so
+    `get_implementation` can tell "not a proxy" apart from "never checked".
+
+    Args:
+        path (str): Path of the SQLite database file.
+        ttl (int): Number of seconds after which an entry is considered stale.
+    """
+
+    def __init__(self, path: str = ABI_STORE_PATH, ttl: int = ABI_STORE_TTL):
+        self.path = path
+        self.ttl = ttl
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Tools run in worker threads, so the connection is shared behind a lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+
+    def _is_fresh(self, updated_at: Optional[int]) -> bool:
+        return updated_at is not None and time.time() - updated_at < self.ttl
+
+    def get_abi(self, address: str, allow_stale: bool = False) -> Optional[List]:
+        """
+        Get the ABI stored for the address.
+
+        Args:
+            address (str): The contract address.
+            allow_stale (bool): Return the ABI even if it is older than the TTL.
+
+        Returns:
+            Optional[List]: The ABI, or None if it is missing or stale.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT a.abi, c.abi_updated_at FROM contracts c "
+                "JOIN abis a ON a.hash = c.abi_hash WHERE c.address = ?",
+                (Web3.to_checksum_address(address),),
+            ).fetchone()
+        if not row or not (allow_stale or self._is_fresh(row[1])):
+            return None
+        return json.loads(row[0])
+
+    def get_implementation(
+        self, address: str, allow_stale: bool = False
+    ) -> Optional[str]:
+        """
+        Get the implementation address of a proxy contract.
+
+        Returns:
+            Optional[str]: The implementation address, an empty string if the contract
+            is not a proxy, or None if unknown or stale.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT implementation, implementation_updated_at FROM contracts "
+                "WHERE address = ?",
+                (Web3.to_checksum_address(address),),
+            ).fetchone()
+        if not row or row[0] is None:
+            return None
+        if not (allow_stale or self._is_fresh(row[1])):
+            return None
+        return row[0]
+
+    def get_alias(self, name: str) -> Optional[List]:
+        """Get the ABI stored under a name, such as 'erc20'."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT a.abi FROM aliases n JOIN abis a ON a.hash = n.abi_hash "
+                "WHERE n.name = ?",
+                (name.lower(),),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _put_blob(self, abi: list) -> str:
+        abi_hash = hash_abi(abi)
+        self._conn.execute(
+            "INSERT OR IGNORE INTO abis (hash, abi) VALUES (?, ?)",
+            (abi_hash, json.dumps(abi)),
+        )
+        return abi_hash
+
+    def put_abi(self, address: str, abi: list) -> str:
+        """Store the ABI for the address. Returns the content hash of the ABI."""
+        with self._lock, self._conn:
+            abi_hash = self._put_blob(abi)
+            self._conn.execute(
+                "INSERT INTO contracts (address, abi_hash, abi_updated_at) "
+                "VALUES (?, ?, ?) ON CONFLICT(address) DO UPDATE SET "
+                "abi_hash = excluded.abi_hash, abi_updated_at = excluded.abi_updated_at",
+                (Web3.to_checksum_address(address), abi_hash, int(time.time())),
+            )
+        return abi_hash
+
+    def put_implementation(self, address: str, implementation: Optional[str]) -> None:
+        """Store the implementation of a proxy, or mark the contract as not a proxy."""
+        impl = Web3.to_checksum_address(implementation) if implementation else ""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO contracts (address, implementation, implementation_updated_at) "
+                "VALUES (?, ?, ?) ON CONFLICT(address) DO UPDATE SET "
+                "implementation = excluded.implementation, "
+                "implementation_updated_at = excluded.implementation_updated_at",
+                (Web3.to_checksum_address(address), impl, int(time.time())),
+            )
+
+    def put_alias(self, name: str, abi: list) -> str:
+        """Store the ABI under a name. Returns the content hash of the ABI."""
+        with self._lock, self._conn:
+            abi_hash = self._put_blob(abi)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO aliases (name, abi_hash) VALUES (?, ?)",
+                (name.lower(), abi_hash),
+            )
+        return abi_hash
+
+    def seed_from_directory(
+        self, directory: str, aliases: Optional[Dict[str, str]] = None
+    ) -> int:
+        """
+        Bulk load ABI files from a directory.
+
+        Files named after a contract address (e.g. `0xA0b8...eB48.json`) are stored for
+        that address, any other file is stored under its file name (e.g. `erc20`).
+
+        Args:
+            directory (str): The directory containing `*.json` ABI files.
+            aliases (Optional[Dict[str, str]]): Extra address or name keys mapped to a
+                file name without extension, e.g. `{"usdt": "erc20"}`.
+
+        Returns:
+            int: The number of keys written.
+        """
+        abis = {}
+        for file_path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+            with open(file_path) as file:
+                abis[os.path.splitext(os.path.basename(file_path))[0]] = json.load(file)
+
+        keys = {name: name for name in abis}
+        keys.update(aliases or {})
+
+        count = 0
+        for key, file_name in keys.items():
+            abi = abis.get(file_name)
+            if abi is None:
+                continue
+            if Web3.is_address(key):
+                self.put_abi(key, abi)
+                self.put_implementation(key, None)
+            else:
+                self.put_alias(key, abi)
+            count += 1
+        return count
+
+    def iter_abis(self) -> Iterator[List]:
+        """Iterate over the distinct stored ABIs."""
+        with self._lock:
+            rows = self._conn.execute("SELECT abi FROM abis").fetchall()
+        for (abi,) in rows:
+            yield json.loads(abi)
+
+    def stats(self) -> Dict[str, int]:
+        """Return the number of stored contracts, distinct ABIs and aliases."""
+        with self._lock:
+            return {
+                table: self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ("contracts", "abis", "aliases")
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+@lru_cache
+def get_abi_store() -> AbiStore:
+    """Returns the ABI store shared by the process."""
+    return AbiStore()
+
+
+if __name__ == "__main__":
+    import sys
+
+    # Usage: python -m graph.tools.abi_store [directory]
+    directory = sys.argv[1] if len(sys.argv) > 1 else "abi"
+    store = get_abi_store()
+    print(f"Seeded {store.seed_from_directory(directory)} keys from {directory}")
+    print(store.stats())
@@ -0,0 +1,398 @@
+"""
+Batched ENS resolution with a TTL cache.
+
+Resolving a name reads the resolver of its node from the ENS registry, then the record
+from the resolver. Instead of two sequential round trips per name, the names are resolved
+together: one JSON-RPC batch reads the resolvers of every name, a second one reads their
+records. Concurrent `aresolve` calls made in the same iteration of the event loop, e.g.
+by steps compiled with `asyncio.gather`, are merged into one such lookup.
+
+Names without a resolver of their own, and names whose resolver fails the `addr` call,
+e.g. an offchain resolver answering with an `OffchainLookup` revert, are resolved by the
+ENS module of web3, which walks up to the wildcard resolver of a parent name (ENSIP-10)
+and follows CCIP-Read (EIP-3668).
+
+Results are cached with a TTL, since the records of a name can change. Names without an
+address are cached for a shorter time, and failed calls are not cached at all, even when
+the other calls of their batch succeeded.
+
+Reverse resolution reads the `name` record of `<address>.addr.reverse`. The owner of an
+address can set it to any name, so a name is only returned if it resolves back to the
+address.
+
+Classes:
+- EnsResolver: Forward and reverse ENS resolution, batched and cached.
+
+Functions:
+- get_ens_resolver: Returns the resolver shared by the process.
+"""
+
+import os
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from eth_abi import decode
+from ens.utils import normal_name_to_hash, normalize_name
+from web3 import Web3
+
+from graph.tools import get_w3
+from graph.tools.rpc import abatch, batch, eth_call_params
+from utils.steps import Io, Steps, arun, run
+
+
+# Seconds a resolved name or address is cached
+ENS_CACHE_TTL = int(os.getenv("ENS_CACHE_TTL", 60 * 60))
+# Seconds a name without address, or an address without name, is cached
+ENS_NEGATIVE_TTL = int(os.getenv("ENS_NEGATIVE_TTL", 60))
+
+# ENS registry on Ethereum mainnet
+ENS_REGISTRY = "0x00000000000C2E074eC69A0dFb2997BA6C7d2e1e"
+# Selectors of `resolver(bytes32)`, `addr(bytes32)` and `name(bytes32)`
+_RESOLVER_SELECTOR = "0x0178b8bf"
+_ADDR_SELECTOR = "0x3b3b57de"
+_NAME_SELECTOR = "0x691f3431"
+
+_MAX_CACHE_SIZE = 10_000
+
+# A raw record, None if the node has no resolver, or the error of a failed call
+_Record = Union[bytes, None, Exception]
+
+
+class _TTLCache:
+    """A bounded cache whose entries expire, shared by the threads of the tools."""
+
+    def __init__(self, max_size: int = _MAX_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Tuple[float, Optional[str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Tuple[bool, Optional[str]]:
+        """Returns whether the key is cached, and its value."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def put(self, key: str, value: Optional[str], ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+def _node(name: str) -> Optional[str]:
+    """Returns the namehash of a name in hex without prefix, or None if the name is invalid."""
+    try:
+        return bytes(normal_name_to_hash(normalize_name(name))).hex()
+    except Exception:
+        return None
+
+
+def _output(result) -> Union[bytes, Exception]:
+    # A call may fail on its own in a batch, e.g. a resolver without the function
+    return result if isinstance(result, Exception) else bytes.fromhex(result[2:])
+
+
+def _decode_address(data: Optional[bytes]) -> Optional[str]:
+    if not data or len(data) < 32:
+        return None
+    address = decode(["address"], data[:32])[0]
+    return Web3.to_checksum_address(address) if int(address, 16) else None
+
+
+def _decode_name(data: Optional[bytes]) -> Optional[str]:
+    if not data:
+        return None
+    try:
+        return decode(["string"], data)[0] or None
+    except Exception:
+        return None
+
+
+def _batch(calls: List[Tuple[str, list]]) -> Io:
+    return Io(batch, abatch, calls, return_exceptions=True)
+
+
+def _ens_addresses(names: List[str]) -> Dict[str, Union[str, None, Exception]]:
+    """Resolve names one by one with web3, through wildcard and offchain resolvers."""
+    ens = get_w3().ens
+    addresses = {}
+    for name in names:
+        try:
+            address = ens.address(name)
+            addresses[name] = Web3.to_checksum_address(address) if address else None
+        except Exception as e:
+            addresses[name] = e
+    return addresses
+
+
+async def _aens_addresses(names: List[str]) -> Dict[str, Union[str, None, Exception]]:
+    # The ENS module of web3 is synchronous
+    return await asyncio.to_thread(_ens_addresses, names)
+
+
+def _read_records(nodes: List[str], selector: str) -> Steps[Dict[str, _Record]]:
+    """
+    Read a record of each node, in two batches: the resolvers, then the records.
+
+    Returns:
+        Dict[str, _Record]: The raw record of each node, None if the node has no
+        resolver, or the error of the failed resolver or record call.
+    """
+    records: Dict[str, _Record] = dict.fromkeys(nodes)
+    if not nodes:
+        return records
+    results = yield _batch(
+        [
+            ("eth_call", eth_call_params(ENS_REGISTRY, _RESOLVER_SELECTOR + node))
+            for node in nodes
+        ]
+    )
+    resolvers = {}
+    for node, result in zip(nodes, results):
+        output = _output(result)
+        if isinstance(output, Exception):
+            records[node] = output
+            continue
+        resolver = _decode_address(output)
+        if resolver is not None:
+            resolvers[node] = resolver
+    if not resolvers:
+        return records
+    results = yield _batch(
+        [
+            ("eth_call", eth_call_params(resolver, selector + node))
+            for node, resolver in resolvers.items()
+        ]
+    )
+    for node, result in zip(resolvers, results):
+        records[node] = _output(result)
+    return records
+
+
+class EnsResolver:
+    """
+    Forward and reverse ENS resolution, batched and cached.
+
+    Args:
+        ttl (float): Seconds a resolved name or address is cached.
+        negative_ttl (float): Seconds a name without address, or an address without name,
+            is cached.
+        max_size (int): The maximum number of cached names, and of cached addresses.
+
+    Example:
+        >>> resolver = get_ens_resolver()
+        >>> await resolver.aresolve_many(["vitalik.eth", "uniswap.eth"])
+        {'vitalik.eth': '0xd8dA6BF26964aF9D7eEd9e03E53415D37aA96045', 'uniswap.eth': '0x1a9C8182C09F50C8318d769245beA52c32BE35BC'}
+        >>> await resolver.alookup_many(["0xd8dA6BF26964aF9D7eEd9e03E53415D37aA96045"])
+        {'0xd8dA6BF26964aF9D7eEd9e03E53415D37aA96045': 'vitalik.eth'}
+    """
+
+    def __init__(
+        self,
+        ttl: float = ENS_CACHE_TTL,
+        negative_ttl: float = ENS_NEGATIVE_TTL,
+        max_size: int = _MAX_CACHE_SIZE,
+    ):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._names = _TTLCache(max_size)
+        self._addresses = _TTLCache(max_size)
+        # Names waiting for the next lookup, per event loop
+        self._pending: Dict[asyncio.AbstractEventLoop, Dict[str, asyncio.Future]] = {}
+
+    def _ttl(self, value: Optional[str]) -> float:
+        return self.ttl if value else self.negative_ttl
+
+    def _addresses_steps(
+        self, names: Iterable[str]
+    ) -> Steps[Dict[str, Union[str, None, Exception]]]:
+        """The address of each name, or the error of the failed calls, not cached."""
+        # In the order of the names
+        results: Dict[str, Union[str, None, Exception]] = dict.fromkeys(names)
+        # Node -> names, "Uniswap.eth" and "uniswap.eth" share a node
+        nodes: Dict[str, List[str]] = {}
+        for name in results:
+            found, address = self._names.get(name)
+            if found:
+                results[name] = address
+                continue
+            node = _node(name)
+            if node is None:
+                results[name] = None
+                self._names.put(name, None, self.negative_ttl)
+            else:
+                nodes.setdefault(node, []).append(name)
+
+        records = yield from _read_records(list(nodes), _ADDR_SELECTOR)
+        addresses: Dict[str, Union[str, None, Exception]] = {}
+        # Node -> name to resolve through a wildcard or offchain resolver
+        fallbacks: Dict[str, str] = {}
+        for node, record in records.items():
+            if isinstance(record, bytes):
+                addresses[node] = _decode_address(record)
+            else:
+                fallbacks[node] = nodes[node][0]
+        if fallbacks:
+            names = list(fallbacks.values())
+            resolved = yield Io(_ens_addresses, _aens_addresses, names)
+            for node, name in fallbacks.items():
+                addresses[node] = resolved[name]
+
+        for node, address in addresses.items():
+            for name in nodes[node]:
+                results[name] = address
+                # A failed call is not cached, the next call tries again
+                if not isinstance(address, Exception):
+                    self._names.put(name, address, self._ttl(address))
+        return results
+
+    def _resolve_steps(
+        self, names: Iterable[str]
+    ) -> Steps[Dict[str, Optional[str]]]:
+        addresses = yield from self._addresses_steps(names)
+        return {
+            name: None if isinstance(address, Exception) else address
+            for name, address in addresses.items()
+        }
+
+    def _lookup_steps(
+        self, addresses: Iterable[str]
+    ) -> Steps[Dict[str, Optional[str]]]:
+        results: Dict[str, Optional[str]] = dict.fromkeys(
+            Web3.to_checksum_address(address) for address in addresses
+        )
+        nodes: Dict[str, str] = {}
+        for address in results:
+            found, name = self._addresses.get(address)
+            if found:
+                results[address] = name
+            else:
+                nodes[_node(f"{address[2:].lower()}.addr.reverse")] = address
+
+        records = yield from _read_records(list(nodes), _NAME_SELECTOR)
+        # The claimed name of each address, or the error of the failed call
+        claimed = {
+            nodes[node]: (
+                record if isinstance(record, Exception) else _decode_name(record)
+            )
+            for node, record in records.items()
+        }
+        # Only trust the names resolving back to their address
+        forward = yield from self._addresses_steps(
+            name for name in claimed.values() if isinstance(name, str)
+        )
+        for address, name in claimed.items():
+            target = forward.get(name) if isinstance(name, str) else name
+            if isinstance(target, Exception):
+                # A failed call is not cached, the next call tries again
+                continue
+            name = name if name and target == address else None
+            results[address] = name
+            self._addresses.put(address, name, self._ttl(name))
+        return results
+
+    def resolve_many(self, names: Iterable[str]) -> Dict[str, Optional[str]]:
+        """
+        Resolve ENS names to addresses, the uncached names in two JSON-RPC batches.
+
+        Names without a resolver of their own, or whose resolver call fails, are then
+        resolved by web3 through a wildcard or offchain resolver.
+
+        Args:
+            names (Iterable[str]): The ENS names, e.g. "uniswap.eth".
+
+        Returns:
+            Dict[str, Optional[str]]: The checksum address of each name, None if the name
+            is invalid, has no address, or could not be resolved. The latter is not cached.
+
+        Raises:
+            Exception: The JSON-RPC requests failed, nothing is cached.
+        """
+        return run(self._resolve_steps(names))
+
+    async def aresolve_many(self, names: Iterable[str]) -> Dict[str, Optional[str]]:
+        """Async version of `resolve_many`."""
+        return await arun(self._resolve_steps(names))
+
+    def resolve(self, name: str) -> Optional[str]:
+        """Resolve an ENS name to its checksum address, or None."""
+        return self.resolve_many([name])[name]
+
+    async def aresolve(self, name: str) -> Optional[str]:
+        """Async version of `resolve`, concurrent calls are resolved together."""
+        found, address = self._names.get(name)
+        if found:
+            return address
+        loop = asyncio.get_running_loop()
+        pending = self._pending.get(loop)
+        if pending is None:
+            pending = self._pending[loop] = {}
+            # Names requested until the next iteration of the loop join this lookup
+            loop.call_soon(self._flush, loop)
+        if name not in pending:
+            pending[name] = loop.create_future()
+        # A cancelled caller does not cancel the lookup of the others
+        return await asyncio.shield(pending[name])
+
+    def _flush(self, loop: asyncio.AbstractEventLoop) -> None:
+        loop.create_task(self._resolve_pending(self._pending.pop(loop)))
+
+    async def _resolve_pending(self, pending: Dict[str, asyncio.Future]) -> None:
+        try:
+            addresses = await self.aresolve_many(list(pending))
+        except Exception as e:
+            for future in pending.values():
+                future.set_exception(e)
+            return
+        for name, future in pending.items():
+            future.set_result(addresses[name])
+
+    def lookup_many(self, addresses: Iterable[str]) -> Dict[str, Optional[str]]:
+        """
+        Reverse resolve addresses to their primary ENS name, to label them in results.
+
+        Args:
+            addresses (Iterable[str]): The addresses.
+
+        Returns:
+            Dict[str, Optional[str]]: The name of each checksum address, None if the address
+            has no primary name or the name does not resolve back to the address.
+
+        Raises:
+            Exception: The JSON-RPC requests failed, nothing is cached.
+        """
+        return run(self._lookup_steps(addresses))
+
+    async def alookup_many(self, addresses: Iterable[str]) -> Dict[str, Optional[str]]:
+        """Async version of `lookup_many`."""
+        return await arun(self._lookup_steps(addresses))
+
+
+@lru_cache
+def get_ens_resolver() -> EnsResolver:
+    """Returns the ENS resolver shared by the process."""
+    return EnsResolver()
+
+
+if __name__ == "__main__":
+    resolver = get_ens_resolver()
+    names = ["vitalik.eth", "uniswap.eth", "not-a-name-1234567.eth"]
+    addresses = asyncio.run(resolver.aresolve_many(names))
+    print(addresses)
+    assert addresses["vitalik.eth"] == "0xd8dA6BF26964aF9D7eEd9e03E53415D37aA96045"
+    assert addresses["not-a-name-1234567.eth"] is None
+    names = resolver.lookup_many(["0xd8dA6BF26964aF9D7eEd9e03E53415D37aA96045"])
+    print(names)
+    assert names["0xd8dA6BF26964aF9D7eEd9e03E53415D37aA96045"] == "vitalik.eth"
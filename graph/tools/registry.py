@@ -0,0 +1,327 @@
+"""
+The registry of the tokens and protocols known by name, across chains.
+
+Entries are loaded once from the local JSON files of `REGISTRY_DIR`: token lists in the
+token-list format (`{"tokens": [{"chainId", "address", "symbol", "name", "decimals"}]}`)
+and protocol lists (`{"protocols": [{"chainId", "address", "name"}]}`). Both accept
+`aliases`, e.g. "lido" for stETH. More lists can be dropped in the directory.
+
+Names are normalized (lowercase, runs of other characters than letters and digits
+become a space) and indexed three ways:
+
+- Exact: a hash map of the symbols, names and aliases. An alias wins over a symbol, and
+  a symbol over a name, so "uniswap" is the router and not the UNI token.
+- Prefix: the sorted keys of each chain, searched with bisect.
+- Fuzzy: a trigram index of the keys of each chain, candidates are ranked by Dice
+  similarity.
+
+`lookup` only settles for a prefix or fuzzy match that scores at least `MATCH_SCORE` and
+`MATCH_MARGIN` more than the runner-up, so "ETH" does not resolve to ezETH. Otherwise
+callers get the ranked candidates of `search` to choose from.
+
+Classes:
+- RegistryEntry: A token or protocol contract.
+- Registry: Exact, prefix and fuzzy lookups of the entries.
+
+Functions:
+- normalize_name: Normalizes a name into a registry key.
+- load_registry: Loads the registry from the files of a directory.
+- get_registry: Returns the registry shared by the process.
+"""
+
+import os
+import re
+import glob
+import json
+from bisect import bisect_left
+from collections import Counter
+from itertools import chain
+from functools import lru_cache
+from typing import Dict, List, Literal, Optional, Tuple
+
+from pydantic import BaseModel
+
+
+# Directory of the token and protocol lists
+REGISTRY_DIR = os.getenv("REGISTRY_DIR", "registry")
+
+DEFAULT_CHAIN_ID = 1
+
+# Minimum score of a fuzzy or prefix match
+FUZZY_CUTOFF = 0.5
+
+# Minimum score of the match returned by `lookup`, and its lead over the runner-up
+MATCH_SCORE = 0.8
+MATCH_MARGIN = 0.1
+
+# Prefix matches considered, short prefixes match too many keys to rank them all
+_MAX_PREFIX_MATCHES = 64
+# Trigrams shared by more keys carry no information, e.g. " us" or "eth"
+_MAX_POSTINGS = 500
+# Keys sharing the most trigrams with a name that are scored
+_MAX_FUZZY_CANDIDATES = 16
+
+# Priorities of the keys of an entry, the lowest wins an exact lookup
+_ALIAS, _SYMBOL, _NAME = 0, 1, 2
+
+_SEPARATORS = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_name(name: str) -> str:
+    """Normalize a name, e.g. "Uniswap V2 Router" and "uniswap_v2_router" to "uniswap v2 router"."""
+    return _SEPARATORS.sub(" ", name.lower()).strip()
+
+
+def _trigrams(key: str) -> set:
+    # Padded so short keys and the first letters weigh in
+    padded = f"  {key} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class RegistryEntry(BaseModel):
+    """A token or protocol contract on a chain."""
+
+    kind: Literal["token", "protocol"]
+    chain_id: int
+    address: str
+    name: str
+    symbol: Optional[str] = None
+    decimals: Optional[int] = None
+    aliases: List[str] = []
+
+    def keys(self) -> List[Tuple[str, int]]:
+        """Returns the normalized keys of the entry with their priority."""
+        keys = [(alias, _ALIAS) for alias in self.aliases]
+        if self.symbol:
+            keys.append((self.symbol, _SYMBOL))
+        keys.append((self.name, _NAME))
+        return [(normalize_name(key), priority) for key, priority in keys]
+
+
+class _KeyIndex:
+    """Prefix and trigram index of the keys of one chain."""
+
+    def __init__(self, keys: List[str]):
+        self.keys = sorted(keys)
+        # Trigram -> positions of the keys
+        self.postings: Dict[str, List[int]] = {}
+        for position, key in enumerate(self.keys):
+            for trigram in _trigrams(key):
+                self.postings.setdefault(trigram, []).append(position)
+
+    def prefix_scores(self, key: str) -> Dict[str, float]:
+        scores = {}
+        position = bisect_left(self.keys, key)
+        for candidate in self.keys[position : position + _MAX_PREFIX_MATCHES]:
+            if not candidate.startswith(key):
+                break
+            # A longer completion is a weaker match
+            scores[candidate] = 0.5 + 0.5 * len(key) / len(candidate)
+        return scores
+
+    def fuzzy_scores(self, key: str) -> Dict[str, float]:
+        trigrams = _trigrams(key)
+        postings = [self.postings.get(trigram, ()) for trigram in trigrams]
+        # Counted in C, the keys sharing the most informative trigrams are candidates
+        shared = Counter(
+            chain.from_iterable(p for p in postings if len(p) <= _MAX_POSTINGS)
+        )
+        scores = {}
+        for position, _ in shared.most_common(_MAX_FUZZY_CANDIDATES):
+            candidate = self.keys[position]
+            # Scored on every trigram, including the common ones skipped above
+            candidate_trigrams = _trigrams(candidate)
+            scores[candidate] = (
+                2 * len(trigrams & candidate_trigrams) / (len(trigrams) + len(candidate_trigrams))
+            )
+        return scores
+
+
+class Registry:
+    """
+    Exact, prefix and fuzzy lookups of tokens and protocols by name.
+
+    Args:
+        entries (List[RegistryEntry]): The entries, earlier entries win ties.
+
+    Example:
+        >>> registry = get_registry()
+        >>> registry.exact("USDC").address
+        '0xa0b86991c6218b36c1d19d4a2e9eb0ce3606eb48'
+        >>> [(entry.name, round(score, 2)) for entry, score in registry.search("uniswp")]
+        [('Uniswap V2 Router', 0.67), ('Uniswap', 0.67), ...]
+    """
+
+    def __init__(self, entries: List[RegistryEntry]):
+        self.entries = entries
+        # Chain and kind of each entry, faster to filter on than the models
+        self._filters = [(entry.chain_id, entry.kind) for entry in entries]
+        # Key -> (entry index, priority), in entry order
+        self._exact: Dict[str, List[Tuple[int, int]]] = {}
+        chain_keys: Dict[int, set] = {}
+        for index, entry in enumerate(entries):
+            keys = chain_keys.setdefault(entry.chain_id, set())
+            seen = set()
+            for key, priority in entry.keys():
+                if key and key not in seen:
+                    seen.add(key)
+                    self._exact.setdefault(key, []).append((index, priority))
+            keys.update(seen)
+        # Fuzzy lookups only compare the keys of the chain
+        self._indexes = {
+            chain_id: _KeyIndex(list(keys)) for chain_id, keys in chain_keys.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _accepts(self, index: int, chain_id: int, kind: Optional[str]) -> bool:
+        entry_chain_id, entry_kind = self._filters[index]
+        return entry_chain_id == chain_id and (kind is None or entry_kind == kind)
+
+    def exact(
+        self, name: str, chain_id: int = DEFAULT_CHAIN_ID, kind: Optional[str] = None
+    ) -> Optional[RegistryEntry]:
+        """
+        Look up an entry by its exact symbol, name or alias.
+
+        Args:
+            name (str): The name, normalized before the lookup.
+            chain_id (int): The chain of the entry.
+            kind (Optional[str]): "token" or "protocol", any kind by default.
+
+        Returns:
+            Optional[RegistryEntry]: The entry, or None if there is none or the name is
+            ambiguous, i.e. several addresses share its best key priority.
+        """
+        matches = [
+            (index, priority)
+            for index, priority in self._exact.get(normalize_name(name), ())
+            if self._accepts(index, chain_id, kind)
+        ]
+        if not matches:
+            return None
+        best = min(priority for _, priority in matches)
+        indexes = [index for index, priority in matches if priority == best]
+        addresses = {self.entries[index].address.lower() for index in indexes}
+        return self.entries[indexes[0]] if len(addresses) == 1 else None
+
+    def search(
+        self,
+        name: str,
+        chain_id: int = DEFAULT_CHAIN_ID,
+        kind: Optional[str] = None,
+        limit: int = 5,
+        cutoff: float = FUZZY_CUTOFF,
+    ) -> List[Tuple[RegistryEntry, float]]:
+        """
+        Rank the entries matching a name exactly, by prefix or approximately.
+
+        Args:
+            name (str): The name, normalized before the lookup.
+            chain_id (int): The chain of the entries.
+            kind (Optional[str]): "token" or "protocol", any kind by default.
+            limit (int): The maximum number of candidates.
+            cutoff (float): The minimum score of a candidate, between 0 and 1.
+
+        Returns:
+            List[Tuple[RegistryEntry, float]]: The candidates and their score, best first.
+            An exact match scores 1.
+        """
+        key = normalize_name(name)
+        index = self._indexes.get(chain_id)
+        if not key or index is None:
+            return []
+        scores = index.fuzzy_scores(key)
+        for candidate, score in index.prefix_scores(key).items():
+            scores[candidate] = max(score, scores.get(candidate, 0.0))
+        if key in self._exact:
+            scores[key] = 1.0
+
+        # The best score of each entry, a higher priority key breaks ties
+        best: Dict[int, Tuple[float, int]] = {}
+        for candidate, score in scores.items():
+            if score < cutoff:
+                continue
+            for entry_index, priority in self._exact[candidate]:
+                if not self._accepts(entry_index, chain_id, kind):
+                    continue
+                current = best.get(entry_index)
+                if current is None or (score, -priority) > (current[0], -current[1]):
+                    best[entry_index] = (score, priority)
+        ranked = sorted(
+            best.items(), key=lambda item: (-item[1][0], item[1][1], item[0])
+        )
+        return [(self.entries[i], score) for i, (score, _) in ranked[:limit]]
+
+    def lookup(
+        self, name: str, chain_id: int = DEFAULT_CHAIN_ID, kind: Optional[str] = None
+    ) -> Optional[RegistryEntry]:
+        """
+        Look up the entry of a name, exactly or by a clear prefix or fuzzy match.
+
+        Returns:
+            Optional[RegistryEntry]: The exact match, or else the best prefix or fuzzy
+            match if it scores at least `MATCH_SCORE` and `MATCH_MARGIN` more than the
+            runner-up. None if the name is ambiguous or matches nothing clearly.
+        """
+        entry = self.exact(name, chain_id, kind)
+        if entry is not None:
+            return entry
+        if any(
+            self._accepts(index, chain_id, kind)
+            for index, _ in self._exact.get(normalize_name(name), ())
+        ):
+            # Several addresses share the name, a weaker match is no better
+            return None
+        candidates = self.search(name, chain_id, kind, limit=2)
+        if not candidates or candidates[0][1] < MATCH_SCORE:
+            return None
+        if len(candidates) > 1 and candidates[0][1] - candidates[1][1] < MATCH_MARGIN:
+            return None
+        return candidates[0][0]
+
+
+def load_registry(directory: str = REGISTRY_DIR) -> Registry:
+    """
+    Load the token and protocol lists of a directory.
+
+    Args:
+        directory (str): The directory of the JSON lists, read in file name order.
+
+    Returns:
+        Registry: The registry of every entry of the lists.
+    """
+    entries: List[RegistryEntry] = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        with open(path, "r") as file:
+            data = json.load(file)
+        for token in data.get("tokens", []):
+            entries.append(
+                RegistryEntry(
+                    kind="token",
+                    chain_id=token["chainId"],
+                    address=token["address"],
+                    name=token["name"],
+                    symbol=token["symbol"],
+                    decimals=token.get("decimals"),
+                    aliases=token.get("aliases", []),
+                )
+            )
+        for protocol in data.get("protocols", []):
+            entries.append(
+                RegistryEntry(
+                    kind="protocol",
+                    chain_id=protocol["chainId"],
+                    address=protocol["address"],
+                    name=protocol["name"],
+                    aliases=protocol.get("aliases", []),
+                )
+            )
+    return Registry(entries)
+
+
+@lru_cache
+def get_registry() -> Registry:
+    """Returns the registry shared by the process, loaded on first use."""
+    return load_registry()
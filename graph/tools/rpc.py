@@ -0,0 +1,92 @@
+"""
+Minimal JSON-RPC client on top of the shared HTTP layer.
+
+Used by the async entry points of the tools instead of the synchronous Web3 provider.
+
+Functions:
+- rpc / arpc: Sends a single JSON-RPC request.
+- batch / abatch: Sends several JSON-RPC requests in one HTTP request.
+- aeth_call: Calls a contract function with `eth_call`.
+"""
+
+from typing import Any, List, Optional, Tuple
+
+from graph.tools import RPC_URL
+from utils.http import request, arequest
+
+
+class RPCError(Exception):
+    """Error returned by the JSON-RPC endpoint."""
+
+
+def _payload(method: str, params: list, id: int = 0) -> dict:
+    return {"id": id, "jsonrpc": "2.0", "method": method, "params": params}
+
+
+def _result(response: dict) -> Any:
+    if "error" in response:
+        raise RPCError(response["error"].get("message", str(response["error"])))
+    return response["result"]
+
+
+def _results(responses: List[dict], return_exceptions: bool) -> List[Any]:
+    # Responses of a batch may come back in any order
+    results = []
+    for response in sorted(responses, key=lambda r: r["id"]):
+        try:
+            results.append(_result(response))
+        except RPCError as e:
+            if not return_exceptions:
+                raise
+            results.append(e)
+    return results
+
+
+def rpc(method: str, params: list, url: Optional[str] = None) -> Any:
+    response = request("POST", url or RPC_URL, json=_payload(method, params))
+    response.raise_for_status()
+    return _result(response.json())
+
+
+async def arpc(method: str, params: list, url: Optional[str] = None) -> Any:
+    response = await arequest("POST", url or RPC_URL, json=_payload(method, params))
+    response.raise_for_status()
+    return _result(response.json())
+
+
+def batch(
+    calls: List[Tuple[str, list]],
+    url: Optional[str] = None,
+    return_exceptions: bool = False,
+) -> List[Any]:
+    """Send the calls as one batch and return the results in the same order."""
+    if not calls:
+        return []
+    payload = [_payload(method, params, i) for i, (method, params) in enumerate(calls)]
+    response = request("POST", url or RPC_URL, json=payload)
+    response.raise_for_status()
+    return _results(response.json(), return_exceptions)
+
+
+async def abatch(
+    calls: List[Tuple[str, list]],
+    url: Optional[str] = None,
+    return_exceptions: bool = False,
+) -> List[Any]:
+    """Send the calls as one batch and return the results in the same order."""
+    if not calls:
+        return []
+    payload = [_payload(method, params, i) for i, (method, params) in enumerate(calls)]
+    response = await arequest("POST", url or RPC_URL, json=payload)
+    response.raise_for_status()
+    return _results(response.json(), return_exceptions)
+
+
+def eth_call_params(to: str, data: str, block: str = "latest") -> list:
+    return [{"to": to, "data": data}, block]
+
+
+async def aeth_call(to: str, data: str, block: str = "latest") -> bytes:
+    """Call a contract function and return the raw output."""
+    result = await arpc("eth_call", eth_call_params(to, data, block))
+    return bytes.fromhex(result[2:])
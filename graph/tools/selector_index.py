@@ -0,0 +1,250 @@
+"""
+The selector index maps 4-byte function selectors to their signatures, to decode calldata locally.
+
+The index is built from every ABI at hand: the local ABI files, the ABIs of the persistent
+ABI store and the ABIs passed to `encode_function_call`. It is seeded with a dump of
+common signatures (`SIGNATURES_PATH`, `{"signatures": {"0xa9059cbb": ["transfer(address,uint256)"]}}`)
+for the functions without a known ABI. Signatures from an ABI carry the argument names,
+signatures from the dump are named `arg0`, `arg1`, ...
+
+Several signatures can share a selector, the first one decoding the calldata wins.
+
+Classes:
+- FunctionSignature: The name and argument types of a function.
+- DecodedCall: A function call decoded from calldata.
+- SelectorIndex: Selector to signatures index.
+
+Functions:
+- load_selector_index: Builds an index from the signature dump, ABI files and ABI store.
+- get_selector_index: Returns the index shared by the process.
+"""
+
+import os
+import glob
+import json
+import threading
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from eth_abi import decode
+from pydantic import BaseModel
+from web3 import Web3
+
+from graph.tools.abi_store import get_abi_store
+
+
+# Dump of common signatures by selector
+SIGNATURES_PATH = os.getenv("SIGNATURES_PATH", "registry/signatures.json")
+
+# Directory of the local ABI files
+ABI_DIR = "abi"
+
+
+def _abi_type(param: dict) -> str:
+    """Canonical type of an ABI parameter, tuples are expanded into their components."""
+    abi_type = param["type"]
+    if abi_type.startswith("tuple"):
+        components = ",".join(_abi_type(component) for component in param["components"])
+        return f"({components}){abi_type[len('tuple'):]}"
+    return abi_type
+
+
+def _split_types(types: str) -> List[str]:
+    """Split a list of types on the commas outside of tuples."""
+    parts, depth, start = [], 0, 0
+    for i, char in enumerate(types):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            parts.append(types[start:i])
+            start = i + 1
+    if types:
+        parts.append(types[start:])
+    return parts
+
+
+class FunctionSignature(BaseModel):
+    name: str
+    types: List[str]
+    arg_names: List[str] = []
+
+    @classmethod
+    def from_abi(cls, entry: dict) -> "FunctionSignature":
+        """Build the signature of a function entry of an ABI."""
+        inputs = entry.get("inputs", [])
+        return cls(
+            name=entry["name"],
+            types=[_abi_type(param) for param in inputs],
+            arg_names=[param.get("name", "") for param in inputs],
+        )
+
+    @classmethod
+    def from_text(cls, text: str) -> "FunctionSignature":
+        """Parse a text signature, e.g. "transfer(address,uint256)"."""
+        name, _, types = text.strip().partition("(")
+        if not name or not types.endswith(")"):
+            raise ValueError(f"Invalid signature: {text}")
+        return cls(name=name, types=_split_types(types[:-1]))
+
+    @property
+    def text(self) -> str:
+        return f"{self.name}({','.join(self.types)})"
+
+    @property
+    def selector(self) -> str:
+        return "0x" + bytes(Web3.keccak(text=self.text)[:4]).hex()
+
+
+class DecodedCall(BaseModel):
+    """
+    A function call decoded from calldata.
+
+    Attributes:
+        selector (str): The 4-byte selector, e.g. "0xa9059cbb".
+        signature (str): The text signature, e.g. "transfer(address,uint256)".
+        name (str): The function name.
+        arguments (Dict[str, Any]): The arguments by name, in order.
+    """
+
+    selector: str
+    signature: str
+    name: str
+    arguments: Dict[str, Any]
+
+
+class SelectorIndex:
+    """
+    Selector to signatures index, decoding calldata without a network call.
+
+    Example:
+        >>> index = get_selector_index()
+        >>> call = index.decode("0xa9059cbb000000000000000000000000b859d7eb5e319e54dc23c83dfe93e649b88202b60000000000000000000000000000000000000000000000000000000005f5e100")
+        >>> call.name, call.arguments
+        ('transfer', {'_to': '0xB859d7EB5e319E54dC23c83DfE93e649B88202B6', '_value': 100000000})
+    """
+
+    def __init__(self):
+        self._signatures: Dict[str, List[FunctionSignature]] = {}
+        # Signatures are added by the tools, from worker threads
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def add(self, signature: FunctionSignature, selector: Optional[str] = None) -> None:
+        """
+        Add a signature, an ABI signature replaces the same signature without names.
+
+        Args:
+            signature (FunctionSignature): The signature.
+            selector (Optional[str]): The selector if known, computed otherwise.
+        """
+        selector = (selector or signature.selector).lower()
+        with self._lock:
+            signatures = self._signatures.setdefault(selector, [])
+            for i, known in enumerate(signatures):
+                if known.text == signature.text:
+                    if signature.arg_names and not known.arg_names:
+                        signatures[i] = signature
+                    return
+            signatures.append(signature)
+
+    def add_abi(self, abi: list) -> int:
+        """Add the functions of an ABI. Returns the number of functions."""
+        functions = [entry for entry in abi if entry.get("type") == "function"]
+        for entry in functions:
+            self.add(FunctionSignature.from_abi(entry))
+        return len(functions)
+
+    def lookup(self, selector: str) -> List[FunctionSignature]:
+        """Returns the signatures of a selector, empty if unknown."""
+        with self._lock:
+            return list(self._signatures.get(selector.lower(), ()))
+
+    def decode(self, data: str) -> Optional[DecodedCall]:
+        """
+        Decode calldata into the function and its named arguments.
+
+        Args:
+            data (str): The calldata in hex, starting with the selector.
+
+        Returns:
+            Optional[DecodedCall]: The decoded call, or None if the selector is unknown or
+            the calldata does not decode with any signature of the selector.
+        """
+        selector = data[:10].lower()
+        try:
+            payload = bytes.fromhex(data[10:])
+        except ValueError:
+            return None
+        for signature in self.lookup(selector):
+            try:
+                values = decode(signature.types, payload)
+            except Exception:
+                continue
+            names = [
+                name or f"arg{i}"
+                for i, name in enumerate(
+                    signature.arg_names or [""] * len(signature.types)
+                )
+            ]
+            return DecodedCall(
+                selector=selector,
+                signature=signature.text,
+                name=signature.name,
+                arguments=dict(zip(names, values)),
+            )
+        return None
+
+
+def load_selector_index(
+    signatures_path: Optional[str] = SIGNATURES_PATH,
+    abi_dir: Optional[str] = ABI_DIR,
+    include_store: bool = True,
+) -> SelectorIndex:
+    """
+    Build a selector index from the signature dump, the ABI files and the ABI store.
+
+    Args:
+        signatures_path (Optional[str]): The signature dump, skipped if None or missing.
+        abi_dir (Optional[str]): The directory of the ABI files, skipped if None.
+        include_store (bool): Whether to add the ABIs of the persistent ABI store.
+
+    Returns:
+        SelectorIndex: The index.
+    """
+    index = SelectorIndex()
+    if signatures_path and os.path.exists(signatures_path):
+        with open(signatures_path) as file:
+            dump = json.load(file)
+        for selector, texts in dump.get("signatures", {}).items():
+            for text in texts:
+                index.add(FunctionSignature.from_text(text), selector)
+    if abi_dir:
+        for path in sorted(glob.glob(os.path.join(abi_dir, "*.json"))):
+            with open(path) as file:
+                index.add_abi(json.load(file))
+    if include_store:
+        for abi in get_abi_store().iter_abis():
+            index.add_abi(abi)
+    return index
+
+
+@lru_cache
+def get_selector_index() -> SelectorIndex:
+    """Returns the selector index shared by the process, built on first use."""
+    return load_selector_index()
+
+
+if __name__ == "__main__":
+    index = get_selector_index()
+    print(f"{len(index)} selectors")
+    call = index.decode(
+        "0x095ea7b30000000000000000000000007a250d5630b4cf539739df2c5dacb4c659f2488d"
+        "0000000000000000000000000000000000000000000000000000000005f5e100"
+    )
+    print(call)
+    assert call.name == "approve"
+    assert list(call.arguments.values())[1] == 100_000_000
@@ -1,22 +1,26 @@
 """
-The simulation module is responsible for simulating transactions on Tenderly.
+The simulation module is responsible for simulating transactions on Tenderly or a local EVM.
 
 Functions:
-- simulate_transaction: Simulates a transaction on Tenderly and returns SimulationResult.
+- simulate_transaction: Simulates a transaction with the configured backend and returns SimulationResult.
+- annotate_asset_changes: Fills in the token metadata missing from asset changes.
 
 Classes:
 - TransactionParams: Transaction parameters for the input of the simulation.
 - SimulationResult: Simulation results including asset changes and error messages.
+- SimulationSession: Simulates transactions one step at a time on top of the already accepted ones.
 """
 
-import os
-import requests
-from typing import List, Optional
+from typing import Dict, Iterable, List, Optional
 
 from pydantic import BaseModel, Field, field_validator
 from langchain_core.tools import tool
+from web3 import Web3
 
 from models.tx_params import TransactionParams
+from graph.tools.simulation_backend import SimulationError, get_simulation_backend
+from graph.tools.token_metadata import TokenMetadata, token_metadata_steps
+from utils.steps import Io, Steps, arun, run
 
 
 class AssetChange(BaseModel):
@@ -113,7 +117,13 @@ class SimulationResult(BaseModel):
                     )
         return v
 
+    def all_asset_changes(self) -> List[AssetChange]:
+        """Returns the asset changes of every transaction."""
+        return [change for tx in self.tx_results for change in tx.asset_changes]
+
     def pretty_print(self):
+        # One lookup for the tokens of every transaction, not one per transaction
+        annotate_asset_changes(self.all_asset_changes())
         for i, tx_result in enumerate(self.tx_results):
             status = "Successful" if not tx_result.error else "Failed"
             print(f"#{i + 1}: {status}")
@@ -121,17 +131,15 @@ class SimulationResult(BaseModel):
             print("-" * 40)
 
 
-class SimulationError(Exception):
-    """
-    Error raised when simulation fails.
-
-    Attributes:
-        message (str): The error message.
-    """
-
-    def __init__(self, message):
-        self.message = message
-        super().__init__(self.message)
+def _simulate_transaction(
+    transactions: List[TransactionParams],
+) -> Steps[SimulationResult]:
+    backend = get_simulation_backend()
+    results = yield Io(backend.simulate_bundle, backend.asimulate_bundle, transactions)
+    sender = transactions[0].from_address
+    simulation_result = _format_simulation_result(sender, results)
+    yield from _annotate_asset_changes(simulation_result.all_asset_changes())
+    return simulation_result
 
 
 @tool
@@ -145,35 +153,177 @@ def simulate_transaction(transactions: List[TransactionParams]) -> SimulationRes
     Returns:
         SimulationResult: The result of the simulation.
     """
-    TENDERLY_API_KEY = os.getenv("TENDERLY_API_KEY")
-    url = f"https://mainnet.gateway.tenderly.co/{TENDERLY_API_KEY}"
-    data = {
-        "id": 0,
-        "jsonrpc": "2.0",
-        "method": "tenderly_simulateBundle",
-        "params": [
-            [
-                {
-                    "from": tx.from_address,
-                    "to": tx.to_address,
-                    "data": tx.data,
-                    "value": tx.value,
-                }
-                for tx in transactions
-            ],
-            "latest",
-        ],
-    }
-    # print(data) # TODO: Logger
-    response = requests.post(url, json=data).json()
-
-    if "error" in response:
-        print(response)
-        raise SimulationError(response["error"]["message"])
-    if "result" in response:
+    return run(_simulate_transaction(transactions))
+
+
+async def asimulate_transaction(
+    transactions: List[TransactionParams],
+) -> SimulationResult:
+    """Async version of `simulate_transaction`."""
+    return await arun(_simulate_transaction(transactions))
+
+
+# Native async entry point, used by `ainvoke`
+simulate_transaction.coroutine = asimulate_transaction
+
+
+class SimulationSession(BaseModel):
+    """
+    A simulation pinned to a block that carries forward the post-state of accepted transactions.
+
+    Each call to `simulate` only simulates the new transactions, on top of the state changes
+    of the transactions accepted so far, which are passed to Tenderly as state overrides.
+    If the simulation results do not include state changes, e.g. with the local EVM backend,
+    the session falls back to simulating the accepted transactions again as a prefix.
+
+    Attributes:
+        block_number (Optional[int]): The pinned block, set on the first simulation.
+        state_overrides (Dict[str, Dict]): Post-state of the accepted transactions by address.
+        transactions (List[TransactionParams]): The accepted transactions.
+        incremental (bool): False once the backend did not report state changes.
+    """
+
+    block_number: Optional[int] = None
+    state_overrides: Dict[str, Dict] = {}
+    transactions: List[TransactionParams] = []
+    incremental: bool = True
+
+    def _simulate(
+        self, transactions: List[TransactionParams]
+    ) -> Steps[SimulationResult]:
+        backend = get_simulation_backend()
+        if self.block_number is None:
+            self.block_number = yield Io(
+                backend.get_block_number, backend.aget_block_number
+            )
+
+        results = None
+        if self.incremental:
+            results = yield Io(
+                backend.simulate_bundle,
+                backend.asimulate_bundle,
+                transactions,
+                self.block_number,
+                self.state_overrides,
+            )
+            results = self._check_incremental(results)
+        if results is None:
+            results = yield Io(
+                backend.simulate_bundle,
+                backend.asimulate_bundle,
+                self.transactions + transactions,
+                self.block_number,
+            )
+            results = results[len(self.transactions) :]
+        simulation_result = self._accept(transactions, results)
+        yield from _annotate_asset_changes(simulation_result.all_asset_changes())
+        return simulation_result
+
+    def simulate(self, transactions: List[TransactionParams]) -> SimulationResult:
+        """
+        Simulate the new transactions after the accepted ones.
+
+        The leading successful transactions are accepted, so their post-state is used by
+        the next call.
+
+        Args:
+            transactions (List[TransactionParams]): The new transactions.
+
+        Returns:
+            SimulationResult: The result of the new transactions only.
+        """
+        return run(self._simulate(transactions))
+
+    async def asimulate(self, transactions: List[TransactionParams]) -> SimulationResult:
+        """Async version of `simulate`."""
+        return await arun(self._simulate(transactions))
+
+    def _check_incremental(self, results: list[dict]) -> Optional[list[dict]]:
+        """Returns the results if the state can be carried forward, otherwise None."""
+        if all("stateChanges" in r for r in results):
+            return results
+        # The state cannot be carried forward, simulate the prefix from now on
+        self.incremental = False
+        # Without accepted transactions, the results do not depend on the prefix
+        return results if not self.transactions else None
+
+    def _accept(
+        self, transactions: List[TransactionParams], results: list[dict]
+    ) -> SimulationResult:
         sender = transactions[0].from_address
-        return _format_simulation_result(sender, response["result"])
-    raise SimulationError(f"Unexpected response: {response}")
+        simulation_result = _format_simulation_result(sender, results)
+
+        # Accept the leading successful transactions
+        for tx, result, tx_result in zip(
+            transactions, results, simulation_result.tx_results
+        ):
+            if tx_result.error or not result.get("status"):
+                break
+            self.transactions.append(tx)
+            if self.incremental:
+                self._apply_state_changes(result["stateChanges"])
+        return simulation_result
+
+    def _apply_state_changes(self, state_changes: list[dict]) -> None:
+        for change in state_changes:
+            override = self.state_overrides.setdefault(change["address"].lower(), {})
+            if change.get("nonce"):
+                override["nonce"] = change["nonce"]["newValue"]
+            if change.get("balance"):
+                override["balance"] = change["balance"]["newValue"]
+            for slot in change.get("storage") or []:
+                override.setdefault("stateDiff", {})[slot["slot"]] = slot["newValue"]
+
+
+def _missing_metadata(asset_changes: Iterable[AssetChange]) -> List[AssetChange]:
+    # Tokens the backend had no metadata for, e.g. missing from a local EVM snapshot
+    return [
+        change for change in asset_changes if change.contract_address and not change.symbol
+    ]
+
+
+def _apply_metadata(
+    asset_changes: List[AssetChange], tokens: Dict[str, TokenMetadata]
+) -> None:
+    for change in asset_changes:
+        token = tokens.get(Web3.to_checksum_address(change.contract_address))
+        if token is not None:
+            change.name = token.name
+            change.symbol = token.symbol
+            change.decimals = token.decimals
+
+
+def _annotate_asset_changes(asset_changes: Iterable[AssetChange]) -> Steps[None]:
+    missing = _missing_metadata(asset_changes)
+    if not missing:
+        return
+    try:
+        tokens = yield from token_metadata_steps(
+            change.contract_address for change in missing
+        )
+    except Exception as e:
+        print(f"Token metadata not resolved: {e}")
+        return
+    _apply_metadata(missing, tokens)
+
+
+def annotate_asset_changes(asset_changes: Iterable[AssetChange]) -> None:
+    """
+    Fill in the name, symbol and decimals of the tokens missing from asset changes.
+
+    The tokens are resolved together, from the token metadata store or else with one
+    Multicall3 call, so complete asset changes cost nothing. A failed lookup leaves the
+    asset changes as they are.
+
+    Args:
+        asset_changes (Iterable[AssetChange]): The asset changes, updated in place.
+    """
+    run(_annotate_asset_changes(asset_changes))
+
+
+async def aannotate_asset_changes(asset_changes: Iterable[AssetChange]) -> None:
+    """Async version of `annotate_asset_changes`."""
+    await arun(_annotate_asset_changes(asset_changes))
 
 
 def _extract_error_from_trace(trace_list: list[dict]) -> str:
@@ -0,0 +1,518 @@
+"""
+Simulation backends execute bundles of transactions and return the raw results.
+
+The results follow the shape of Tenderly's `tenderly_simulateBundle` response, so both
+backends are formatted into the same `SimulationResult` by the simulation module:
+each result has a `status`, a `trace` whose first call holds the sender, recipient and
+error, a list of `assetChanges` and optionally the `stateChanges` of the transaction.
+
+Classes:
+- SimulationBackend: Interface of a simulation backend.
+- TenderlyBackend: Simulates bundles with `tenderly_simulateBundle` over HTTPS.
+- LocalEVMBackend: Executes bundles in-process with py-evm from a recorded state snapshot.
+
+Functions:
+- get_simulation_backend: Returns the backend selected by `SIMULATION_BACKEND`.
+- record_snapshot: Records the accounts touched by transactions for the local backend.
+"""
+
+import os
+import json
+import asyncio
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from graph.metrics import record_simulation_payload
+from graph.tools.token_metadata import get_token_metadata_store
+from models.tx_params import TransactionParams
+from utils.http import request, arequest
+
+
+# keccak256("Transfer(address,address,uint256)")
+TRANSFER_TOPIC = 0xDDF252AD1BE2C89B69C2B068FC378DAA952BA7F163C4A11628F55A4DF523B3EF
+
+# Selector of `Error(string)`, used by `revert("reason")`
+_ERROR_SELECTOR = bytes.fromhex("08c379a0")
+
+_ZERO_ADDRESS = "0x" + "0" * 40
+
+
+class SimulationError(Exception):
+    """
+    Error raised when simulation fails.
+
+    Attributes:
+        message (str): The error message.
+    """
+
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
+
+
+class SimulationBackend(ABC):
+    """Interface of a simulation backend."""
+
+    @abstractmethod
+    def get_block_number(self) -> int:
+        """Returns the block number that simulations run on by default."""
+
+    @abstractmethod
+    def simulate_bundle(
+        self,
+        transactions: List[TransactionParams],
+        block_number: Optional[int] = None,
+        state_overrides: Optional[Dict[str, Dict]] = None,
+    ) -> List[dict]:
+        """
+        Simulate the transactions in order, each one on top of the state left by the previous ones.
+
+        Args:
+            transactions (List[TransactionParams]): The transactions to simulate.
+            block_number (Optional[int]): The block to simulate on. Defaults to the latest.
+            state_overrides (Optional[Dict[str, Dict]]): Account overrides by address with
+                optional `nonce`, `balance`, `code` and `stateDiff` (slot → value) entries.
+
+        Returns:
+            List[dict]: One raw result per transaction.
+        """
+
+    async def aget_block_number(self) -> int:
+        """Async version of `get_block_number`, runs the sync version in a thread by default."""
+        return await asyncio.to_thread(self.get_block_number)
+
+    async def asimulate_bundle(
+        self,
+        transactions: List[TransactionParams],
+        block_number: Optional[int] = None,
+        state_overrides: Optional[Dict[str, Dict]] = None,
+    ) -> List[dict]:
+        """Async version of `simulate_bundle`, runs the sync version in a thread by default."""
+        return await asyncio.to_thread(
+            self.simulate_bundle, transactions, block_number, state_overrides
+        )
+
+
+class TenderlyBackend(SimulationBackend):
+    """Simulates bundles on Tenderly's mainnet gateway."""
+
+    @property
+    def url(self) -> str:
+        TENDERLY_API_KEY = os.getenv("TENDERLY_API_KEY")
+        return f"https://mainnet.gateway.tenderly.co/{TENDERLY_API_KEY}"
+
+    @staticmethod
+    def _payload(method: str, params: list) -> dict:
+        return {"id": 0, "jsonrpc": "2.0", "method": method, "params": params}
+
+    @staticmethod
+    def _result(response: dict) -> Any:
+        if "error" in response:
+            print(response)
+            raise SimulationError(response["error"]["message"])
+        if "result" in response:
+            return response["result"]
+        raise SimulationError(f"Unexpected response: {response}")
+
+    @staticmethod
+    def _record_payload(method: str, response) -> None:
+        if method == "tenderly_simulateBundle":
+            record_simulation_payload(len(response.request.content), len(response.content))
+
+    def _call(self, method: str, params: list) -> Any:
+        data = self._payload(method, params)
+        # print(data) # TODO: Logger
+        response = request("POST", self.url, json=data)
+        self._record_payload(method, response)
+        return self._result(response.json())
+
+    async def _acall(self, method: str, params: list) -> Any:
+        data = self._payload(method, params)
+        response = await arequest("POST", self.url, json=data)
+        self._record_payload(method, response)
+        return self._result(response.json())
+
+    @staticmethod
+    def _bundle_params(
+        transactions: List[TransactionParams],
+        block_number: Optional[int],
+        state_overrides: Optional[Dict[str, Dict]],
+    ) -> list:
+        params = [
+            [
+                {
+                    "from": tx.from_address,
+                    "to": tx.to_address,
+                    "data": tx.data,
+                    "value": tx.value,
+                }
+                for tx in transactions
+            ],
+            hex(block_number) if block_number is not None else "latest",
+        ]
+        if state_overrides:
+            params.append(state_overrides)
+        return params
+
+    def get_block_number(self) -> int:
+        return int(self._call("eth_blockNumber", []), 16)
+
+    async def aget_block_number(self) -> int:
+        return int(await self._acall("eth_blockNumber", []), 16)
+
+    def simulate_bundle(
+        self,
+        transactions: List[TransactionParams],
+        block_number: Optional[int] = None,
+        state_overrides: Optional[Dict[str, Dict]] = None,
+    ) -> List[dict]:
+        params = self._bundle_params(transactions, block_number, state_overrides)
+        return self._call("tenderly_simulateBundle", params)
+
+    async def asimulate_bundle(
+        self,
+        transactions: List[TransactionParams],
+        block_number: Optional[int] = None,
+        state_overrides: Optional[Dict[str, Dict]] = None,
+    ) -> List[dict]:
+        params = self._bundle_params(transactions, block_number, state_overrides)
+        return await self._acall("tenderly_simulateBundle", params)
+
+
+class LocalEVMBackend(SimulationBackend):
+    """
+    Executes bundles in-process on py-evm, seeded from a recorded state snapshot.
+
+    The snapshot is a JSON file with the block context, the touched accounts and the
+    metadata of the tokens that may be transferred:
+
+        {
+            "block": {"number": 20800000, "timestamp": 1726000000, "gas_limit": 30000000},
+            "accounts": {"0x...": {"balance": "0x...", "nonce": 0, "code": "0x...",
+                                    "storage": {"0x0": "0x1"}}},
+            "tokens": {"0x...": {"name": "Tether USD", "symbol": "USDT", "decimals": 6}}
+        }
+
+    Asset changes are decoded from ERC-20 `Transfer` logs and from the value moved by the
+    transaction and its internal calls. Results do not include `stateChanges`, so a
+    simulation session re-executes the accepted prefix, which is cheap in-process.
+
+    Args:
+        snapshot_path (str): Path of the state snapshot.
+        gas_limit (int): Gas limit of each transaction.
+    """
+
+    def __init__(self, snapshot_path: str, gas_limit: int = 10_000_000):
+        try:
+            import eth  # noqa: F401
+        except ImportError as e:
+            raise ImportError(
+                "The local EVM backend requires py-evm: poetry install --extras local-evm"
+            ) from e
+        with open(snapshot_path) as file:
+            self.snapshot = json.load(file)
+        self.gas_limit = gas_limit
+        self.tokens = {
+            address.lower(): info
+            for address, info in self.snapshot.get("tokens", {}).items()
+        }
+
+    def get_block_number(self) -> int:
+        return int(self.snapshot.get("block", {}).get("number", 0))
+
+    def _create_chain(self):
+        from eth.chains.base import MiningChain
+        from eth.db.atomic import AtomicDB
+        from eth.vm.forks import CancunVM
+        from eth_utils import to_canonical_address, decode_hex
+
+        block = self.snapshot.get("block", {})
+        genesis_params = {
+            "coinbase": to_canonical_address(block.get("coinbase", _ZERO_ADDRESS)),
+            "difficulty": 0,
+            "gas_limit": int(block.get("gas_limit", 30_000_000)),
+            "timestamp": int(block.get("timestamp", 0)),
+            # Transactions are executed with a zero gas price
+            "base_fee_per_gas": 0,
+        }
+        genesis_state = {
+            to_canonical_address(address): {
+                "balance": _to_int(account.get("balance", 0)),
+                "nonce": _to_int(account.get("nonce", 0)),
+                "code": decode_hex(account.get("code", "0x")),
+                "storage": {
+                    _to_int(slot): _to_int(value)
+                    for slot, value in account.get("storage", {}).items()
+                },
+            }
+            for address, account in self.snapshot.get("accounts", {}).items()
+        }
+        chain_class = MiningChain.configure(
+            __name__="LocalSimulationChain",
+            vm_configuration=((0, CancunVM),),
+            chain_id=1,
+        )
+        return chain_class.from_genesis(AtomicDB(), genesis_params, genesis_state)
+
+    def simulate_bundle(
+        self,
+        transactions: List[TransactionParams],
+        block_number: Optional[int] = None,
+        state_overrides: Optional[Dict[str, Dict]] = None,
+    ) -> List[dict]:
+        from eth.vm.spoof import SpoofTransaction
+        from eth_utils import to_canonical_address, decode_hex
+
+        # The snapshot is recorded at a single block, `block_number` is informational
+        vm = self._create_chain().get_vm()
+        state = vm.state
+        for address, override in (state_overrides or {}).items():
+            canonical = to_canonical_address(address)
+            if "nonce" in override:
+                state.set_nonce(canonical, _to_int(override["nonce"]))
+            if "balance" in override:
+                state.set_balance(canonical, _to_int(override["balance"]))
+            if "code" in override:
+                state.set_code(canonical, decode_hex(override["code"]))
+            for slot, value in override.get("stateDiff", {}).items():
+                state.set_storage(canonical, _to_int(slot), _to_int(value))
+
+        results = []
+        for tx in transactions:
+            sender = to_canonical_address(tx.from_address)
+            unsigned = vm.create_unsigned_transaction(
+                nonce=state.get_nonce(sender),
+                gas_price=state.base_fee,
+                gas=self.gas_limit,
+                to=to_canonical_address(tx.to_address),
+                value=_to_int(tx.value),
+                data=decode_hex(tx.data),
+            )
+            try:
+                computation = state.apply_transaction(
+                    SpoofTransaction(unsigned, from_=sender)
+                )
+            except Exception as e:
+                # Invalid transactions, e.g. insufficient balance for the value
+                results.append(_failed_result(tx, str(e)))
+                continue
+            results.append(self._format_computation(tx, computation))
+        return results
+
+    def _format_computation(self, tx: TransactionParams, computation) -> dict:
+        trace = {"from": tx.from_address.lower(), "to": tx.to_address.lower()}
+        if computation.is_error:
+            trace["error"] = type(computation.error).__name__
+            reason = _decode_revert_reason(computation.output)
+            if reason:
+                trace["errorReason"] = reason
+            return {"status": False, "trace": [trace], "assetChanges": []}
+
+        asset_changes = self._native_asset_changes(computation)
+        for address, topics, data in computation.get_log_entries():
+            if len(topics) == 3 and topics[0] == TRANSFER_TOPIC and len(data) == 32:
+                asset_changes.append(
+                    self._asset_change(
+                        "0x" + address.hex(),
+                        _topic_to_address(topics[1]),
+                        _topic_to_address(topics[2]),
+                        int.from_bytes(data, "big"),
+                    )
+                )
+        return {"status": True, "trace": [trace], "assetChanges": asset_changes}
+
+    def _native_asset_changes(self, computation) -> List[dict]:
+        changes = []
+        pending = [computation]
+        while pending:
+            current = pending.pop(0)
+            if current.is_error:
+                continue
+            msg = current.msg
+            if msg.should_transfer_value and msg.value:
+                changes.append(
+                    self._asset_change(
+                        None,
+                        "0x" + msg.sender.hex(),
+                        "0x" + msg.storage_address.hex(),
+                        msg.value,
+                    )
+                )
+            pending.extend(current.children)
+        return changes
+
+    def _asset_change(
+        self, contract_address: Optional[str], sender: str, receiver: str, amount: int
+    ) -> dict:
+        if contract_address is None:
+            asset_info = {"name": "Ether", "symbol": "eth", "decimals": 18}
+        else:
+            token = self.tokens.get(contract_address.lower())
+            if token is None:
+                # Resolved by an earlier run, without a call to a node
+                stored = get_token_metadata_store().get(contract_address)
+                token = stored.model_dump() if stored else {}
+            asset_info = {
+                "name": token.get("name", ""),
+                "symbol": token.get("symbol", "").lower(),
+                "decimals": token.get("decimals", 0),
+                "contractAddress": contract_address,
+            }
+        change_type = "Transfer"
+        if sender == _ZERO_ADDRESS:
+            change_type = "Mint"
+        elif receiver == _ZERO_ADDRESS:
+            change_type = "Burn"
+        return {
+            "type": change_type,
+            "from": sender,
+            "to": receiver,
+            "rawAmount": hex(amount),
+            "assetInfo": asset_info,
+        }
+
+
+def _to_int(value) -> int:
+    if isinstance(value, str):
+        return int(value, 16) if value.startswith("0x") else int(value)
+    return int(value)
+
+
+def _topic_to_address(topic: int) -> str:
+    return "0x" + topic.to_bytes(32, "big")[-20:].hex()
+
+
+def _decode_revert_reason(output: bytes) -> str:
+    if not output or output[:4] != _ERROR_SELECTOR:
+        return ""
+    from eth_abi import decode
+
+    try:
+        return decode(["string"], output[4:])[0]
+    except Exception:
+        return ""
+
+
+def _failed_result(tx: TransactionParams, error: str) -> dict:
+    trace = {"from": tx.from_address.lower(), "to": tx.to_address.lower(), "error": error}
+    return {"status": False, "trace": [trace], "assetChanges": []}
+
+
+def _merge_prestate(accounts: Dict[str, Dict], prestate: Dict[str, Dict]) -> None:
+    """Add the accounts read by a transaction, keeping the values read before the bundle."""
+    for address, account in prestate.items():
+        merged = accounts.setdefault(address.lower(), {})
+        for field, value in account.items():
+            if field == "storage":
+                storage = merged.setdefault("storage", {})
+                for slot, slot_value in value.items():
+                    storage.setdefault(slot, slot_value)
+            else:
+                merged.setdefault(field, value)
+
+
+def _add_poststate(overrides: Dict[str, Dict], poststate: Dict[str, Dict]) -> None:
+    """Add the changes of a transaction to the state overrides of the next ones."""
+    for address, account in poststate.items():
+        override = overrides.setdefault(address.lower(), {})
+        if "balance" in account:
+            override["balance"] = account["balance"]
+        if "nonce" in account:
+            override["nonce"] = hex(_to_int(account["nonce"]))
+        if "code" in account:
+            override["code"] = account["code"]
+        if account.get("storage"):
+            override.setdefault("stateDiff", {}).update(account["storage"])
+
+
+def record_snapshot(
+    transactions: List[TransactionParams],
+    rpc_url: str,
+    path: str,
+    tokens: Optional[Dict[str, Dict]] = None,
+) -> dict:
+    """
+    Record a state snapshot of the accounts and storage touched by the transactions.
+
+    The transactions are a bundle: each one is traced on top of the changes of the
+    previous ones, passed as state overrides, so a transaction depending on an earlier
+    one (e.g. a swap after its approval) reads the same state as when it is simulated.
+    The snapshot keeps the value of each account field and storage slot before the
+    bundle, the first one read by any of the transactions.
+
+    The node behind `rpc_url` must support `debug_traceCall` with the `prestateTracer`,
+    its `diffMode` and `stateOverrides`.
+
+    Args:
+        transactions (List[TransactionParams]): The transactions to record the state for.
+        rpc_url (str): The JSON-RPC endpoint.
+        path (str): Where to write the snapshot.
+        tokens (Optional[Dict[str, Dict]]): Token metadata by address (name, symbol, decimals).
+
+    Returns:
+        dict: The snapshot.
+    """
+
+    def call(method: str, params: list) -> Any:
+        data = {"id": 0, "jsonrpc": "2.0", "method": method, "params": params}
+        response = request("POST", rpc_url, json=data).json()
+        if "error" in response:
+            raise SimulationError(response["error"]["message"])
+        return response["result"]
+
+    header = call("eth_getBlockByNumber", ["latest", False])
+    block = hex(int(header["number"], 16))
+    accounts: Dict[str, Dict] = {}
+    # Changes of the previous transactions of the bundle
+    overrides: Dict[str, Dict] = {}
+    for tx in transactions:
+        params = {
+            "from": tx.from_address,
+            "to": tx.to_address,
+            "data": tx.data,
+            "value": tx.value,
+        }
+        config = {"tracer": "prestateTracer", "stateOverrides": overrides}
+        prestate = call("debug_traceCall", [params, block, config])
+        diff = call(
+            "debug_traceCall",
+            [params, block, {**config, "tracerConfig": {"diffMode": True}}],
+        )
+        _merge_prestate(accounts, prestate)
+        _add_poststate(overrides, diff["post"])
+
+    snapshot = {
+        "block": {
+            "number": int(header["number"], 16),
+            "timestamp": int(header["timestamp"], 16),
+            "gas_limit": int(header["gasLimit"], 16),
+            "coinbase": header["miner"],
+        },
+        "accounts": accounts,
+        "tokens": tokens or {},
+    }
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as file:
+        json.dump(snapshot, file)
+    return snapshot
+
+
+@lru_cache
+def get_simulation_backend() -> SimulationBackend:
+    """
+    Returns the simulation backend shared by the process.
+
+    `SIMULATION_BACKEND` selects the backend (`tenderly` by default, or `local`), and
+    `SIMULATION_SNAPSHOT_PATH` is the state snapshot used by the local backend.
+    """
+    name = os.getenv("SIMULATION_BACKEND", "tenderly").strip().lower()
+    if name == "tenderly":
+        return TenderlyBackend()
+    if name == "local":
+        return LocalEVMBackend(
+            os.getenv("SIMULATION_SNAPSHOT_PATH", "data/simulation/snapshot.json")
+        )
+    raise ValueError("SIMULATION_BACKEND must be one of: tenderly, local")
@@ -1,8 +1,18 @@
 from langchain_core.tools import tool
 
-from graph.tools.abi import fetch_contract_abi
 from graph.tools.address import convert_to_checksum_address
-from graph.tools import w3
+from graph.tools.token_metadata import token_metadata_steps
+from utils.steps import Steps, arun, run
+
+
+def _token_info(token_address: str) -> Steps[dict]:
+    # The metadata never changes, it is only fetched the first time
+    address = convert_to_checksum_address.invoke(token_address)
+    tokens = yield from token_metadata_steps([address])
+    token = tokens.get(address)
+    if token is None:
+        raise ValueError(f"Not an ERC-20 token: {address}")
+    return token.model_dump()
 
 
 @tool
@@ -20,25 +30,16 @@ def get_token_info(token_address: str) -> dict:
         token_info = get_token_info('0xae7ab96520de3a18e5e111b5eaab095312d7fe84')
         print(token_info)  # Outputs: {'decimals': 18, 'symbol': 'stETH', 'name': 'Lido Staked Ether'}
     """
-    # Create the contract object
-    contract = w3.eth.contract(
-        address=convert_to_checksum_address.invoke(token_address),
-        abi=fetch_contract_abi.invoke(
-            {"contract_address": token_address, "contract_type": "erc20"}
-        ),
-    )
-
-    with w3.batch_requests() as batch:
-        batch.add(contract.functions.symbol())
-        batch.add(contract.functions.name())
-        batch.add(contract.functions.decimals())
-        responses = batch.execute()
-
-    return {
-        "symbol": responses[0],
-        "name": responses[1],
-        "decimals": responses[2],
-    }
+    return run(_token_info(token_address))
+
+
+async def aget_token_info(token_address: str) -> dict:
+    """Async version of `get_token_info`."""
+    return await arun(_token_info(token_address))
+
+
+# Native async entry point, used by `ainvoke`
+get_token_info.coroutine = aget_token_info
 
 
 @tool
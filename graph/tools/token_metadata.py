@@ -0,0 +1,279 @@
+"""
+The token metadata of ERC-20 contracts, resolved in bulk and persisted on disk.
+
+The symbol, name and decimals of a deployed token never change, so they are resolved once
+and kept in a SQLite store shared by the processes. Tokens missing from the store are
+resolved together with one `eth_call` to Multicall3 `aggregate3`, which calls `symbol`,
+`name` and `decimals` of every token and lets each call fail on its own. Large requests
+are split into several `aggregate3` calls sent as one JSON-RPC batch.
+
+Non-standard tokens returning `bytes32` instead of `string`, e.g. MKR, are supported.
+A contract whose `decimals` call fails or returns garbage is not a token and is left out.
+
+Classes:
+- TokenMetadata: The symbol, name and decimals of a token.
+- TokenMetadataStore: SQLite-backed store keyed by checksum address.
+
+Functions:
+- get_token_metadata_store: Returns the shared store for the process.
+- get_token_metadata / aget_token_metadata: Resolves the metadata of many tokens.
+- token_metadata_steps: The steps of both, to compose them with other steps.
+"""
+
+import os
+import time
+import sqlite3
+import threading
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from eth_abi import decode, encode
+from pydantic import BaseModel
+from web3 import Web3
+
+from graph.tools.rpc import abatch, batch, eth_call_params
+from utils.steps import Io, Steps, arun, run
+
+
+# Location of the store, can be overridden for tests and workers with a shared volume
+TOKEN_METADATA_PATH = os.getenv("TOKEN_METADATA_PATH", "data/token_metadata.sqlite3")
+
+# Deployed at the same address on every chain
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+
+# aggregate3((address target, bool allowFailure, bytes callData)[])
+_AGGREGATE3_SELECTOR = bytes.fromhex("82ad56cb")
+
+# Selectors of the ERC-20 metadata functions
+_SYMBOL_SELECTOR = bytes.fromhex("95d89b41")
+_NAME_SELECTOR = bytes.fromhex("06fdde03")
+_DECIMALS_SELECTOR = bytes.fromhex("313ce567")
+
+# Tokens of one aggregate3 call, three calls each, well below the gas limit of eth_call
+_MAX_TOKENS_PER_CALL = 100
+
+# SQLite limits the number of parameters of a query
+_MAX_QUERY_PARAMS = 500
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tokens (
+    address TEXT PRIMARY KEY,
+    symbol TEXT NOT NULL,
+    name TEXT NOT NULL,
+    decimals INTEGER NOT NULL,
+    updated_at INTEGER NOT NULL
+);
+"""
+
+
+class TokenMetadata(BaseModel):
+    symbol: str
+    name: str
+    decimals: int
+
+
+class TokenMetadataStore:
+    """
+    Persistent token metadata store.
+
+    Addresses are always stored in checksum format. Entries do not expire, the metadata
+    of a deployed token does not change.
+
+    Args:
+        path (str): Path of the SQLite database file.
+    """
+
+    def __init__(self, path: str = TOKEN_METADATA_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Tools run in worker threads, so the connection is shared behind a lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+
+    def get_many(self, addresses: Iterable[str]) -> Dict[str, TokenMetadata]:
+        """
+        Get the stored metadata of the tokens.
+
+        Args:
+            addresses (Iterable[str]): The token addresses.
+
+        Returns:
+            Dict[str, TokenMetadata]: The metadata by checksum address, of the stored tokens only.
+        """
+        keys = list({Web3.to_checksum_address(address) for address in addresses})
+        rows = []
+        with self._lock:
+            for i in range(0, len(keys), _MAX_QUERY_PARAMS):
+                chunk = keys[i : i + _MAX_QUERY_PARAMS]
+                rows += self._conn.execute(
+                    "SELECT address, symbol, name, decimals FROM tokens "
+                    f"WHERE address IN ({', '.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+        return {
+            address: TokenMetadata(symbol=symbol, name=name, decimals=decimals)
+            for address, symbol, name, decimals in rows
+        }
+
+    def get(self, address: str) -> Optional[TokenMetadata]:
+        """Get the stored metadata of a token, or None if unknown."""
+        return self.get_many([address]).get(Web3.to_checksum_address(address))
+
+    def put_many(self, tokens: Dict[str, TokenMetadata]) -> None:
+        """Store the metadata of the tokens, keyed by address."""
+        now = int(time.time())
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO tokens (address, symbol, name, decimals, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (
+                        Web3.to_checksum_address(address),
+                        token.symbol,
+                        token.name,
+                        token.decimals,
+                        now,
+                    )
+                    for address, token in tokens.items()
+                ],
+            )
+
+    def stats(self) -> Dict[str, int]:
+        """Return the number of stored tokens."""
+        with self._lock:
+            return {
+                "tokens": self._conn.execute("SELECT COUNT(*) FROM tokens").fetchone()[0]
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+@lru_cache
+def get_token_metadata_store() -> TokenMetadataStore:
+    """Returns the token metadata store shared by the process."""
+    return TokenMetadataStore()
+
+
+def _decode_text(data: bytes) -> Optional[str]:
+    """Decode a `string` return value, or a `bytes32` one as returned by MKR or SAI."""
+    if len(data) == 32:
+        return data.rstrip(b"\x00").decode("utf-8", errors="ignore")
+    try:
+        return decode(["string"], data)[0]
+    except Exception:
+        return None
+
+
+def _decode_decimals(data: bytes) -> Optional[int]:
+    if len(data) != 32:
+        return None
+    decimals = int.from_bytes(data, "big")
+    # Some contracts answer any selector, the value would not fit an uint8
+    return decimals if decimals <= 255 else None
+
+
+def _aggregate3_params(addresses: List[str]) -> list:
+    calls = [
+        (address, True, selector)
+        for address in addresses
+        for selector in (_SYMBOL_SELECTOR, _NAME_SELECTOR, _DECIMALS_SELECTOR)
+    ]
+    data = _AGGREGATE3_SELECTOR + encode(["(address,bool,bytes)[]"], [calls])
+    return eth_call_params(MULTICALL3_ADDRESS, "0x" + data.hex())
+
+
+def _aggregate3_calls(addresses: List[str]) -> List[Tuple[str, list]]:
+    """Returns the eth_call requests resolving the addresses, chunked."""
+    return [
+        ("eth_call", _aggregate3_params(addresses[i : i + _MAX_TOKENS_PER_CALL]))
+        for i in range(0, len(addresses), _MAX_TOKENS_PER_CALL)
+    ]
+
+
+def _decode_aggregate3(
+    addresses: List[str], outputs: List[str]
+) -> Dict[str, TokenMetadata]:
+    """Decode the outputs of the chunked aggregate3 calls into the metadata of the tokens."""
+    results: List[Tuple[bool, bytes]] = []
+    for output in outputs:
+        results += decode(["(bool,bytes)[]"], bytes.fromhex(output[2:]))[0]
+
+    tokens = {}
+    for i, address in enumerate(addresses):
+        (symbol_ok, symbol), (name_ok, name), (decimals_ok, decimals) = results[
+            3 * i : 3 * i + 3
+        ]
+        decimals = _decode_decimals(decimals) if decimals_ok else None
+        if decimals is None:
+            continue
+        tokens[address] = TokenMetadata(
+            symbol=(_decode_text(symbol) if symbol_ok else None) or "",
+            name=(_decode_text(name) if name_ok else None) or "",
+            decimals=decimals,
+        )
+    return tokens
+
+
+def _split_cached(
+    addresses: Iterable[str],
+) -> Tuple[Dict[str, TokenMetadata], List[str]]:
+    """Returns the stored metadata and the checksum addresses missing from the store."""
+    keys = list(dict.fromkeys(Web3.to_checksum_address(a) for a in addresses))
+    cached = get_token_metadata_store().get_many(keys)
+    return cached, [address for address in keys if address not in cached]
+
+
+def token_metadata_steps(addresses: Iterable[str]) -> Steps[Dict[str, TokenMetadata]]:
+    """The steps of `get_token_metadata`, to compose it with other steps."""
+    tokens, missing = _split_cached(addresses)
+    if missing:
+        outputs = yield Io(batch, abatch, _aggregate3_calls(missing))
+        resolved = _decode_aggregate3(missing, outputs)
+        get_token_metadata_store().put_many(resolved)
+        tokens.update(resolved)
+    return tokens
+
+
+def get_token_metadata(addresses: Iterable[str]) -> Dict[str, TokenMetadata]:
+    """
+    Resolve the metadata of the tokens, from the store or else with Multicall3.
+
+    Args:
+        addresses (Iterable[str]): The token addresses.
+
+    Returns:
+        Dict[str, TokenMetadata]: The metadata by checksum address. Addresses that are
+        not ERC-20 tokens are left out.
+
+    Example:
+        >>> get_token_metadata(["0xae7ab96520de3a18e5e111b5eaab095312d7fe84"])
+        {'0xae7ab96520DE3A18E5e111B5EaAb095312D7fE84': TokenMetadata(symbol='stETH', name='Liquid staked Ether 2.0', decimals=18)}
+    """
+    return run(token_metadata_steps(addresses))
+
+
+async def aget_token_metadata(addresses: Iterable[str]) -> Dict[str, TokenMetadata]:
+    """Async version of `get_token_metadata`."""
+    return await arun(token_metadata_steps(addresses))
+
+
+if __name__ == "__main__":
+    # MKR returns its symbol as bytes32
+    tokens = get_token_metadata(
+        [
+            "0xae7ab96520de3a18e5e111b5eaab095312d7fe84",
+            "0x9f8f72aa9304c8b593d555f12ef6589cc3a579a2",
+        ]
+    )
+    for address, token in tokens.items():
+        print(address, token)
+    mkr = Web3.to_checksum_address("0x9f8f72aa9304c8b593d555f12ef6589cc3a579a2")
+    assert tokens[mkr].symbol == "MKR"
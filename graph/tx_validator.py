@@ -0,0 +1,200 @@
+"""
+The transaction validator checks converted transaction parameters against their step, without any network call.
+
+The calldata is decoded with the local selector index, then compared with the action,
+amount, token and recipient of the step description:
+
+- "Send 0.1 ETH to 0x8c57...B360"      → no calldata, the value and recipient match
+- "Transfer 100 USDT to 0x8c57...B360" → `transfer` on the USDT contract, with the amount
+                                         and recipient among the arguments
+- "Approve 100 USDT for Uniswap"       → `approve` on the USDT contract with the amount
+- "Swap 100 USDT to USDC on Uniswap"   → the amount among the value and arguments
+
+Calls wrapped in `bytes` arguments, e.g. the calls of a Uniswap V3 `multicall`, are
+decoded too and their arguments searched for the amount.
+
+Only what is known locally is checked: token decimals come from the registry or the token
+metadata store, and calldata with an unknown selector or a recipient given as an ENS name
+is not checked, nor is the amount when a call wrapped in `bytes` does not decode. A step
+that does not start with an action directly followed by an amount, e.g.
+"Swap USDT for 100 USDC", is not checked: the amount may then be an output amount.
+
+Functions:
+- check_tx_params: Returns the mismatches between a step description and its transaction parameters.
+"""
+
+import re
+from decimal import Decimal
+from typing import Any, List, Optional, Tuple
+
+from graph.tools.registry import get_registry
+from graph.tools.selector_index import DecodedCall, SelectorIndex, get_selector_index
+from graph.tools.token_metadata import get_token_metadata_store
+from models.tx_params import TransactionParams
+
+
+_STEP = re.compile(
+    r"^(?P<action>send|transfer|approve|swap|stake|deposit|supply|wrap) "
+    r"(?P<amount>\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?) "
+    r"(?P<token>[A-Za-z][A-Za-z0-9]*)\b",
+    re.I,
+)
+_RECIPIENT = re.compile(r"\bto (?:the address )?(?P<recipient>0x[0-9a-fA-F]{40})\b", re.I)
+
+# Functions a token step of each action may call
+_FUNCTIONS = {
+    "send": {"transfer"},
+    "transfer": {"transfer"},
+    "approve": {"approve", "increaseAllowance"},
+}
+
+# Levels of calls wrapped in bytes arguments that are decoded, e.g. multicall → swap
+_MAX_NESTING = 3
+
+
+def _scalars(value: Any) -> List[Any]:
+    """Flatten the arrays and tuples of a decoded argument."""
+    if isinstance(value, (list, tuple)):
+        return [item for element in value for item in _scalars(element)]
+    return [value]
+
+
+def _call_scalars(
+    call: DecodedCall, index: SelectorIndex, depth: int = 0
+) -> Tuple[List[Any], bool]:
+    """
+    The scalar arguments of a call and of the calls wrapped in its bytes arguments.
+
+    Returns:
+        Tuple[List[Any], bool]: The arguments, and whether a bytes argument shaped like
+        calldata could not be decoded, in which case the arguments may miss some values.
+    """
+    scalars, opaque = [], False
+    for value in _scalars(list(call.arguments.values())):
+        # Calldata is a selector followed by 32-byte words, unlike e.g. a V3 swap path
+        if not isinstance(value, bytes) or len(value) < 4 or (len(value) - 4) % 32:
+            scalars.append(value)
+            continue
+        inner = index.decode("0x" + value.hex()) if depth < _MAX_NESTING else None
+        if inner is None:
+            # A call of an unknown function
+            scalars.append(value)
+            opaque = True
+            continue
+        inner_scalars, inner_opaque = _call_scalars(inner, index, depth + 1)
+        scalars.extend(inner_scalars)
+        opaque = opaque or inner_opaque
+    return scalars, opaque
+
+
+def _int(value: str) -> int:
+    try:
+        return int(value, 16)
+    except ValueError:
+        return 0
+
+
+def _decimals(token: str, tx_params: TransactionParams) -> Optional[int]:
+    """Returns the decimals of the token of the step, if known locally."""
+    if token.lower() == "eth":
+        return 18
+    entry = get_registry().exact(token, kind="token")
+    if entry is not None and entry.decimals is not None:
+        return entry.decimals
+    # A transfer or an approval is sent to the token itself
+    stored = get_token_metadata_store().get(tx_params.to_address)
+    if stored is not None and stored.symbol.lower() == token.lower():
+        return stored.decimals
+    return None
+
+
+def _check_amount(
+    amount: str, token: str, tx_params: TransactionParams, call: Optional[DecodedCall]
+) -> Optional[str]:
+    decimals = _decimals(token, tx_params)
+    if decimals is None:
+        return None
+    raw = Decimal(amount) * 10**decimals
+    if raw != raw.to_integral_value():
+        return f"{amount} {token} has more than {decimals} decimals"
+    amounts = {_int(tx_params.value)}
+    opaque = False
+    if call is not None:
+        arguments, opaque = _call_scalars(call, get_selector_index())
+        amounts.update(
+            value
+            for value in arguments
+            if isinstance(value, int) and not isinstance(value, bool)
+        )
+    if int(raw) not in amounts and not opaque:
+        return (
+            f"The amount {amount} {token} ({int(raw)}) is neither the value nor an argument"
+        )
+    return None
+
+
+def check_tx_params(description: str, tx_params: TransactionParams) -> List[str]:
+    """
+    Check that transaction parameters do what their step description says.
+
+    Args:
+        description (str): The step description, e.g. "Transfer 100 USDT to 0x8c57...B360".
+        tx_params (TransactionParams): The transaction parameters of the step.
+
+    Returns:
+        List[str]: The mismatches, empty if the parameters match or cannot be checked.
+
+    Example:
+        >>> check_tx_params("Approve 100 USDT for Uniswap", tx_params)
+        ['The amount 100 USDT (100000000) is neither the value nor an argument']
+    """
+    match = _STEP.match(" ".join(description.split()))
+    if not match:
+        return []
+    action, token = match["action"].lower(), match["token"]
+    is_eth = token.lower() == "eth"
+    data = tx_params.data.lower()
+    has_data = len(data) > 2
+
+    index = get_selector_index()
+    call = index.decode(data) if has_data else None
+    if has_data and call is None:
+        signatures = [signature.text for signature in index.lookup(data[:10])]
+        if not signatures:
+            # Unknown function, nothing else can be checked
+            return []
+        return [f"The calldata does not decode as {' or '.join(signatures)}"]
+
+    mismatches = []
+    if action in _FUNCTIONS:
+        if is_eth and has_data:
+            mismatches.append(f"An ETH transfer has no calldata, got {call.signature}")
+        elif not is_eth and (call is None or call.name not in _FUNCTIONS[action]):
+            expected = " or ".join(sorted(_FUNCTIONS[action]))
+            got = call.signature if call else "no calldata"
+            mismatches.append(f"Expected a call to {expected} to {action} {token}, got {got}")
+
+        entry = None if is_eth else get_registry().exact(token, kind="token")
+        if entry is not None and entry.address.lower() != tx_params.to_address.lower():
+            mismatches.append(
+                f"The transaction is sent to {tx_params.to_address}, "
+                f"not to {token} ({entry.address})"
+            )
+
+    amount = match["amount"].replace(",", "")
+    mismatch = _check_amount(amount, token, tx_params, call)
+    if mismatch:
+        mismatches.append(mismatch)
+
+    recipient = _RECIPIENT.search(description)
+    if recipient and action in ("send", "transfer") and (is_eth or call is not None):
+        if is_eth:
+            recipients = [tx_params.to_address]
+        else:
+            arguments = _scalars(list(call.arguments.values()))
+            recipients = [value for value in arguments if isinstance(value, str)]
+        if recipient["recipient"].lower() not in {r.lower() for r in recipients}:
+            mismatches.append(
+                f"The recipient {recipient['recipient']} is not in the transaction"
+            )
+    return mismatches
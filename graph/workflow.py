@@ -0,0 +1,161 @@
+"""
+The plan-simulate workflow: plan the user's intent, then convert, simulate and replan each step.
+
+Leading steps that do not depend on each other's outputs are converted concurrently and
+validated with a single bundle simulation. The remaining steps go through the sequential
+convert → simulate → replan loop.
+
+Converted transactions are checked against their step with the local calldata decoder
+first, a transaction that does not match is replanned without a simulation.
+
+Function:
+- get_app: Returns the compiled plan-simulate graph.
+"""
+
+import asyncio
+from functools import lru_cache
+from typing import Literal
+
+from langgraph.graph import StateGraph, END
+from langgraph.graph.graph import CompiledGraph
+
+from graph.converter_tool import generate_tx_params
+from graph.planner import aplan
+from graph.replanner import replan_step
+from graph.scheduler import count_independent_steps
+from graph.state import PlanSimulateState
+from graph.tools.address import convert_to_checksum_address
+from graph.tools.simulation import SimulationSession
+from graph.tx_validator import check_tx_params
+
+
+async def plan_step(state: PlanSimulateState):
+    checksum_from_address = convert_to_checksum_address.invoke(
+        {"address": state["from_address"]}
+    )
+    plan = await aplan(state["input"])
+    steps = [step.description for step in plan.steps]
+    return {"from_address": checksum_from_address, "steps": steps}
+
+
+async def speculate_step(state: PlanSimulateState):
+    """Convert the leading independent steps concurrently and simulate them as one bundle."""
+    steps = state["steps"]
+    count = count_independent_steps(steps)
+    if count < 2:
+        return {}
+
+    results = await asyncio.gather(
+        *[generate_tx_params(step, state["from_address"]) for step in steps[:count]],
+        return_exceptions=True,
+    )
+    # Steps after a failed conversion are left to the sequential path
+    batch = []
+    for step, tx_params in zip(steps, results):
+        if isinstance(tx_params, Exception) or check_tx_params(step, tx_params):
+            break
+        batch.append((step, tx_params))
+    if not batch:
+        return {}
+
+    session = state.get("simulation_session") or SimulationSession()
+    result = await session.asimulate([tx_params for _, tx_params in batch])
+
+    accepted = []
+    for (step, tx_params), tx_result in zip(batch, result.tx_results):
+        if tx_result.error:
+            # Keep the failed step, it is retried through the sequential path
+            return {
+                "simulated_txs": accepted,
+                "steps": steps[len(accepted) :],
+                "current_step": (step, tx_params),
+                "error": tx_result.error,
+                "simulation_session": session,
+            }
+        accepted.append((step, tx_params, tx_result.asset_changes))
+
+    return {
+        "simulated_txs": accepted,
+        "steps": steps[len(accepted) :],
+        "error": None,
+        "simulation_session": session,
+    }
+
+
+async def convert_step(state: PlanSimulateState):
+    step = state["steps"][0]
+    tx_params = await generate_tx_params(step, state["from_address"])
+    return {"current_step": (step, tx_params)}
+
+
+async def simulate_step(state: PlanSimulateState):
+    step, tx_params = state["current_step"]
+    # A transaction that does not do what the step says is rejected without simulating it
+    mismatches = check_tx_params(step, tx_params)
+    if mismatches:
+        return {"error": f"Transaction does not match the step: {'; '.join(mismatches)}"}
+    # Only the new transaction is simulated, on top of the already simulated ones
+    session = state.get("simulation_session") or SimulationSession()
+    result = await session.asimulate([tx_params])
+    # Get the result of the last transaction
+    last_tx_result = result.tx_results[-1]
+    # If the last transaction is successful, add it to the list of simulated transactions
+    if not last_tx_result.error:
+        return {
+            "simulated_txs": [(step, tx_params, last_tx_result.asset_changes)],
+            # Remove the current step if the simulation is successful
+            "steps": state["steps"][1:],
+            "error": None,
+            "simulation_session": session,
+        }
+    else:
+        return {"error": last_tx_result.error, "simulation_session": session}
+
+
+def should_replan(state: PlanSimulateState) -> Literal["replan", "__end__"]:
+    steps = state.get("steps")
+    if steps:
+        # If there are steps, continue the workflow
+        return "replan"
+    else:
+        return "__end__"
+
+
+def after_speculation(
+    state: PlanSimulateState,
+) -> Literal["convert", "replan", "__end__"]:
+    # Nothing was speculated, start the sequential path right away
+    if not state.get("simulated_txs") and not state.get("error"):
+        return "convert" if state.get("steps") else "__end__"
+    return should_replan(state)
+
+
+@lru_cache
+def get_app() -> CompiledGraph:
+    """
+    Returns the compiled graph.
+    Returns:
+        app (CompiledGraph): The plan-simulate workflow.
+    """
+    workflow = StateGraph(PlanSimulateState)
+    # Add nodes
+    workflow.add_node("planner", plan_step)
+    workflow.add_node("speculator", speculate_step)
+    workflow.add_node("converter", convert_step)
+    workflow.add_node("simulator", simulate_step)
+    workflow.add_node("replanner", replan_step)
+
+    # Add edges
+    workflow.set_entry_point("planner")
+    workflow.add_edge("planner", "speculator")
+    workflow.add_conditional_edges(
+        "speculator",
+        after_speculation,
+        {"convert": "converter", "replan": "replanner", "__end__": END},
+    )
+    workflow.add_edge("converter", "simulator")
+    workflow.add_edge("replanner", "converter")
+    workflow.add_conditional_edges(
+        "simulator", should_replan, {"replan": "replanner", "__end__": END}
+    )
+    return workflow.compile()
@@ -0,0 +1,22 @@
+import os
+import tempfile
+
+import pytest
+
+# The stores are created on import, keep them out of the working tree
+_DATA_DIR = tempfile.mkdtemp(prefix="tx-generator-tests-")
+os.environ.setdefault("ABI_STORE_PATH", os.path.join(_DATA_DIR, "abi_store.sqlite3"))
+os.environ.setdefault(
+    "TOKEN_METADATA_PATH", os.path.join(_DATA_DIR, "token_metadata.sqlite3")
+)
+os.environ.setdefault("PLAN_CACHE_PATH", "")
+os.environ.setdefault("STEP_TEMPLATES_PATH", "")
+
+# ABI files and registries are read relative to the repository root
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True)
+def no_tracing(monkeypatch):
+    # The graph modules enable LangSmith tracing on import
+    monkeypatch.setenv("LANGCHAIN_TRACING_V2", "false")
@@ -0,0 +1,182 @@
+"""
+A JSON-RPC node on py-evm answering `debug_traceCall` with the `prestateTracer`.
+
+Implements what `record_snapshot` needs from a node: `eth_getBlockByNumber` and
+`debug_traceCall` with `stateOverrides` and the `diffMode` of the `prestateTracer`, in
+the format of geth. Requests are served through an `httpx.MockTransport`.
+"""
+
+import json
+from typing import Callable, Dict, Set
+
+import httpx
+
+from eth.vm.spoof import SpoofTransaction
+from eth_utils import decode_hex, to_canonical_address
+
+
+# State methods taking the address of an account first
+_ACCOUNT_METHODS = (
+    "account_exists",
+    "account_is_empty",
+    "delete_account",
+    "delta_balance",
+    "get_balance",
+    "get_code",
+    "get_code_hash",
+    "get_nonce",
+    "has_code_or_nonce",
+    "increment_nonce",
+    "set_balance",
+    "set_code",
+    "set_nonce",
+    "touch_account",
+)
+# State methods taking the address and a storage slot
+_STORAGE_METHODS = ("get_storage", "set_storage")
+
+
+def _to_int(value) -> int:
+    if isinstance(value, str):
+        return int(value, 16) if value.startswith("0x") else int(value)
+    return int(value)
+
+
+def _word(value: int) -> str:
+    return "0x" + value.to_bytes(32, "big").hex()
+
+
+def _record_accesses(state, touched: Dict[bytes, Set[int]]) -> None:
+    """Record the accounts and slots read or written through the state."""
+
+    def wrap(method, with_slot: bool):
+        def wrapper(*args, **kwargs):
+            address = kwargs["address"] if "address" in kwargs else args[0]
+            slots = touched.setdefault(address, set())
+            if with_slot:
+                slots.add(kwargs["slot"] if "slot" in kwargs else args[1])
+            return method(*args, **kwargs)
+
+        return wrapper
+
+    for name in _ACCOUNT_METHODS:
+        setattr(state, name, wrap(getattr(state, name), with_slot=False))
+    for name in _STORAGE_METHODS:
+        setattr(state, name, wrap(getattr(state, name), with_slot=True))
+
+
+def _read_accounts(state, touched: Dict[bytes, Set[int]]) -> Dict[str, dict]:
+    """Read the touched accounts and slots, in the format of the prestateTracer."""
+    accounts = {}
+    for address, slots in touched.items():
+        account = {"balance": hex(state.get_balance(address))}
+        nonce = state.get_nonce(address)
+        if nonce:
+            account["nonce"] = nonce
+        code = state.get_code(address)
+        if code:
+            account["code"] = "0x" + code.hex()
+        storage = {
+            _word(slot): _word(state.get_storage(address, slot)) for slot in sorted(slots)
+        }
+        if storage:
+            account["storage"] = storage
+        accounts["0x" + address.hex()] = account
+    return accounts
+
+
+def _diff(pre: Dict[str, dict], post: Dict[str, dict]) -> Dict[str, dict]:
+    """The changed fields and slots of each account, as `post` in diff mode."""
+    changes = {}
+    for address, after in post.items():
+        before = pre[address]
+        changed = {
+            field: value
+            for field, value in after.items()
+            if field != "storage" and before.get(field) != value
+        }
+        storage = {
+            slot: value
+            for slot, value in after.get("storage", {}).items()
+            if before.get("storage", {}).get(slot) != value
+        }
+        if storage:
+            changed["storage"] = storage
+        if changed:
+            changes[address] = changed
+    return changes
+
+
+class TracingNode:
+    """
+    A node serving a py-evm chain at a single block.
+
+    Args:
+        create_vm (Callable): Returns a fresh VM on the state of the block, called for
+            every traced call so calls do not see each other.
+        header (dict): The header returned by `eth_getBlockByNumber`.
+    """
+
+    def __init__(self, create_vm: Callable, header: dict):
+        self.create_vm = create_vm
+        self.header = header
+        self.requests = []
+
+    def _new_state(self, overrides: dict):
+        vm = self.create_vm()
+        state = vm.state
+        for address, override in (overrides or {}).items():
+            canonical = to_canonical_address(address)
+            if "balance" in override:
+                state.set_balance(canonical, _to_int(override["balance"]))
+            if "nonce" in override:
+                state.set_nonce(canonical, _to_int(override["nonce"]))
+            if "code" in override:
+                state.set_code(canonical, decode_hex(override["code"]))
+            for slot, value in override.get("stateDiff", {}).items():
+                state.set_storage(canonical, _to_int(slot), _to_int(value))
+        return vm, state
+
+    def trace_call(self, params: dict, config: dict) -> dict:
+        overrides = config.get("stateOverrides")
+        vm, state = self._new_state(overrides)
+        touched: Dict[bytes, Set[int]] = {}
+        _record_accesses(state, touched)
+        sender = to_canonical_address(params["from"])
+        transaction = vm.create_unsigned_transaction(
+            nonce=state.get_nonce(sender),
+            gas_price=0,
+            gas=10_000_000,
+            to=to_canonical_address(params["to"]),
+            value=_to_int(params.get("value", 0)),
+            data=decode_hex(params.get("data", "0x")),
+        )
+        state.apply_transaction(SpoofTransaction(transaction, from_=sender))
+        post = _read_accounts(state, touched)
+
+        # The values before the call, on a fresh state with the same overrides
+        _, state = self._new_state(overrides)
+        pre = _read_accounts(state, touched)
+        if config.get("tracerConfig", {}).get("diffMode"):
+            changes = _diff(pre, post)
+            return {"pre": {address: pre[address] for address in changes}, "post": changes}
+        return pre
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        payload = json.loads(request.content)
+        self.requests.append(payload)
+        method, params = payload["method"], payload["params"]
+        if method == "eth_getBlockByNumber":
+            result = self.header
+        elif method == "debug_traceCall":
+            call, _, config = params
+            if config.get("tracer") != "prestateTracer":
+                raise ValueError(f"Unsupported tracer: {config.get('tracer')}")
+            result = self.trace_call(call, config)
+        else:
+            error = {"code": -32601, "message": f"Unsupported method: {method}"}
+            return httpx.Response(200, json={"jsonrpc": "2.0", "id": 0, "error": error})
+        return httpx.Response(200, json={"jsonrpc": "2.0", "id": 0, "result": result})
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
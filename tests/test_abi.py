@@ -0,0 +1,179 @@
+import json
+import asyncio
+
+import httpx
+import pytest
+
+from graph.tools import abi
+from graph.tools.abi_store import AbiStore
+from utils.steps import run
+
+
+_PROXY = "0xae7ab96520DE3A18E5e111B5EaAb095312D7fE84"
+_IMPLEMENTATION = "0x17144556fd3424EDC8Fc8A4C940B2D04936d17eb"
+
+
+def _function(name: str, inputs: list) -> dict:
+    return {"type": "function", "name": name, "inputs": inputs, "outputs": []}
+
+
+class _Etherscan:
+    """Answers `getsourcecode` and `getabi`, with an ABI that can change over time."""
+
+    def __init__(self):
+        self.implementation = _IMPLEMENTATION
+        self.abi = [_function("submit", [{"name": "_referral", "type": "address"}])]
+        self.requests = []
+
+    def __call__(self, method: str, url: str, params: dict) -> httpx.Response:
+        self.requests.append((params["action"], params["address"]))
+        if params["action"] == "getsourcecode":
+            implementation = self.implementation if params["address"] == _PROXY else ""
+            result = [{"Implementation": implementation}]
+        else:
+            result = json.dumps(self.abi)
+        return httpx.Response(200, json={"status": "1", "result": result})
+
+
+def _fetch(address: str) -> list:
+    return run(abi._fetch_abi_from_remote(address))
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = AbiStore(str(tmp_path / "abi_store.sqlite3"))
+    monkeypatch.setattr(abi, "get_abi_store", lambda: store)
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def etherscan(monkeypatch):
+    etherscan = _Etherscan()
+
+    async def arequest(method: str, url: str, params: dict) -> httpx.Response:
+        return etherscan(method, url, params)
+
+    monkeypatch.setattr(abi, "request", etherscan)
+    monkeypatch.setattr(abi, "arequest", arequest)
+    return etherscan
+
+
+def test_remote_abi_is_served_by_the_store(store, etherscan):
+    first = _fetch(_PROXY)
+    requests = len(etherscan.requests)
+
+    assert _fetch(_PROXY) == first
+    assert len(etherscan.requests) == requests
+
+
+def test_async_fetch_shares_the_sync_steps(store, etherscan):
+    found = asyncio.run(abi.afetch_contract_abi(_PROXY, function_name="submit"))
+
+    assert found == etherscan.abi
+    assert etherscan.requests == [
+        ("getsourcecode", _PROXY),
+        ("getsourcecode", _IMPLEMENTATION),
+        ("getabi", _IMPLEMENTATION),
+    ]
+    assert _fetch(_PROXY) == found
+    assert len(etherscan.requests) == 3
+
+
+def test_expired_entries_are_revalidated_against_etherscan(store, etherscan):
+    assert _fetch(_PROXY) == etherscan.abi
+
+    # The proxy is upgraded once the entries expired
+    store.ttl = 0
+    etherscan.implementation = "0x6ca84080381E43938476814be61B779A8bB6a600"
+    etherscan.abi = [_function("submitV2", [])]
+
+    assert _fetch(_PROXY) == etherscan.abi
+    assert ("getsourcecode", _PROXY) in etherscan.requests[3:]
+    implementation = store.get_implementation(_PROXY, allow_stale=True)
+    assert implementation == etherscan.implementation
+
+
+def test_stale_entries_are_served_when_etherscan_fails(store, etherscan, monkeypatch):
+    expected = _fetch(_PROXY)
+    store.ttl = 0
+
+    def unavailable(method, url, params):
+        raise httpx.ConnectError("unavailable")
+
+    monkeypatch.setattr(abi, "request", unavailable)
+    assert _fetch(_PROXY) == expected
+
+
+def test_seeded_aliases_resolve_contract_names(store):
+    erc4626 = [_function("deposit", [{"name": "assets", "type": "uint256"}])]
+    address = "0x0000000000000000000000000000000000000001"
+    # An alias seeded after a miss is found by the next lookup
+    assert abi._fetch_cached_abi(address, contract_type="ERC4626") is None
+    store.put_alias("erc4626", erc4626)
+
+    found = abi._fetch_cached_abi(address, contract_type="ERC4626")
+    assert found == erc4626
+
+
+_ENCODING_ABI = [
+    _function(
+        "execute",
+        [
+            {
+                "name": "order",
+                "type": "tuple",
+                "components": [
+                    {"name": "token", "type": "address"},
+                    {"name": "amounts", "type": "uint256[]"},
+                ],
+            },
+            {"name": "path", "type": "address[]"},
+            {"name": "data", "type": "bytes"},
+        ],
+    ),
+    _function("transfer", [{"name": "to", "type": "address"}]),
+    _function(
+        "transfer",
+        [{"name": "to", "type": "address"}, {"name": "amount", "type": "uint256"}],
+    ),
+]
+
+_TOKEN = "0xdAC17F958D2ee523a2206206994597C13D831ec7"
+_ROUTER = "0x7a250d5630B4cF539739dF2C5dAcb4c659F2488D"
+
+
+@pytest.mark.parametrize(
+    "function_name, arguments, compiled",
+    [
+        # Tuple, array and bytes inputs
+        ("execute", [(_TOKEN, [1, 2]), [_TOKEN, _ROUTER], b"\x12\x34"], True),
+        # Bytes as a hex string, normalized by web3
+        ("execute", [(_TOKEN, []), [], "0x1234"], True),
+        # Overloads are left to web3
+        ("transfer", [_ROUTER, 100], False),
+        ("transfer", [_ROUTER], False),
+    ],
+)
+def test_compiled_encoder_matches_web3(function_name, arguments, compiled):
+    contract = abi.get_w3().eth.contract(abi=_ENCODING_ABI)
+    expected = contract.encode_abi(function_name, list(arguments))
+
+    data = abi.encode_function_call.invoke(
+        {"abi": _ENCODING_ABI, "function_name": function_name, "arguments": arguments}
+    )
+
+    assert data == expected
+    assert (abi._get_encoder(_ENCODING_ABI, function_name) is not None) == compiled
+
+
+def test_compiled_encoders_are_bounded(monkeypatch):
+    monkeypatch.setattr(abi, "_ENCODERS", type(abi._ENCODERS)())
+    monkeypatch.setattr(abi, "_MAX_ENCODERS", 2)
+    names = [f"f{i}" for i in range(3)]
+    functions = [_function(name, [{"name": "x", "type": "uint256"}]) for name in names]
+
+    for name in names:
+        abi._get_encoder(functions, name)
+
+    assert [key[1] for key in abi._ENCODERS] == ["f1", "f2"]
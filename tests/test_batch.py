@@ -0,0 +1,111 @@
+import json
+import asyncio
+
+import pytest
+
+from graph import batch
+from graph.batch import BatchSummary, arun_batch, read_intents
+from graph.compiler import acompile_step
+from graph.metrics import RunMetrics
+
+
+_SENDER = "0xd8dA6BF26964aF9D7eEd9e03E53415D37aA96045"
+
+
+class _App:
+    """Completes an intent after `input` seconds, failing the intents marked as such."""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def ainvoke(self, input: dict, config: dict) -> dict:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            delay, outcome = input["input"].split()
+            await asyncio.sleep(float(delay))
+        finally:
+            self.in_flight -= 1
+        # The step of a failing intent is missed by the compiler
+        step = "Send 0.1 ETH to " + _SENDER if outcome == "succeeds" else "Bridge 1 ETH"
+        await acompile_step(step, _SENDER)
+        if outcome == "raises":
+            raise RuntimeError("provider unavailable")
+        if outcome == "reverts":
+            return {"steps": ["Send 1 ETH to a.eth"], "error": "reverted"}
+        return {"steps": [], "error": None, "simulated_txs": []}
+
+
+@pytest.fixture
+def app(monkeypatch):
+    app = _App()
+    monkeypatch.setattr(batch, "get_app", lambda: app)
+    return app
+
+
+def _intent(id: int, input: str) -> dict:
+    return {"id": id, "input": input, "from_address": _SENDER}
+
+
+def test_batch_streams_one_result_per_line(app, tmp_path):
+    intents_path = tmp_path / "intents.jsonl"
+    lines = [json.dumps(_intent(i, "0.01 succeeds")) for i in range(6)]
+    lines += [
+        json.dumps(_intent(6, "0.01 reverts")),
+        "",
+        '{"id": 7, "input": ',
+        json.dumps(_intent(8, "0.01 raises")),
+        "[1, 2]",
+        json.dumps({"id": 9, "input": "0.01 succeeds"}),
+    ]
+    intents_path.write_text("\n".join(lines) + "\n")
+    output_path = tmp_path / "results.jsonl"
+
+    summary = asyncio.run(
+        arun_batch(read_intents(str(intents_path)), str(output_path), concurrency=3)
+    )
+
+    assert app.max_in_flight == 3
+    results = [json.loads(line) for line in output_path.read_text().splitlines()]
+    assert len(results) == 11
+    by_id = {result["id"]: result for result in results if result["id"] is not None}
+    assert all(by_id[i]["succeeded"] for i in range(6))
+    assert by_id[6]["error"] == "reverted"
+    assert by_id[6]["remaining_steps"] == ["Send 1 ETH to a.eth"]
+    assert by_id[8]["error"] == "RuntimeError: provider unavailable"
+    # Without a sender the intent fails on its own
+    assert by_id[9]["error"] == "KeyError: 'from_address'"
+    malformed = [result["error"] for result in results if result["id"] is None]
+    assert len(malformed) == 2
+    assert malformed[0].startswith("ValueError: Line 9 is not valid JSON")
+    assert malformed[1] == "ValueError: Line 11 is not a JSON object"
+    # Each result carries the metrics of its run
+    assert RunMetrics(**by_id[0]["metrics"]).tool_calls == {}
+
+    assert (summary.total, summary.succeeded, summary.failed) == (11, 6, 5)
+    assert len(summary.latencies) == 11
+    assert summary.percentile(50) <= summary.percentile(90) <= summary.percentile(99)
+    assert summary.percentile(99) == max(summary.latencies)
+    # The steps of the malformed intents were never compiled
+    assert summary.compiler.hits == 6 and summary.compiler.misses == 2
+    assert summary.compiler.hits_by_rule == {"eth_transfer": 6}
+    assert "Compiler: hits: 6, misses: 2, hit rate: 75.0%" in str(summary)
+
+
+def test_percentiles_use_the_nearest_rank():
+    summary = BatchSummary(
+        total=10,
+        succeeded=10,
+        failed=0,
+        wall_time=5.0,
+        latencies=[float(i) for i in range(10, 0, -1)],
+    )
+    assert summary.percentile(50) == 5.0
+    assert summary.percentile(90) == 9.0
+    assert summary.percentile(99) == 10.0
+    assert summary.percentile(0) == 1.0
+    assert summary.throughput == 10 / 5.0 * 3600
+    assert BatchSummary(
+        total=0, succeeded=0, failed=0, wall_time=0.0, latencies=[]
+    ).percentile(50) == 0.0
@@ -0,0 +1,56 @@
+from typing import List
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from case.case_retriever import open_index, sync_index
+
+
+class _Embedding(DeterministicFakeEmbedding):
+    """Fake embedding model counting the embedded texts."""
+
+    model: str = "fake-small"
+    embedded: int = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.embedded += len(texts)
+        return super().embed_documents(texts)
+
+
+def _docs(*cases) -> List[Document]:
+    return [
+        Document(page_content=description, metadata={"case_id": case_id})
+        for case_id, description in cases
+    ]
+
+
+def test_unchanged_cases_are_not_embedded_again(tmp_path):
+    path = str(tmp_path / "index")
+    embedding = _Embedding(size=8)
+    db, collection = open_index(path, embedding)
+    stats = sync_index(db, collection, _docs(("1", "Swap 1 ETH"), ("2", "Stake 1 ETH")))
+    assert (stats.reused, stats.embedded, stats.deleted) == (0, 2, 0)
+
+    # Case 2 only changes its metadata, case 3 replaces case 1
+    db, collection = open_index(path, embedding)
+    docs = _docs(("4", "Stake 1 ETH"), ("3", "Wrap 1 ETH"))
+    stats = sync_index(db, collection, docs)
+    assert (stats.reused, stats.embedded, stats.deleted) == (1, 1, 1)
+    assert embedding.embedded == 3
+
+    stored = db.get(include=["metadatas", "documents"])
+    cases = dict(zip(stored["documents"], stored["metadatas"]))
+    assert cases == {"Stake 1 ETH": {"case_id": "4"}, "Wrap 1 ETH": {"case_id": "3"}}
+
+
+def test_index_is_rebuilt_for_another_embedding_model(tmp_path):
+    path = str(tmp_path / "index")
+    docs = _docs(("1", "Swap 1 ETH"), ("2", "Stake 1 ETH"))
+    db, collection = open_index(path, _Embedding(size=8))
+    sync_index(db, collection, docs)
+
+    embedding = _Embedding(size=8, model="fake-large")
+    db, collection = open_index(path, embedding)
+    stats = sync_index(db, collection, docs)
+    assert (stats.reused, stats.embedded, stats.deleted) == (0, 2, 0)
+    assert collection.metadata["embedding_model"] == "fake-large"
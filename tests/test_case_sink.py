@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+from langchain_core.documents import Document
+
+from case.case_store import CaseStore
+from case_code.case_sink import CaseSink, ConversionCheckpoint
+from case_code.code_converter import ConversionMetadata, convert_documents
+from case_code.code_loader import CASE_MARKER
+from models.case import BatchCase, CaseOutput
+
+
+def _doc(case: str, version: str = "v1") -> Document:
+    return Document(
+        page_content=f"{CASE_MARKER} {case} {version}",
+        metadata={"case": case, "file": "index.ts"},
+    )
+
+
+class _Chain:
+    """Converts a document into one case described by its version, counts the calls."""
+
+    def __init__(self):
+        self.calls = []
+
+    async def ainvoke(self, content: str) -> CaseOutput:
+        self.calls.append(content)
+        _, case, version = content.split()
+        return CaseOutput(cases=[BatchCase(id=case, description=version, steps=[])])
+
+
+async def _documents(docs):
+    for doc in docs:
+        yield doc
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return str(tmp_path / "cases.jsonl"), str(tmp_path / "checkpoint.jsonl")
+
+
+async def _convert(paths, docs, chain, **kwargs):
+    output_path, checkpoint_path = paths
+    checkpoint = ConversionCheckpoint(checkpoint_path)
+    async with CaseSink(output_path, checkpoint, **kwargs) as sink:
+        return await convert_documents(_documents(docs), chain, sink, concurrency=2)
+
+
+def _cases(output_path) -> list:
+    with CaseStore(output_path) as store:
+        return [(case["id"], case["description"], case["source"]) for case in store]
+
+
+def test_interrupted_run_resumes_after_the_last_flush(paths):
+    output_path, checkpoint_path = paths
+    docs = [_doc(case) for case in ("a", "b", "c", "d")]
+
+    async def interrupted():
+        checkpoint = ConversionCheckpoint(checkpoint_path)
+        sink = CaseSink(output_path, checkpoint, flush_size=1)
+        await sink.__aenter__()
+        await convert_documents(_documents(docs[:2]), _Chain(), sink)
+        # The process dies without closing the sink, the flushed cases are only in the
+        # partial file
+        sink._writer.cancel()
+        sink._file.close()
+        sink.checkpoint.close()
+
+    asyncio.run(interrupted())
+    chain = _Chain()
+    stats = asyncio.run(_convert(paths, docs, chain))
+
+    assert chain.calls == [doc.page_content for doc in docs[2:]]
+    assert stats[ConversionMetadata.AlreadyConverted] == 2
+    assert stats[ConversionMetadata.TotalCases] == 2
+    # Every case once, the cases of the interrupted run included
+    assert _cases(output_path) == [
+        (case, "v1", f"{case}/index.ts") for case in ("a", "b", "c", "d")
+    ]
+
+
+def test_changed_source_replaces_its_cases(paths):
+    output_path, _ = paths
+    asyncio.run(_convert(paths, [_doc("a"), _doc("b")], _Chain()))
+
+    chain = _Chain()
+    stats = asyncio.run(_convert(paths, [_doc("a", "v2"), _doc("b")], chain))
+
+    assert chain.calls == [_doc("a", "v2").page_content]
+    assert stats[ConversionMetadata.AlreadyConverted] == 1
+    assert _cases(output_path) == [
+        ("a", "v2", "a/index.ts"),
+        ("b", "v1", "b/index.ts"),
+    ]
+
+
+def test_writer_error_stops_the_conversion(paths, monkeypatch):
+    _, checkpoint_path = paths
+
+    def full_disk(self, batch):
+        if batch:
+            raise OSError("No space left on device")
+
+    monkeypatch.setattr(CaseSink, "_flush", full_disk)
+    # More documents than the queue of the workers holds
+    docs = [_doc(f"case{i}") for i in range(20)]
+
+    async def run():
+        await asyncio.wait_for(_convert(paths, docs, _Chain(), flush_size=1), 10)
+
+    with pytest.raises(OSError, match="No space left"):
+        asyncio.run(run())
+    # No source is claimed by the checkpoint, they are all converted again
+    assert ConversionCheckpoint(checkpoint_path).entries == {}
@@ -0,0 +1,116 @@
+import os
+import json
+
+import pytest
+
+from case import case_store
+from case.case_store import INDEX_SUFFIX, CaseStore, _line_source, write_case_file
+
+
+def _line(case: dict) -> bytes:
+    return (json.dumps(case) + "\n").encode()
+
+
+def _write(path, cases) -> None:
+    write_case_file(str(path), [(case.get("id"), _line(case)) for case in cases])
+
+
+def test_cases_are_read_by_id_in_order(tmp_path):
+    path = tmp_path / "cases.jsonl"
+    cases = [
+        {"id": "b", "n": 1, "source": "b/index.ts"},
+        {"n": 2, "source": "none/index.ts"},
+        {"id": "a", "n": 3, "source": "a/index.ts"},
+        {"id": "b", "n": 4, "source": "b/other.ts"},
+    ]
+    _write(path, cases)
+
+    with CaseStore(str(path)) as store:
+        assert len(store) == 4
+        assert store.ids() == ["a", "b"]
+        # The first case of a duplicated id in file order
+        assert store.get("b") == cases[0]
+        assert store.get("c") is None
+        assert "a" in store and "c" not in store and None not in store
+        # By id, duplicates in file order and cases without an id last
+        assert [case["n"] for case in store] == [3, 1, 4, 2]
+        assert [case["n"] for case in store.iter_cases(by_id=False)] == [1, 2, 3, 4]
+        assert store.sources() == [case["source"] for case in cases]
+
+
+def test_index_is_reused_while_the_file_is_unchanged(tmp_path, monkeypatch):
+    path = tmp_path / "cases.jsonl"
+    _write(path, [{"id": "a", "source": "a/index.ts"}])
+
+    def scan(self):
+        raise AssertionError("the index was rebuilt")
+
+    monkeypatch.setattr(CaseStore, "_scan", scan)
+    with CaseStore(str(path)) as store:
+        assert store.ids() == ["a"]
+
+
+def test_index_is_rebuilt_when_the_file_changes(tmp_path):
+    path = tmp_path / "cases.jsonl"
+    _write(path, [{"id": "a", "source": "a/index.ts"}])
+
+    # Another size
+    with open(path, "ab") as file:
+        file.write(_line({"id": "b", "source": "b/index.ts"}))
+    with CaseStore(str(path)) as store:
+        assert store.ids() == ["a", "b"]
+        assert store.get("b") == {"id": "b", "source": "b/index.ts"}
+
+    # Same size, another modification time
+    stat = os.stat(path)
+    with open(path, "r+b") as file:
+        file.write(_line({"id": "c", "source": "c/index.ts"}))
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert os.stat(path).st_size == stat.st_size
+    with CaseStore(str(path)) as store:
+        assert store.ids() == ["b", "c"]
+
+    with open(f"{path}{INDEX_SUFFIX}") as file:
+        index = json.load(file)
+    assert index["size"] == stat.st_size
+    assert index["mtime_ns"] == os.stat(path).st_mtime_ns
+
+
+def test_truncated_last_line_is_skipped(tmp_path):
+    path = tmp_path / "cases.jsonl"
+    # An interrupted writer left half of the last line
+    lines = _line({"id": "a", "source": "a/index.ts"}) + _line({"id": "b"})[:8]
+    path.write_bytes(lines)
+
+    with CaseStore(str(path)) as store:
+        assert len(store) == 1
+        assert store.ids() == ["a"]
+        assert "b" not in store
+
+
+@pytest.mark.parametrize(
+    "case",
+    [
+        {"id": "a", "source": "a/index.ts"},
+        {"id": "a", "source": 'quoted "name"\\path'},
+        {"id": "a", "source": "café/index.ts"},
+        {"source": "a/index.ts", "id": "a"},
+        {"id": "a", "meta": {"source": "nested"}},
+        {"id": "a", "source": None},
+        {"id": "a"},
+    ],
+)
+def test_source_pattern_agrees_with_json(case):
+    for line in (_line(case), (json.dumps(case, ensure_ascii=False) + "\n").encode()):
+        assert _line_source(line) == json.loads(line).get("source")
+
+
+def test_only_the_source_is_parsed_when_it_is_the_last_key(monkeypatch):
+    parsed = []
+    loads = json.loads
+    monkeypatch.setattr(
+        case_store.json, "loads", lambda data: parsed.append(data) or loads(data)
+    )
+
+    assert _line_source(_line({"id": "a", "steps": [], "source": "a/b.ts"})) == "a/b.ts"
+    assert parsed == [b'"a/b.ts"']
@@ -0,0 +1,84 @@
+import asyncio
+from collections import Counter
+from typing import Optional
+
+from langchain_core.documents import Document
+from langchain_core.exceptions import OutputParserException
+
+from case.case_store import CaseStore
+from case_code import code_converter
+from case_code.case_sink import CaseSink, ConversionCheckpoint
+from case_code.code_converter import ConversionMetadata, convert_documents
+from case_code.code_loader import CASE_MARKER
+from models.case import BatchCase, CaseOutput
+
+
+def _doc(case: str) -> Document:
+    return Document(
+        page_content=f"{CASE_MARKER} {case}",
+        metadata={"case": case, "file": "index.ts"},
+    )
+
+
+class _Chain:
+    """Raises the errors of a case in order, then converts it."""
+
+    def __init__(self, failures: Optional[dict] = None):
+        failures = failures or {}
+        self.failures = {case: list(errors) for case, errors in failures.items()}
+        self.calls = Counter()
+
+    async def ainvoke(self, content: str) -> CaseOutput:
+        case = content.split()[-1]
+        self.calls[case] += 1
+        if self.failures.get(case):
+            raise self.failures[case].pop(0)
+        return CaseOutput(cases=[BatchCase(id=case, description=case, steps=[])])
+
+
+async def _documents(docs):
+    for doc in docs:
+        yield doc
+
+
+def _convert(tmp_path, docs, chain, max_retries):
+    output_path = str(tmp_path / "cases.jsonl")
+    checkpoint = ConversionCheckpoint(str(tmp_path / "checkpoint.jsonl"))
+
+    async def run():
+        async with CaseSink(output_path, checkpoint) as sink:
+            return await convert_documents(
+                _documents(docs), chain, sink, max_retries=max_retries
+            )
+
+    return asyncio.run(run())
+
+
+def test_provider_errors_are_retried_and_parse_errors_are_not(tmp_path, monkeypatch):
+    monkeypatch.setattr(code_converter, "RETRY_BACKOFF", 0)
+    docs = [_doc(case) for case in ("ok", "flaky", "down", "unparsable")]
+    chain = _Chain(
+        {
+            "flaky": [ConnectionError("reset")],
+            "down": [ConnectionError("unavailable")] * 10,
+            "unparsable": [OutputParserException("not a CaseOutput")],
+        }
+    )
+
+    stats = _convert(tmp_path, docs, chain, max_retries=2)
+
+    assert chain.calls == {"ok": 1, "flaky": 2, "down": 3, "unparsable": 1}
+    assert stats[ConversionMetadata.ProviderError] == 1
+    assert stats[ConversionMetadata.ParseError] == 1
+    assert stats[ConversionMetadata.TotalCases] == 2
+
+    # The failed sources are not checkpointed, only they are converted again
+    chain = _Chain()
+    stats = _convert(tmp_path, docs, chain, max_retries=2)
+
+    assert chain.calls == {"down": 1, "unparsable": 1}
+    assert stats[ConversionMetadata.AlreadyConverted] == 2
+    assert stats[ConversionMetadata.TotalCases] == 2
+    with CaseStore(str(tmp_path / "cases.jsonl")) as store:
+        assert store.ids() == ["down", "flaky", "ok", "unparsable"]
+        assert len(store) == 4
@@ -0,0 +1,227 @@
+import os
+import json
+import base64
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from case_code import CASE_MANIFEST_FILE
+from case_code.code_downloader import CodeDownloader, TruncatedTreeError
+from case_code.download_scheduler import DownloadScheduler
+
+
+_TREE_PATH = "/repos/blocto/bento-interface/git/trees/develop"
+_BLOB_PATH = "/repos/blocto/bento-interface/git/blobs/"
+
+
+class _GitHub:
+    """Serves the tree and the blobs of a repository from memory."""
+
+    def __init__(self):
+        # Path -> content of the files, the SHA of a file is derived from its content
+        self.files = {}
+        self.blob_requests = []
+        self.truncated = False
+        # SHA -> (status, headers) of the error responses served before the blob
+        self.errors = {}
+
+    @staticmethod
+    def sha(content: str) -> str:
+        return content.encode().hex()
+
+    def tree(self) -> dict:
+        tree = [
+            {"path": path, "type": "blob", "sha": self.sha(content)}
+            for path, content in self.files.items()
+        ]
+        tree.append({"path": "cases/swap", "type": "tree", "sha": "0"})
+        return {"tree": tree, "truncated": self.truncated}
+
+    def blob(self, sha: str) -> dict:
+        content = bytes.fromhex(sha)
+        return {"content": base64.b64encode(content).decode(), "encoding": "base64"}
+
+
+@pytest.fixture
+def github():
+    github = _GitHub()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split("?")[0]
+            if path == _TREE_PATH:
+                body = github.tree()
+            elif path.startswith(_BLOB_PATH):
+                sha = path[len(_BLOB_PATH) :]
+                github.blob_requests.append(sha)
+                if github.errors.get(sha):
+                    status, headers = github.errors[sha].pop(0)
+                    self.send_response(status)
+                    for name, value in headers.items():
+                        self.send_header(name, value)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                body = github.blob(sha)
+            else:
+                self.send_error(404)
+                return
+            data = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    github.url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield github
+    server.shutdown()
+    server.server_close()
+
+
+def _manifest(output_dir) -> dict:
+    with open(os.path.join(output_dir, CASE_MANIFEST_FILE)) as file:
+        return json.load(file)["files"]
+
+
+def test_sync_downloads_only_what_changed(github, tmp_path):
+    github.files = {
+        "cases/swap/index.ts": "swap v1",
+        "cases/stake/index.ts": "stake v1",
+        "README.md": "not a case",
+    }
+    downloader = CodeDownloader(output_dir=str(tmp_path), github_api_url=github.url)
+
+    report = downloader.sync()
+    assert sorted(report.added) == ["cases/stake/index.ts", "cases/swap/index.ts"]
+    assert report.changed == report.removed == report.unchanged == []
+    assert (tmp_path / "cases" / "swap" / "index.ts").read_text() == "swap v1"
+    assert _manifest(tmp_path) == {
+        "cases/stake/index.ts": github.sha("stake v1"),
+        "cases/swap/index.ts": github.sha("swap v1"),
+    }
+
+    # Nothing changed, nothing is downloaded
+    github.blob_requests.clear()
+    report = downloader.sync()
+    assert sorted(report.unchanged) == ["cases/stake/index.ts", "cases/swap/index.ts"]
+    assert report.added == report.changed == report.removed == []
+    assert github.blob_requests == []
+
+    github.files = {
+        "cases/swap/index.ts": "swap v2",
+        "cases/bridge/index.ts": "bridge v1",
+    }
+    report = downloader.sync()
+    assert report.added == ["cases/bridge/index.ts"]
+    assert report.changed == ["cases/swap/index.ts"]
+    assert report.removed == ["cases/stake/index.ts"]
+    assert sorted(github.blob_requests) == sorted(
+        [github.sha("swap v2"), github.sha("bridge v1")]
+    )
+    assert (tmp_path / "cases" / "swap" / "index.ts").read_text() == "swap v2"
+    assert not (tmp_path / "cases" / "stake").exists()
+    assert _manifest(tmp_path) == {
+        "cases/bridge/index.ts": github.sha("bridge v1"),
+        "cases/swap/index.ts": github.sha("swap v2"),
+    }
+
+
+def test_sync_refuses_a_truncated_tree(github, tmp_path):
+    github.files = {
+        "cases/swap/index.ts": "swap v1",
+        "cases/stake/index.ts": "stake v1",
+    }
+    downloader = CodeDownloader(output_dir=str(tmp_path), github_api_url=github.url)
+    downloader.sync()
+
+    # The files missing from a truncated tree must not be deleted as removed
+    github.files = {"cases/swap/index.ts": "swap v2"}
+    github.truncated = True
+    github.blob_requests.clear()
+    with pytest.raises(TruncatedTreeError):
+        downloader.sync()
+    assert github.blob_requests == []
+    assert (tmp_path / "cases" / "stake" / "index.ts").read_text() == "stake v1"
+    assert (tmp_path / "cases" / "swap" / "index.ts").read_text() == "swap v1"
+    assert _manifest(tmp_path) == {
+        "cases/stake/index.ts": github.sha("stake v1"),
+        "cases/swap/index.ts": github.sha("swap v1"),
+    }
+
+
+def _downloader(github, tmp_path, max_workers: int = 4) -> CodeDownloader:
+    downloader = CodeDownloader(output_dir=str(tmp_path), github_api_url=github.url)
+    downloader.scheduler = DownloadScheduler(max_workers=max_workers, backoff=0.01)
+    return downloader
+
+
+@pytest.mark.parametrize(
+    "headers",
+    [{"Retry-After": "0"}, {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "0"}],
+)
+def test_rate_limited_403_halves_the_concurrency_and_is_retried(github, headers):
+    github.files = {"cases/swap/index.ts": "swap v1"}
+    sha = github.sha("swap v1")
+    github.errors = {sha: [(403, headers)]}
+    scheduler = DownloadScheduler(max_workers=4, backoff=0.01)
+    url = f"{github.url}{_BLOB_PATH}{sha}"
+
+    scheduler.get(url)
+    assert github.blob_requests == [sha, sha]
+    # Halved by the 403, then raised by one by the successful retry
+    assert scheduler.limit == 3
+
+    # Halved down to one request at a time, not below
+    github.errors = {sha: [(429, {"Retry-After": "0"})] * 2}
+    scheduler.get(url)
+    assert scheduler.limit == 2
+
+
+def test_server_errors_are_retried(github, tmp_path):
+    github.files = {
+        "cases/swap/index.ts": "swap v1",
+        "cases/stake/index.ts": "stake v1",
+    }
+    swap, stake = github.sha("swap v1"), github.sha("stake v1")
+    # The stake file fails more often than the scheduler retries
+    github.errors = {swap: [(503, {})] * 2, stake: [(503, {})] * 4}
+    downloader = _downloader(github, tmp_path)
+
+    report = downloader.sync()
+    assert github.blob_requests.count(swap) == 3
+    assert github.blob_requests.count(stake) == downloader.scheduler.max_retries + 1
+    assert report.added == ["cases/swap/index.ts"]
+    assert list(report.failed) == ["cases/stake/index.ts"]
+    assert "503" in report.failed["cases/stake/index.ts"]
+    assert _manifest(tmp_path) == {"cases/swap/index.ts": swap}
+
+
+def test_forbidden_file_is_reported_without_aborting_the_sync(github, tmp_path):
+    github.files = {
+        "cases/swap/index.ts": "swap v1",
+        "cases/stake/index.ts": "stake v1",
+        "cases/bridge/index.ts": "bridge v1",
+    }
+    stake = github.sha("stake v1")
+    # A 403 without rate-limit headers is not transient
+    github.errors = {stake: [(403, {})]}
+    downloader = _downloader(github, tmp_path)
+
+    report = downloader.sync()
+    assert github.blob_requests.count(stake) == 1
+    assert sorted(report.added) == ["cases/bridge/index.ts", "cases/swap/index.ts"]
+    assert list(report.failed) == ["cases/stake/index.ts"]
+    assert "403" in report.failed["cases/stake/index.ts"]
+    assert downloader.scheduler.limit == downloader.scheduler.max_workers
+
+    # The failed file is not in the manifest, the next sync downloads it
+    report = downloader.sync()
+    assert report.added == ["cases/stake/index.ts"] and report.failed == {}
@@ -0,0 +1,79 @@
+import json
+import asyncio
+
+import pytest
+from eth_abi import decode, encode
+
+from graph import compiler
+
+
+_SENDER = "0xd8dA6BF26964aF9D7eEd9e03E53415D37aA96045"
+_USDT = "0xdAC17F958D2ee523a2206206994597C13D831ec7"
+_USDC = "0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48"
+_ROUTER = "0x7a250d5630B4cF539739dF2C5dAcb4c659F2488D"
+
+_TOKENS = {"usdt": (_USDT, 6), "usdc": (_USDC, 6)}
+
+
+class _Tool:
+    """Stands in for a tool called with `ainvoke`."""
+
+    def __init__(self, func):
+        self.func = func
+
+    async def ainvoke(self, arguments: dict):
+        return self.func(**arguments)
+
+
+def _router_abi(**_) -> list:
+    with open("abi/uniswap_v2_router.json") as file:
+        return json.load(file)
+
+
+@pytest.fixture
+def router(monkeypatch):
+    quotes = []
+
+    async def resolve_token(symbol: str):
+        return _TOKENS[symbol.lower()]
+
+    async def eth_call(to: str, data: str) -> bytes:
+        assert to == _ROUTER and data[:10] == "0xd06ca61f"
+        amount, path = decode(["uint256", "address[]"], bytes.fromhex(data[10:]))
+        quotes.append((amount, path))
+        return encode(["uint256[]"], [[amount, amount * 997 // 1000]])
+
+    monkeypatch.setattr(compiler, "_resolve_token", resolve_token)
+    monkeypatch.setattr(compiler, "_registry_address", lambda name, kind=None: _ROUTER)
+    monkeypatch.setattr(compiler, "aeth_call", eth_call)
+    monkeypatch.setattr(compiler, "fetch_contract_abi", _Tool(_router_abi))
+    monkeypatch.setattr(compiler, "get_deadline", _Tool(lambda: 1_700_000_000))
+    return quotes
+
+
+def _compile(description: str):
+    return asyncio.run(compiler.acompile_step(description, _SENDER))
+
+
+def test_swap_min_output_is_the_quote_less_slippage(router):
+    tx_params = _compile("Swap 100 USDT to USDC on Uniswap")
+
+    assert router == [(100_000_000, (_USDT.lower(), _USDC.lower()))]
+    amount_in, amount_out_min, path, to, deadline = decode(
+        ["uint256", "uint256", "address[]", "address", "uint256"],
+        bytes.fromhex(tx_params.data[10:]),
+    )
+    assert amount_in == 100_000_000
+    assert amount_out_min == 99_700_000 * (10_000 - compiler.SWAP_SLIPPAGE_BPS) // 10_000
+    assert to == _SENDER.lower()
+
+
+def test_swap_without_uniswap_is_left_to_the_model(router):
+    assert _compile("Swap 100 USDT to USDC") is None
+    assert _compile("Swap 100 USDT to USDC on Curve") is None
+    assert router == []
+
+
+def test_steps_with_a_second_action_are_left_to_the_model(router):
+    description = "Stake 0.3 ETH with Lido and restake stETH on Eigenpie"
+    assert _compile(description) is None
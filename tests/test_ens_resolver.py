@@ -0,0 +1,165 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from graph.tools import ens_resolver
+from graph.tools.ens_resolver import ENS_REGISTRY, EnsResolver, _node
+from graph.tools.rpc import RPCError
+
+
+_VITALIK = "0xd8dA6BF26964aF9D7eEd9e03E53415D37aA96045"
+_UNISWAP = "0x1a9C8182C09F50C8318d769245beA52c32BE35BC"
+_WILDCARD = "0x5555555555555555555555555555555555555555"
+_PUBLIC_RESOLVER = "0x231b0Ee14048e9dCcD1d247744d114a4EB5E8E63"
+_OFFCHAIN_RESOLVER = "0x7CE6Cf740075B5AF6b1681d67136B84431B43AbD"
+_ZERO = "0x0000000000000000000000000000000000000000"
+
+
+def _word(address: str) -> str:
+    return "0x" + address[2:].lower().rjust(64, "0")
+
+
+def _string(value: str) -> str:
+    data = value.encode()
+    padded = data.ljust((len(data) + 31) // 32 * 32, b"\0")
+    head = (32).to_bytes(32, "big") + len(data).to_bytes(32, "big")
+    return "0x" + (head + padded).hex()
+
+
+class _Chain:
+    """Answers the `eth_call`s of a batch from the records of a few names."""
+
+    def __init__(self):
+        self.resolvers = {}
+        self.records = {}
+        self.failing = set()
+        self.batches = []
+
+    def set_name(self, name: str, address: str, resolver: str = _PUBLIC_RESOLVER):
+        self.resolvers[_node(name)] = resolver
+        self.records[("0x3b3b57de", _node(name))] = _word(address)
+
+    def set_reverse(self, address: str, name: str):
+        node = _node(f"{address[2:].lower()}.addr.reverse")
+        self.resolvers[node] = _PUBLIC_RESOLVER
+        self.records[("0x691f3431", node)] = _string(name)
+
+    def _call(self, params: list):
+        call = params[0]
+        selector, node = call["data"][:10], call["data"][10:]
+        if (selector, node) in self.failing:
+            return RPCError("execution reverted")
+        if call["to"] == ENS_REGISTRY:
+            return _word(self.resolvers.get(node, _ZERO))
+        return self.records.get((selector, node), _word(_ZERO))
+
+    def batch(self, calls: list, return_exceptions: bool = False) -> list:
+        self.batches.append(calls)
+        return [self._call(params) for _, params in calls]
+
+
+class _Ens:
+    """The ENS module of web3, resolving wildcard and offchain names."""
+
+    def __init__(self):
+        self.addresses = {}
+        self.failing = set()
+        self.calls = []
+
+    def address(self, name: str):
+        self.calls.append(name)
+        if name in self.failing:
+            raise ConnectionError("gateway unavailable")
+        return self.addresses.get(name)
+
+
+@pytest.fixture
+def chain(monkeypatch):
+    chain = _Chain()
+
+    async def abatch(calls: list, return_exceptions: bool = False) -> list:
+        return chain.batch(calls, return_exceptions)
+
+    monkeypatch.setattr(ens_resolver, "batch", chain.batch)
+    monkeypatch.setattr(ens_resolver, "abatch", abatch)
+    return chain
+
+
+@pytest.fixture
+def ens(monkeypatch):
+    ens = _Ens()
+    monkeypatch.setattr(ens_resolver, "get_w3", lambda: SimpleNamespace(ens=ens))
+    return ens
+
+
+def test_names_are_resolved_in_two_batches_and_cached(chain, ens):
+    chain.set_name("vitalik.eth", _VITALIK)
+    chain.set_name("uniswap.eth", _UNISWAP)
+    resolver = EnsResolver()
+
+    names = ["vitalik.eth", "uniswap.eth"]
+    expected = {"vitalik.eth": _VITALIK, "uniswap.eth": _UNISWAP}
+    assert asyncio.run(resolver.aresolve_many(names)) == expected
+    assert resolver.resolve_many(names) == expected
+    assert len(chain.batches) == 2
+    assert ens.calls == []
+
+
+def test_names_without_a_resolver_go_through_the_wildcard_resolver(chain, ens):
+    ens.addresses["alice.base.eth"] = _WILDCARD.lower()
+    resolver = EnsResolver()
+
+    assert resolver.resolve("alice.base.eth") == _WILDCARD
+    assert ens.calls == ["alice.base.eth"]
+    assert resolver.resolve("alice.base.eth") == _WILDCARD
+    assert len(ens.calls) == 1
+
+
+def test_offchain_resolvers_are_followed(chain, ens):
+    chain.set_name("alice.cb.id", _ZERO, resolver=_OFFCHAIN_RESOLVER)
+    # The resolver reverts with OffchainLookup, web3 follows CCIP-Read
+    chain.failing.add(("0x3b3b57de", _node("alice.cb.id")))
+    ens.addresses["alice.cb.id"] = _WILDCARD
+
+    assert EnsResolver().resolve("alice.cb.id") == _WILDCARD
+
+
+def test_failed_calls_are_not_cached(chain, ens):
+    chain.set_name("vitalik.eth", _VITALIK)
+    chain.set_name("uniswap.eth", _UNISWAP)
+    chain.failing.add(("0x3b3b57de", _node("uniswap.eth")))
+    ens.failing.add("uniswap.eth")
+    resolver = EnsResolver()
+
+    addresses = resolver.resolve_many(["vitalik.eth", "uniswap.eth"])
+    assert addresses == {"vitalik.eth": _VITALIK, "uniswap.eth": None}
+
+    chain.failing.clear()
+    chain.batches.clear()
+    assert resolver.resolve("uniswap.eth") == _UNISWAP
+    assert resolver.resolve("vitalik.eth") == _VITALIK
+    assert len(chain.batches) == 2
+
+
+def test_names_without_address_are_cached_as_negative(chain, ens):
+    chain.set_name("empty.eth", _ZERO)
+    resolver = EnsResolver()
+
+    assert resolver.resolve("empty.eth") is None
+    assert resolver.resolve("empty.eth") is None
+    assert len(chain.batches) == 2
+    assert ens.calls == []
+
+
+def test_failed_reverse_records_are_not_cached(chain, ens):
+    chain.set_name("vitalik.eth", _VITALIK)
+    chain.set_reverse(_VITALIK, "vitalik.eth")
+    reverse = ("0x691f3431", _node(f"{_VITALIK[2:].lower()}.addr.reverse"))
+    chain.failing.add(reverse)
+    resolver = EnsResolver()
+
+    assert resolver.lookup_many([_VITALIK]) == {_VITALIK: None}
+
+    chain.failing.clear()
+    assert resolver.lookup_many([_VITALIK]) == {_VITALIK: "vitalik.eth"}
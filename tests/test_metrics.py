@@ -0,0 +1,118 @@
+import asyncio
+from typing import List, TypedDict
+
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.tools import tool
+from langgraph.graph import StateGraph
+
+from graph.metrics import RunMetrics, ainvoke_with_metrics, record_simulation_payload
+
+
+@tool
+def resolve_ens(name: str) -> str:
+    """Resolves an ENS name."""
+    return "0x0000000000000000000000000000000000000001"
+
+
+class _State(TypedDict):
+    input: str
+    steps: List[str]
+
+
+def _model(*usages: tuple) -> GenericFakeChatModel:
+    messages = [
+        AIMessage(
+            content="ok",
+            usage_metadata={
+                "input_tokens": prompt,
+                "output_tokens": completion,
+                "total_tokens": prompt + completion,
+            },
+        )
+        for prompt, completion in usages
+    ]
+    return GenericFakeChatModel(messages=iter(messages))
+
+
+def _app():
+    planner_model = _model((100, 20))
+    agent_model = _model((50, 5), (60, 6))
+
+    async def planner(state: _State):
+        await planner_model.ainvoke(state["input"])
+        return {"steps": ["Send 0.1 ETH to a.eth"]}
+
+    async def agent(state: _State):
+        # Two iterations of the converter loop, resolving a name in between
+        await agent_model.ainvoke(state["steps"][0])
+        await resolve_ens.ainvoke({"name": "a.eth"})
+        await resolve_ens.ainvoke({"name": "b.eth"})
+        await agent_model.ainvoke(state["steps"][0])
+        return {}
+
+    async def simulator(state: _State):
+        record_simulation_payload(1200, 3400)
+        return {"steps": []}
+
+    workflow = StateGraph(_State)
+    workflow.add_node("planner", planner)
+    workflow.add_node("agent", agent)
+    workflow.add_node("simulator", simulator)
+    workflow.set_entry_point("planner")
+    workflow.add_edge("planner", "agent")
+    workflow.add_edge("agent", "simulator")
+    workflow.set_finish_point("simulator")
+    return workflow.compile()
+
+
+def test_metrics_are_attributed_to_the_nodes():
+    state = asyncio.run(ainvoke_with_metrics(_app(), {"input": "Send 0.1 ETH"}))
+    metrics = state["metrics"]
+
+    assert state["steps"] == []
+    assert metrics.node_calls == {"planner": 1, "agent": 1, "simulator": 1}
+    assert metrics.prompt_tokens == {"planner": 100, "agent": 110}
+    assert metrics.completion_tokens == {"planner": 20, "agent": 11}
+    assert metrics.total_tokens == 241
+    assert metrics.tool_calls == {"resolve_ens": 2}
+    assert metrics.converter_iterations == 2
+    assert metrics.simulation_requests == 1
+    assert metrics.simulation_request_bytes == 1200
+    assert metrics.simulation_response_bytes == 3400
+    assert metrics.wall_time >= sum(metrics.node_wall_time.values()) > 0
+
+
+def test_payloads_outside_of_a_run_are_not_recorded():
+    # No run is current, the sizes are dropped without error
+    record_simulation_payload(1, 1)
+
+
+def test_prometheus_export_escapes_label_values():
+    metrics = RunMetrics(
+        wall_time=1.5,
+        node_calls={"planner": 1},
+        node_wall_time={'say "hi"\\\n': 0.25},
+        prompt_tokens={"planner": 100},
+        completion_tokens={"planner": 20},
+        tool_calls={"resolve_ens": 2},
+    )
+
+    text = metrics.to_prometheus(prefix="tx", labels={"run": "batch-1"})
+    lines = text.splitlines()
+
+    assert text.endswith("\n")
+    assert lines[:3] == [
+        "# HELP tx_run_seconds Wall time of the run.",
+        "# TYPE tx_run_seconds gauge",
+        'tx_run_seconds{run="batch-1"} 1.5',
+    ]
+    assert 'tx_node_seconds{run="batch-1",node="say \\"hi\\"\\\\\\n"} 0.25' in lines
+    assert 'tx_llm_tokens{run="batch-1",node="planner",type="prompt"} 100' in lines
+    assert 'tx_llm_tokens{run="batch-1",node="planner",type="completion"} 20' in lines
+    assert 'tx_tool_calls{run="batch-1",tool="resolve_ens"} 2' in lines
+    assert (
+        'tx_simulation_payload_bytes{run="batch-1",direction="request"} 0' in lines
+    )
+    # Without labels, samples have no braces
+    assert "tx_converter_iterations 0" in RunMetrics().to_prometheus(prefix="tx")
@@ -0,0 +1,109 @@
+import asyncio
+from typing import List
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import utils.model_selector
+from graph.plan_cache import PlanCache
+from models.case import BatchCase, Transaction
+
+
+class _Embedding(DeterministicFakeEmbedding):
+    """Fake embedding model counting the embedded queries, or failing."""
+
+    embedded: int = 0
+    fail: bool = False
+
+    async def aembed_query(self, text: str) -> List[float]:
+        if self.fail:
+            raise ConnectionError("embedding service unavailable")
+        self.embedded += 1
+        return self.embed_query(text)
+
+
+@pytest.fixture
+def embedding(monkeypatch):
+    embedding = _Embedding(size=8)
+    monkeypatch.setattr(utils.model_selector, "get_embedding", lambda: embedding)
+    return embedding
+
+
+def _plan(*steps: str) -> BatchCase:
+    return BatchCase(
+        id="1",
+        description="",
+        steps=[Transaction(description=step) for step in steps],
+    )
+
+
+async def _plan_through(cache: PlanCache, intent: str, plan: BatchCase) -> BatchCase:
+    """Look up the intent and store the plan on a miss, as the planner does."""
+    cached = await cache.aget(intent)
+    if cached is not None:
+        return cached
+    await cache.aput(intent, plan)
+    return plan
+
+
+def test_entries_persist_across_instances(tmp_path, embedding):
+    path = str(tmp_path / "plan_cache.sqlite3")
+    cache = PlanCache(path=path, max_size=2)
+
+    async def fill():
+        await cache.aput("Stake 1 ETH with Lido", _plan("Stake 1 ETH to Lido."))
+        await cache.aput("Send 1 ETH to a.eth", _plan("Send 1 ETH to a.eth."))
+        await cache.aput("Wrap 1 ETH", _plan("Wrap 1 ETH."))
+
+    asyncio.run(fill())
+    reloaded = PlanCache(path=path, max_size=2)
+
+    assert len(reloaded) == 2
+    plan = asyncio.run(reloaded.aget("Send 2 ETH to b.eth"))
+    assert [step.description for step in plan.steps] == ["Send 2 ETH to b.eth."]
+    assert asyncio.run(reloaded.aget("Stake 3 ETH with Lido")) is None
+
+
+def test_embedding_of_a_miss_is_reused_when_storing(embedding):
+    cache = PlanCache(path=None)
+    asyncio.run(cache.aput("Stake 1 ETH with Lido", _plan("Stake 1 ETH to Lido.")))
+    embedding.embedded = 0
+
+    # Same entities, so the lookup embeds the intent to compare it
+    intent = "Please stake 2 ETH with Lido"
+    asyncio.run(_plan_through(cache, intent, _plan("Stake 2 ETH to Lido.")))
+
+    assert embedding.embedded == 1
+    assert len(cache) == 2
+
+
+def test_embedding_failures_do_not_fail_the_planner(embedding):
+    cache = PlanCache(path=None)
+    asyncio.run(cache.aput("Stake 1 ETH with Lido", _plan("Stake 1 ETH to Lido.")))
+    embedding.fail = True
+
+    plan = _plan("Stake 2 ETH to Lido.")
+    assert asyncio.run(_plan_through(cache, "Please stake 2 ETH with Lido", plan)) is plan
+    # Stored without an embedding, still found by an exact match
+    assert asyncio.run(cache.aget("Please stake 5 ETH with Lido")) is not None
+
+
+def test_write_failures_do_not_fail_the_planner(tmp_path, embedding):
+    cache = PlanCache(path=str(tmp_path / "plan_cache.sqlite3"))
+    cache._conn.close()
+
+    plan = _plan("Wrap 1 ETH.")
+    assert asyncio.run(cache.aput("Wrap 1 ETH", plan))
+    assert asyncio.run(cache.aget("Wrap 2 ETH")) is not None
+
+
+def test_similar_intents_keep_the_direction_of_their_values(embedding):
+    cache = PlanCache(path=None, similarity_threshold=-1.0)
+    a, b, c, d = (f"0x{str(i) * 40}" for i in range(1, 5))
+    intent = f"Send 1 ETH from {a} to {b}"
+    asyncio.run(cache.aput(intent, _plan(f"Send 1 ETH from {a} to {b}.")))
+
+    plan = asyncio.run(cache.aget(f"Please send 2 ETH from {c} to {d}"))
+    assert [step.description for step in plan.steps] == [f"Send 2 ETH from {c} to {d}."]
+    # The first address is the recipient, the cached plan would send from it
+    assert asyncio.run(cache.aget(f"Send 2 ETH to {c} from {d}")) is None
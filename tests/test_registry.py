@@ -0,0 +1,66 @@
+import pytest
+
+from graph.tools.address import get_contract_address_by_name
+from graph.tools.registry import Registry, RegistryEntry
+
+
+def _token(address: str, symbol: str, name: str) -> RegistryEntry:
+    return RegistryEntry(
+        kind="token", chain_id=1, address=address, name=name, symbol=symbol
+    )
+
+
+def test_ambiguous_name_does_not_fall_back_to_a_weaker_match():
+    registry = Registry(
+        [
+            _token("0x0000000000000000000000000000000000000001", "USDX", "USD X"),
+            _token("0x0000000000000000000000000000000000000002", "USDX", "USD X v2"),
+            _token("0x0000000000000000000000000000000000000003", "USDXY", "USD XY"),
+        ]
+    )
+
+    assert registry.exact("usdx") is None
+    assert registry.lookup("usdx") is None
+    assert len(registry.search("usdx")) == 3
+
+
+def test_close_candidates_are_not_resolved():
+    registry = Registry(
+        [
+            _token("0x0000000000000000000000000000000000000001", "AAVEA", "Aave A"),
+            _token("0x0000000000000000000000000000000000000002", "AAVEB", "Aave B"),
+        ]
+    )
+
+    assert registry.lookup("aave") is None
+    assert registry.lookup("aave aa").symbol == "AAVEA"
+
+
+@pytest.mark.parametrize(
+    "name, address",
+    [
+        ("Uniswap", "0x7a250d5630B4cF539739dF2C5dAcb4c659F2488D"),
+        ("Uniswap V2 Routerr", "0x7a250d5630B4cF539739dF2C5dAcb4c659F2488D"),
+        ("lido", "0xae7ab96520DE3A18E5e111B5EaAb095312D7fE84"),
+    ],
+)
+def test_exact_and_clear_matches_are_resolved(name, address):
+    assert get_contract_address_by_name.invoke(name) == address
+
+
+@pytest.mark.parametrize(
+    "name, candidate",
+    [
+        ("ETH", "Renzo Restaked ETH (ezETH) 0xbf5495Efe5DB9ce00f80364C8B423567e58d2110"),
+        ("curve", "Curve DAO Token (CRV) 0xD533a949740bb3306d119CC777fa900bA034cd52"),
+    ],
+)
+def test_weak_matches_are_returned_as_candidates(name, candidate):
+    with pytest.raises(ValueError, match="No unambiguous contract") as error:
+        get_contract_address_by_name.invoke(name)
+    assert candidate in str(error.value)
+
+
+def test_unknown_name_is_not_found():
+    with pytest.raises(ValueError, match="not found"):
+        get_contract_address_by_name.invoke("qqxwvj")
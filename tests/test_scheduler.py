@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+from graph import workflow
+from graph.scheduler import analyze_dependencies, count_independent_steps
+from graph.tools import simulation
+from graph.tools.simulation import SimulationSession
+from graph.tools.simulation_backend import SimulationBackend
+from models.tx_params import TransactionParams
+
+
+_SENDER = "0xd8dA6BF26964aF9D7eEd9e03E53415D37aA96045"
+_RECIPIENTS = [
+    "0x8c575a7bB8f1E5E0D7B3B5A1B4A2ec2E1e4cB360",
+    "0x1a9C8182C09F50C8318d769245beA52c32BE35BC",
+    "0x2000000000000000000000000000000000000002",
+]
+
+
+def test_transfers_and_approvals_are_independent():
+    assert analyze_dependencies(
+        ["Send 0.1 ETH to alice.eth", "Transfer 100 USDC to bob.eth"]
+    ) == [False, False]
+    assert analyze_dependencies(
+        ["Approve 100 USDT for Uniswap", "Swap 100 USDT to USDC on Uniswap"]
+    ) == [False, False]
+
+
+def test_steps_after_a_producer_depend_on_it():
+    steps = ["Stake 0.3 ETH to Lido", "Approve stETH to Eigenpie", "Stake stETH"]
+    assert analyze_dependencies(steps) == [False, True, True]
+    assert count_independent_steps(["Send all my USDC to vitalik.eth"]) == 1
+
+
+class _Backend(SimulationBackend):
+    """Simulates bundles in which the transactions to `reverting` revert."""
+
+    def __init__(self, reverting: str):
+        self.reverting = reverting
+        self.bundles = []
+
+    def get_block_number(self) -> int:
+        return 1
+
+    def simulate_bundle(self, transactions, block_number=None, state_overrides=None):
+        self.bundles.append(transactions)
+        results = []
+        for tx in transactions:
+            trace = {"from": tx.from_address, "to": tx.to_address}
+            if tx.to_address == self.reverting:
+                trace["error"] = "reverted"
+                results.append({"status": False, "trace": [trace]})
+            else:
+                results.append({"status": True, "trace": [trace], "stateChanges": []})
+        return results
+
+
+@pytest.fixture
+def sends(monkeypatch):
+    steps = [f"Send 0.{i + 1} ETH to {r}" for i, r in enumerate(_RECIPIENTS)]
+    txs = {
+        step: TransactionParams(
+            from_address=_SENDER,
+            to_address=recipient,
+            data="0x",
+            value=hex((i + 1) * 10**17),
+        )
+        for i, (step, recipient) in enumerate(zip(steps, _RECIPIENTS))
+    }
+
+    async def generate_tx_params(description, from_address):
+        return txs[description]
+
+    monkeypatch.setattr(workflow, "generate_tx_params", generate_tx_params)
+    return steps, txs
+
+
+def test_speculation_accepts_the_prefix_before_a_failed_transaction(sends, monkeypatch):
+    steps, txs = sends
+    backend = _Backend(reverting=_RECIPIENTS[1])
+    monkeypatch.setattr(simulation, "get_simulation_backend", lambda: backend)
+    state = {"steps": steps, "from_address": _SENDER}
+
+    update = asyncio.run(workflow.speculate_step(state))
+
+    # The three steps are simulated as one bundle
+    assert backend.bundles == [[txs[step] for step in steps]]
+    assert [(step, tx) for step, tx, _ in update["simulated_txs"]] == [
+        (steps[0], txs[steps[0]])
+    ]
+    # The failed step is left to the sequential path, with the steps after it
+    assert update["steps"] == steps[1:]
+    assert update["current_step"] == (steps[1], txs[steps[1]])
+    assert update["error"] == "reverted"
+    session = update["simulation_session"]
+    assert isinstance(session, SimulationSession)
+    assert session.transactions == [txs[steps[0]]]
+
+
+def test_speculation_stops_at_a_failed_conversion(sends, monkeypatch):
+    steps, txs = sends
+    backend = _Backend(reverting="")
+    monkeypatch.setattr(simulation, "get_simulation_backend", lambda: backend)
+
+    async def generate_tx_params(description, from_address):
+        if description == steps[1]:
+            raise ValueError("conversion failed")
+        return txs[description]
+
+    monkeypatch.setattr(workflow, "generate_tx_params", generate_tx_params)
+    state = {"steps": steps, "from_address": _SENDER}
+    update = asyncio.run(workflow.speculate_step(state))
+
+    # Only the steps before the failed conversion are simulated
+    assert backend.bundles == [[txs[steps[0]]]]
+    assert update["steps"] == steps[1:]
+    assert update["error"] is None
@@ -0,0 +1,120 @@
+import json
+
+import pytest
+
+pytest.importorskip("eth", reason="the local EVM backend requires py-evm")
+
+from evm_node import TracingNode
+from graph.tools.simulation_backend import LocalEVMBackend, record_snapshot
+from models.tx_params import TransactionParams
+from utils.http import set_transport
+
+
+# Recorded by `record_snapshot` through `tests/evm_node.py`, from a py-evm chain with two
+# 6-decimal ERC-20 tokens, TKA and TKB, and an exchange swapping TKA for TKB at a 0.3% fee
+SNAPSHOT_PATH = "tests/fixtures/simulation_snapshot.json"
+
+_USER = "0x1000000000000000000000000000000000000001"
+_RECIPIENT = "0x2000000000000000000000000000000000000002"
+_TKA = "0x3Ac2d624C4BBF0C78B0e584a24f44B36ED522F64"
+_TKB = "0xCbA2209E1E3057B24b86C39510c77CCBB7F162F2"
+_EXCHANGE = "0x4432820FEa18b6D7cb4BEBFE6CCc50E394444beB"
+
+# approve → swap depends on the approval, the transfer of TKB on the swap
+BUNDLE = [
+    # approve(exchange, 100 TKA)
+    TransactionParams(
+        from_address=_USER,
+        to_address=_TKA,
+        data="0x095ea7b3"
+        "0000000000000000000000004432820fea18b6d7cb4bebfe6ccc50e394444beb"
+        "0000000000000000000000000000000000000000000000000000000005f5e100",
+        value="0x0",
+    ),
+    # swap(100 TKA, 99 TKB, user)
+    TransactionParams(
+        from_address=_USER,
+        to_address=_EXCHANGE,
+        data="0x6d9a640a"
+        "0000000000000000000000000000000000000000000000000000000005f5e100"
+        "0000000000000000000000000000000000000000000000000000000005e69ec0"
+        "0000000000000000000000001000000000000000000000000000000000000001",
+        value="0x0",
+    ),
+    # transfer(recipient, 50 TKB)
+    TransactionParams(
+        from_address=_USER,
+        to_address=_TKB,
+        data="0xa9059cbb"
+        "0000000000000000000000002000000000000000000000000000000000000002"
+        "0000000000000000000000000000000000000000000000000000000002faf080",
+        value="0x0",
+    ),
+    # 0.1 ETH to the recipient
+    TransactionParams(
+        from_address=_USER, to_address=_RECIPIENT, data="0x", value="0x16345785d8a0000"
+    ),
+]
+
+
+def _load_snapshot() -> dict:
+    with open(SNAPSHOT_PATH) as file:
+        return json.load(file)
+
+
+def _transfers(result: dict) -> list:
+    return [
+        (
+            change["assetInfo"]["symbol"],
+            change["from"].lower(),
+            change["to"].lower(),
+            int(change["rawAmount"], 16),
+        )
+        for change in result["assetChanges"]
+    ]
+
+
+@pytest.fixture
+def node():
+    snapshot = _load_snapshot()
+    block = snapshot["block"]
+    header = {
+        "number": hex(block["number"]),
+        "timestamp": hex(block["timestamp"]),
+        "gasLimit": hex(block["gas_limit"]),
+        "miner": block["coinbase"],
+    }
+    backend = LocalEVMBackend(SNAPSHOT_PATH)
+    node = TracingNode(lambda: backend._create_chain().get_vm(), header)
+    set_transport(node.transport())
+    yield node
+    set_transport(None)
+
+
+def test_recorded_bundle_replays_on_the_local_backend():
+    results = LocalEVMBackend(SNAPSHOT_PATH).simulate_bundle(BUNDLE)
+
+    assert [result["status"] for result in results] == [True] * 4
+    user, recipient = _USER.lower(), _RECIPIENT.lower()
+    exchange = _EXCHANGE.lower()
+    assert _transfers(results[1]) == [
+        ("tka", user, exchange, 100_000_000),
+        ("tkb", exchange, user, 99_700_000),
+    ]
+    assert _transfers(results[2]) == [("tkb", user, recipient, 50_000_000)]
+    assert _transfers(results[3]) == [("eth", user, recipient, 10**17)]
+
+
+def test_bundle_is_traced_on_top_of_the_previous_transactions(node, tmp_path):
+    path = str(tmp_path / "snapshot.json")
+    snapshot = record_snapshot(BUNDLE, "http://node.test", path)
+
+    traces = [r for r in node.requests if r["method"] == "debug_traceCall"]
+    # The swap is traced with the allowance set by the approval
+    allowance = traces[2]["params"][2]["stateOverrides"][_TKA.lower()]["stateDiff"]
+    assert int(list(allowance.values())[0], 16) == 100_000_000
+
+    # The slots read by the later transactions are kept, with their value before the bundle
+    assert snapshot["accounts"] == _load_snapshot()["accounts"]
+    results = LocalEVMBackend(path).simulate_bundle(BUNDLE)
+    assert [result["status"] for result in results] == [True] * 4
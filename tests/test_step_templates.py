@@ -0,0 +1,157 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.tools import tool
+
+from graph import step_templates
+from graph.step_templates import StepTemplateStore, _template_key, parse_step
+
+
+_SENDER = "0xd8dA6BF26964aF9D7eEd9e03E53415D37aA96045"
+_RECIPIENT = "0x8c575a7bB8f1E5E0D7B3B5A1B4A2ec2E1e4cB360"
+_OTHER_RECIPIENT = "0x1a9C8182C09F50C8318d769245beA52c32BE35BC"
+_USDT = "0xdAC17F958D2ee523a2206206994597C13D831ec7"
+
+
+@tool
+def get_contract_address_by_name(name: str) -> str:
+    """Returns the address of a contract."""
+    return {"USDT": _USDT}[name]
+
+
+@tool
+def convert_to_smallest_unit(amount: float, decimals: int) -> int:
+    """Converts an amount to the smallest unit of a token."""
+    return int(amount * 10**decimals)
+
+
+@tool
+def encode_function_call(abi: list, function_name: str, arguments: list) -> str:
+    """Encodes a function call."""
+    return _encoded(function_name, arguments)
+
+
+def _encoded(function_name: str, arguments: list) -> str:
+    return "0x" + "".join([function_name, *(str(a).lower() for a in arguments)])
+
+
+@pytest.fixture(autouse=True)
+def fake_tools(monkeypatch):
+    fakes = [
+        get_contract_address_by_name,
+        convert_to_smallest_unit,
+        encode_function_call,
+    ]
+    monkeypatch.setattr(step_templates, "_TOOLS", {t.name: t for t in fakes})
+
+
+def _transfer_messages(description: str, amount: int, recipient: str, raw: int):
+    """The messages of a converter transferring USDT."""
+    data = _encoded("transfer", [recipient, raw])
+    calls = [
+        ("get_contract_address_by_name", {"name": "USDT"}, _USDT),
+        ("convert_to_smallest_unit", {"amount": amount, "decimals": 6}, str(raw)),
+        (
+            "encode_function_call",
+            {"abi": [], "function_name": "transfer", "arguments": [recipient, raw]},
+            data,
+        ),
+    ]
+    messages = [HumanMessage(description)]
+    for i, (name, args, output) in enumerate(calls):
+        tool_call = {"name": name, "args": args, "id": str(i)}
+        messages.append(AIMessage(content="", tool_calls=[tool_call]))
+        messages.append(ToolMessage(content=output, tool_call_id=str(i)))
+    tx_params = {
+        "from_address": _SENDER,
+        "to_address": _USDT,
+        "data": data,
+        "value": "0x0",
+    }
+    messages.append(
+        AIMessage(
+            content="",
+            tool_calls=[{"name": "TransactionParams", "args": tx_params, "id": "tx"}],
+        )
+    )
+    return messages
+
+
+def _key(description: str) -> str:
+    return _template_key(*parse_step(description))
+
+
+def test_steps_differing_by_values_share_a_key():
+    key = _key(f"Transfer 100 USDT to {_RECIPIENT}")
+    assert _key(f"Transfer 25 USDT to {_OTHER_RECIPIENT}") == key
+    assert _key(f"Transfer 100 USDC to {_RECIPIENT}") != key
+    # A recipient given as an ENS name needs another tool call
+    assert _key("Transfer 100 USDT to vitalik.eth") != key
+    assert _key(f"Approve 100 USDT for {_RECIPIENT}") != key
+
+
+def test_recorded_template_is_replayed_with_the_values_of_the_step():
+    store = StepTemplateStore(path=None)
+    description = f"Transfer 100 USDT to {_RECIPIENT}"
+    messages = _transfer_messages(description, 100, _RECIPIENT, 100 * 10**6)
+
+    async def run():
+        assert await store.arecord(description, _SENDER, messages)
+        return await store.areplay(f"Transfer 25 USDT to {_OTHER_RECIPIENT}", _SENDER)
+
+    tx_params = asyncio.run(run())
+    assert tx_params.from_address == _SENDER
+    assert tx_params.to_address == _USDT
+    assert tx_params.data == _encoded("transfer", [_OTHER_RECIPIENT, 25 * 10**6])
+    assert store.stats.recorded == 1 and store.stats.replays == 1
+
+
+def test_steps_without_template_miss():
+    store = StepTemplateStore(path=None)
+    description = f"Transfer 100 USDT to {_RECIPIENT}"
+    messages = _transfer_messages(description, 100, _RECIPIENT, 100 * 10**6)
+
+    async def run():
+        await store.arecord(description, _SENDER, messages)
+        return await store.areplay(f"Transfer 100 USDC to {_RECIPIENT}", _SENDER)
+
+    assert asyncio.run(run()) is None
+    assert store.stats.misses == 1
+
+
+def test_conversions_not_using_the_values_of_the_step_are_refused():
+    store = StepTemplateStore(path=None)
+    # The model used another recipient than the one of the step
+    description = f"Transfer 100 USDT to {_OTHER_RECIPIENT}"
+    messages = _transfer_messages(description, 100, _RECIPIENT, 100 * 10**6)
+
+    assert not asyncio.run(store.arecord(description, _SENDER, messages))
+    assert len(store) == 0 and store.stats.refused == 1
+
+
+def test_templates_persist_across_instances(tmp_path):
+    path = str(tmp_path / "step_templates.sqlite3")
+    description = f"Transfer 100 USDT to {_RECIPIENT}"
+    messages = _transfer_messages(description, 100, _RECIPIENT, 100 * 10**6)
+    asyncio.run(StepTemplateStore(path=path).arecord(description, _SENDER, messages))
+
+    reloaded = StepTemplateStore(path=path)
+    assert len(reloaded) == 1
+    step = f"Transfer 7 USDT to {_OTHER_RECIPIENT}"
+    tx_params = asyncio.run(reloaded.areplay(step, _SENDER))
+    assert tx_params.data == _encoded("transfer", [_OTHER_RECIPIENT, 7 * 10**6])
+
+
+def test_store_is_best_effort(tmp_path):
+    corrupt = tmp_path / "corrupt.sqlite3"
+    corrupt.write_text("not a database")
+    unwritable = StepTemplateStore(path=str(tmp_path / "closed.sqlite3"))
+    unwritable._conn.close()
+    description = f"Transfer 100 USDT to {_RECIPIENT}"
+    messages = _transfer_messages(description, 100, _RECIPIENT, 100 * 10**6)
+
+    # The templates are kept in memory
+    for store in (StepTemplateStore(path=str(corrupt)), unwritable):
+        assert asyncio.run(store.arecord(description, _SENDER, messages))
+        assert asyncio.run(store.areplay(description, _SENDER)) is not None
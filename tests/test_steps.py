@@ -0,0 +1,38 @@
+import asyncio
+
+from utils.steps import Io, Steps, arun, run
+
+
+def _double(value: int) -> int:
+    if value < 0:
+        raise ValueError("negative")
+    return value * 2
+
+
+async def _adouble(value: int) -> int:
+    return _double(value)
+
+
+def _total(values: list) -> Steps[int]:
+    total = 0
+    for value in values:
+        try:
+            total += yield Io(_double, _adouble, value)
+        except ValueError:
+            continue
+    return total
+
+
+def _nested(values: list) -> Steps[int]:
+    total = yield from _total(values)
+    return total + 1
+
+
+def test_sync_and_async_runs_agree():
+    assert run(_total([1, 2, 3])) == 12
+    assert asyncio.run(arun(_total([1, 2, 3]))) == 12
+
+
+def test_errors_are_raised_into_the_steps():
+    assert run(_nested([1, -2, 3])) == 9
+    assert asyncio.run(arun(_nested([1, -2, 3]))) == 9
@@ -0,0 +1,151 @@
+import json
+import asyncio
+
+import httpx
+import pytest
+from eth_abi import decode, encode
+from web3 import Web3
+
+from graph.tools import token_metadata
+from graph.tools.token_metadata import (
+    MULTICALL3_ADDRESS,
+    TokenMetadata,
+    TokenMetadataStore,
+    aget_token_metadata,
+    get_token_metadata,
+)
+from utils.http import set_transport
+
+
+_STETH = "0xae7ab96520DE3A18E5e111B5EaAb095312D7fE84"
+_MKR = "0x9f8F72aA9304c8B593d555F12eF6589cC3A579A2"
+_NO_SYMBOL = "0x1000000000000000000000000000000000000001"
+_NOT_A_TOKEN = "0x2000000000000000000000000000000000000002"
+_ANSWERS_ANYTHING = "0x3000000000000000000000000000000000000003"
+
+_SELECTORS = {"95d89b41": "symbol", "06fdde03": "name", "313ce567": "decimals"}
+
+
+def _string(value: str) -> bytes:
+    return encode(["string"], [value])
+
+
+def _bytes32(value: str) -> bytes:
+    return value.encode().ljust(32, b"\0")
+
+
+def _uint(value: int) -> bytes:
+    return value.to_bytes(32, "big")
+
+
+# The outputs of the metadata functions of each contract, None when the call reverts
+_CONTRACTS = {
+    _STETH: {
+        "symbol": _string("stETH"),
+        "name": _string("Liquid staked Ether 2.0"),
+        "decimals": _uint(18),
+    },
+    # MKR returns its symbol and name as bytes32
+    _MKR: {"symbol": _bytes32("MKR"), "name": _bytes32("Maker"), "decimals": _uint(18)},
+    _NO_SYMBOL: {"symbol": None, "name": _string("No Symbol"), "decimals": _uint(6)},
+    _NOT_A_TOKEN: {"symbol": None, "name": None, "decimals": None},
+    # A fallback function answering any selector with the same word
+    _ANSWERS_ANYTHING: {"symbol": _uint(1), "name": _uint(1), "decimals": _uint(2**64)},
+}
+
+
+class _Node:
+    """Answers the Multicall3 `aggregate3` calls of JSON-RPC batches."""
+
+    def __init__(self):
+        self.requests = []
+
+    def _aggregate3(self, data: str) -> str:
+        assert data[:10] == "0x82ad56cb"
+        calls = decode(["(address,bool,bytes)[]"], bytes.fromhex(data[10:]))[0]
+        results = []
+        for target, allow_failure, call_data in calls:
+            # Every call may fail on its own without reverting the others
+            assert allow_failure
+            output = _CONTRACTS[Web3.to_checksum_address(target)][
+                _SELECTORS[call_data.hex()]
+            ]
+            results.append((output is not None, output or b""))
+        return "0x" + encode(["(bool,bytes)[]"], [results]).hex()
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        payload = json.loads(request.content)
+        self.requests.append(payload)
+        responses = []
+        for call in payload:
+            assert call["method"] == "eth_call"
+            assert call["params"][0]["to"] == MULTICALL3_ADDRESS
+            result = self._aggregate3(call["params"][0]["data"])
+            responses.append({"id": call["id"], "jsonrpc": "2.0", "result": result})
+        # The responses of a batch may come back in any order
+        return httpx.Response(200, json=responses[::-1])
+
+
+@pytest.fixture
+def node():
+    node = _Node()
+    set_transport(httpx.MockTransport(node.handle))
+    yield node
+    set_transport(None)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = TokenMetadataStore(str(tmp_path / "token_metadata.sqlite3"))
+    monkeypatch.setattr(token_metadata, "get_token_metadata_store", lambda: store)
+    yield store
+    store.close()
+
+
+def test_tokens_are_resolved_with_one_multicall(node, store):
+    tokens = get_token_metadata([address.lower() for address in _CONTRACTS])
+
+    assert len(node.requests) == 1 and len(node.requests[0]) == 1
+    assert tokens == {
+        _STETH: TokenMetadata(
+            symbol="stETH", name="Liquid staked Ether 2.0", decimals=18
+        ),
+        _MKR: TokenMetadata(symbol="MKR", name="Maker", decimals=18),
+        # A failed call leaves its field empty
+        _NO_SYMBOL: TokenMetadata(symbol="", name="No Symbol", decimals=6),
+    }
+
+
+def test_large_requests_are_split_into_one_batch(node, store, monkeypatch):
+    monkeypatch.setattr(token_metadata, "_MAX_TOKENS_PER_CALL", 2)
+
+    tokens = asyncio.run(aget_token_metadata(_CONTRACTS))
+
+    # Three aggregate3 calls in a single HTTP request
+    assert len(node.requests) == 1 and len(node.requests[0]) == 3
+    assert sorted(tokens) == sorted([_STETH, _MKR, _NO_SYMBOL])
+
+
+def test_resolved_tokens_are_persisted(node, store):
+    get_token_metadata([_STETH, _MKR, _NOT_A_TOKEN])
+    node.requests.clear()
+
+    tokens = get_token_metadata([_STETH, _MKR])
+    assert node.requests == []
+    assert tokens[_MKR].symbol == "MKR"
+
+    # Contracts that are not tokens are not stored, they are asked again
+    get_token_metadata([_STETH, _NOT_A_TOKEN])
+    assert len(node.requests) == 1
+    calls = decode(
+        ["(address,bool,bytes)[]"],
+        bytes.fromhex(node.requests[0][0]["params"][0]["data"][10:]),
+    )[0]
+    assert {Web3.to_checksum_address(target) for target, _, _ in calls} == {
+        _NOT_A_TOKEN
+    }
+
+    reopened = TokenMetadataStore(store.path)
+    assert reopened.get(_STETH.lower()) == tokens[_STETH]
+    assert reopened.stats() == {"tokens": 2}
+    reopened.close()
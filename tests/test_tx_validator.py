@@ -0,0 +1,173 @@
+import pytest
+from eth_abi import encode
+
+from graph.tx_validator import check_tx_params
+from models.tx_params import TransactionParams
+
+
+_SENDER = "0xd8dA6BF26964aF9D7eEd9e03E53415D37aA96045"
+_RECIPIENT = "0x8c575a7bB8f1E5E0D7B3B5A1B4A2ec2E1e4cB360"
+_USDT = "0xdAC17F958D2ee523a2206206994597C13D831ec7"
+_USDC = "0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48"
+_V2_ROUTER = "0x7a250d5630B4cF539739dF2C5dAcb4c659F2488D"
+_V3_ROUTER = "0xE592427A0AEce92De3Edee1F18E0157C05861564"
+_ROUTER_02 = "0x68b3465833fb72A70ecDF485E0e4C7bD8665Fc45"
+
+
+def _call(selector: str, types: list, arguments: list) -> str:
+    return selector + encode(types, arguments).hex()
+
+
+def _tx(to: str, data: str = "0x", value: int = 0) -> TransactionParams:
+    return TransactionParams(
+        from_address=_SENDER, to_address=to, data=data, value=hex(value)
+    )
+
+
+def _transfer(to: str, amount: int) -> str:
+    return _call("0xa9059cbb", ["address", "uint256"], [to, amount])
+
+
+def _approve(spender: str, amount: int) -> str:
+    return _call("0x095ea7b3", ["address", "uint256"], [spender, amount])
+
+
+def _v2_swap(amount: int) -> str:
+    return _call(
+        "0x38ed1739",
+        ["uint256", "uint256", "address[]", "address", "uint256"],
+        [amount, 0, [_USDT, _USDC], _SENDER, 1_700_000_000],
+    )
+
+
+def _exact_input(amount: int) -> str:
+    # USDT → 0.01% pool → USDC
+    fee = (100).to_bytes(3, "big")
+    path = bytes.fromhex(_USDT[2:]) + fee + bytes.fromhex(_USDC[2:])
+    return _call(
+        "0xc04b8d59",
+        ["(bytes,address,uint256,uint256,uint256)"],
+        [(path, _SENDER, 1_700_000_000, amount, 0)],
+    )
+
+
+def _exact_input_single(amount: int) -> bytes:
+    data = _call(
+        "0x414bf389",
+        ["(address,address,uint24,address,uint256,uint256,uint256,uint160)"],
+        [(_USDT, _USDC, 100, _SENDER, 1_700_000_000, amount, 0, 0)],
+    )
+    return bytes.fromhex(data[2:])
+
+
+def _multicall(*calls: bytes) -> str:
+    return _call("0xac9650d8", ["bytes[]"], [list(calls)])
+
+
+def _multicall_with_deadline(*calls: bytes) -> str:
+    return _call("0x5ae401dc", ["uint256", "bytes[]"], [1_700_000_000, list(calls)])
+
+
+# exactInput((bytes,address,uint256,uint256)) of SwapRouter02, not in the selector index
+def _router_02_exact_input(amount: int) -> bytes:
+    data = _call(
+        "0xb858183f",
+        ["(bytes,address,uint256,uint256)"],
+        [(b"\x00" * 43, _SENDER, amount, 0)],
+    )
+    return bytes.fromhex(data[2:])
+
+
+@pytest.mark.parametrize(
+    "description, tx_params",
+    [
+        (f"Send 0.1 ETH to {_RECIPIENT}", _tx(_RECIPIENT, value=10**17)),
+        (
+            f"Transfer 100 USDT to {_RECIPIENT}",
+            _tx(_USDT, _transfer(_RECIPIENT, 10**8)),
+        ),
+        (
+            f"Transfer 1,000 USDT to {_RECIPIENT}",
+            _tx(_USDT, _transfer(_RECIPIENT, 10**9)),
+        ),
+        ("Approve 100 USDT for Uniswap", _tx(_USDT, _approve(_V2_ROUTER, 10**8))),
+        ("Swap 100 USDT to USDC on Uniswap", _tx(_V2_ROUTER, _v2_swap(10**8))),
+        ("Swap 100 USDT to USDC on Uniswap V3", _tx(_V3_ROUTER, _exact_input(10**8))),
+        (
+            "Swap 100 USDT to USDC on Uniswap V3",
+            _tx(_V3_ROUTER, _multicall(_exact_input_single(10**8))),
+        ),
+        (
+            "Swap 100 USDT to USDC on Uniswap V3",
+            _tx(_ROUTER_02, _multicall_with_deadline(_exact_input_single(10**8))),
+        ),
+        # The wrapped call is unknown, the amount cannot be checked
+        (
+            "Swap 100 USDT to USDC on Uniswap V3",
+            _tx(_ROUTER_02, _multicall_with_deadline(_router_02_exact_input(10**6))),
+        ),
+        # The amount is the output of the swap, not among the arguments
+        ("Swap USDT for 100 USDC on Uniswap", _tx(_V2_ROUTER, _v2_swap(10**6))),
+        # Unknown function, nothing can be checked
+        ("Swap 100 USDT to USDC on Uniswap", _tx(_V2_ROUTER, "0x12345678" + "00" * 64)),
+        # The recipient is an ENS name, only the amount is checked
+        ("Transfer 100 USDT to vitalik.eth", _tx(_USDT, _transfer(_RECIPIENT, 10**8))),
+    ],
+)
+def test_matching_transactions_pass(description, tx_params):
+    assert check_tx_params(description, tx_params) == []
+
+
+@pytest.mark.parametrize(
+    "description, tx_params, mismatch",
+    [
+        (
+            f"Send 0.1 ETH to {_RECIPIENT}",
+            _tx(_RECIPIENT, value=10**18),
+            "is neither the value nor an argument",
+        ),
+        (
+            f"Send 0.1 ETH to {_RECIPIENT}",
+            _tx(_SENDER, value=10**17),
+            f"The recipient {_RECIPIENT} is not in the transaction",
+        ),
+        (
+            f"Transfer 100 USDT to {_RECIPIENT}",
+            _tx(_USDC, _transfer(_RECIPIENT, 10**8)),
+            "not to USDT",
+        ),
+        (
+            f"Transfer 1,000 USDT to {_RECIPIENT}",
+            _tx(_USDT, _transfer(_RECIPIENT, 10**8)),
+            "The amount 1000 USDT (1000000000) is neither the value nor an argument",
+        ),
+        (
+            "Approve 100 USDT for Uniswap",
+            _tx(_USDT, _transfer(_V2_ROUTER, 10**8)),
+            "Expected a call to approve or increaseAllowance",
+        ),
+        (
+            "Swap 100 USDT to USDC on Uniswap",
+            _tx(_V2_ROUTER, _v2_swap(10**6)),
+            "is neither the value nor an argument",
+        ),
+        (
+            "Swap 100 USDT to USDC on Uniswap V3",
+            _tx(_V3_ROUTER, _exact_input(10**6)),
+            "is neither the value nor an argument",
+        ),
+        (
+            "Swap 100 USDT to USDC on Uniswap V3",
+            _tx(_V3_ROUTER, _multicall(_exact_input_single(10**6))),
+            "is neither the value nor an argument",
+        ),
+        (
+            "Transfer 100 USDT to vitalik.eth",
+            _tx(_USDT, _transfer(_RECIPIENT, 10**6)),
+            "is neither the value nor an argument",
+        ),
+    ],
+)
+def test_mismatches_are_reported(description, tx_params, mismatch):
+    mismatches = check_tx_params(description, tx_params)
+    assert any(mismatch in m for m in mismatches), mismatches
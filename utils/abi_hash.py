@@ -0,0 +1,15 @@
+"""
+Content hash of an ABI, shared by the ABI store and the compiled encoders.
+
+Functions:
+- hash_abi: Hashes the canonical JSON form of an ABI or ABI fragment.
+"""
+
+import json
+import hashlib
+
+
+def hash_abi(abi: list) -> str:
+    """Hash the canonical JSON form of the ABI, so equal ABIs share one key."""
+    canonical = json.dumps(abi, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
@@ -0,0 +1,174 @@
+"""
+Shared HTTP clients for Tenderly, Etherscan and JSON-RPC calls.
+
+All requests go through one client per process (sync) or per event loop (async), so
+connections are kept alive and reused instead of opening a new TCP+TLS connection per
+call. Requests are also limited per host, in concurrency and in rate (see
+`utils.rate_limit`), so a burst of concurrent sessions cannot exceed what a provider accepts.
+
+Functions:
+- get_client: Returns the shared synchronous client.
+- get_async_client: Returns the shared asynchronous client of the running event loop.
+- request: Sends a request with the synchronous client.
+- arequest: Sends a request with the asynchronous client.
+- set_transport: Routes every request, including the model clients, through a transport.
+- get_model_http_clients: Returns the HTTP clients the chat models should use.
+"""
+
+import asyncio
+import threading
+import weakref
+from functools import lru_cache
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from utils.rate_limit import get_host_rate_limiter
+
+
+HTTP_TIMEOUT = httpx.Timeout(30.0, connect=10.0)
+
+HTTP_LIMITS = httpx.Limits(
+    max_connections=100, max_keepalive_connections=20, keepalive_expiry=30.0
+)
+
+# Maximum number of concurrent requests per host
+HOST_CONCURRENCY: Dict[str, int] = {
+    "api.etherscan.io": 5,
+    "mainnet.gateway.tenderly.co": 10,
+    "mainnet.infura.io": 20,
+}
+DEFAULT_HOST_CONCURRENCY = 10
+
+
+# Transport of every client, e.g. to replay recorded responses. None uses the network.
+_transport: Optional[httpx.BaseTransport] = None
+
+
+def _host(url: str) -> str:
+    return urlsplit(url).hostname or ""
+
+
+@lru_cache
+def get_client() -> httpx.Client:
+    """Returns the synchronous client shared by the process."""
+    return httpx.Client(timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS, transport=_transport)
+
+
+# An async client is bound to the event loop it was first used on
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+    weakref.WeakKeyDictionary()
+)
+_async_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = (
+    weakref.WeakKeyDictionary()
+)
+_sync_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+_sync_lock = threading.Lock()
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Returns the asynchronous client shared by the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS, transport=_transport
+        )
+        _async_clients[loop] = client
+    return client
+
+
+def _get_async_semaphore(host: str) -> asyncio.Semaphore:
+    semaphores = _async_semaphores.setdefault(asyncio.get_running_loop(), {})
+    if host not in semaphores:
+        limit = HOST_CONCURRENCY.get(host, DEFAULT_HOST_CONCURRENCY)
+        semaphores[host] = asyncio.Semaphore(limit)
+    return semaphores[host]
+
+
+def _get_sync_semaphore(host: str) -> threading.BoundedSemaphore:
+    with _sync_lock:
+        if host not in _sync_semaphores:
+            limit = HOST_CONCURRENCY.get(host, DEFAULT_HOST_CONCURRENCY)
+            _sync_semaphores[host] = threading.BoundedSemaphore(limit)
+        return _sync_semaphores[host]
+
+
+def request(method: str, url: str, **kwargs) -> httpx.Response:
+    """
+    Send a request with the shared synchronous client.
+
+    Args:
+        method (str): The HTTP method.
+        url (str): The URL.
+        **kwargs: Passed to `httpx.Client.request`, e.g. `params` or `json`.
+
+    Returns:
+        httpx.Response: The response.
+    """
+    host = _host(url)
+    rate_limiter = get_host_rate_limiter(host)
+    if rate_limiter:
+        rate_limiter.acquire()
+    with _get_sync_semaphore(host):
+        return get_client().request(method, url, **kwargs)
+
+
+async def arequest(method: str, url: str, **kwargs) -> httpx.Response:
+    """
+    Send a request with the shared asynchronous client.
+
+    Args:
+        method (str): The HTTP method.
+        url (str): The URL.
+        **kwargs: Passed to `httpx.AsyncClient.request`, e.g. `params` or `json`.
+
+    Returns:
+        httpx.Response: The response.
+    """
+    host = _host(url)
+    rate_limiter = get_host_rate_limiter(host)
+    if rate_limiter:
+        await rate_limiter.aacquire()
+    async with _get_async_semaphore(host):
+        return await get_async_client().request(method, url, **kwargs)
+
+
+async def aclose() -> None:
+    """Close the asynchronous client of the running event loop."""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def set_transport(transport: Optional[httpx.BaseTransport]) -> None:
+    """
+    Route every request through a transport, or back to the network with None.
+
+    The transport must implement both `handle_request` and `handle_async_request`. Clients
+    created before the call are discarded, models created before it keep their clients.
+
+    Args:
+        transport (Optional[httpx.BaseTransport]): The transport.
+    """
+    global _transport
+    _transport = transport
+    get_client.cache_clear()
+    _async_clients.clear()
+
+
+def get_model_http_clients() -> dict:
+    """
+    Returns the `http_client` and `http_async_client` arguments of the OpenAI models.
+
+    Empty unless a transport was set, in which case the models use their own clients.
+    """
+    if _transport is None:
+        return {}
+    return {
+        "http_client": httpx.Client(timeout=HTTP_TIMEOUT, transport=_transport),
+        "http_async_client": httpx.AsyncClient(
+            timeout=HTTP_TIMEOUT, transport=_transport
+        ),
+    }
@@ -3,8 +3,9 @@ from pydantic import BaseModel
 from langchain_core.language_models import BaseChatModel
 from langchain_core.embeddings import Embeddings
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain_anthropic import ChatAnthropic
-from langchain_google_vertexai import ChatVertexAI
+
+from utils.http import get_model_http_clients
+from utils.rate_limit import get_rate_limiter
 
 
 def _get_provider() -> str:
@@ -23,6 +24,10 @@ def get_embedding() -> Embeddings:
             # text-embedding-3-large
             # text-embedding-3-small
             model="text-embedding-3-large",
+            # Case descriptions are far below the context length, so they are sent as
+            # text instead of tiktoken tokens, whose encoding is downloaded on first use
+            check_embedding_ctx_length=False,
+            **get_model_http_clients(),
         )
     }
     try:
@@ -61,25 +66,42 @@ def get_chat_model(
     temperature: float = 0,
 ) -> ChatModelProvider:
     normalized_provider = provider or _get_provider().strip().lower()
-    try:
-        # Use the first model as default
-        model_name = model_names[normalized_provider][0]
-        chat_models = {
-            "openai": ChatModelProvider(
-                model=ChatOpenAI(model=model_name, temperature=temperature),
-                name=model_name,
-            ),
-            "anthropic": ChatModelProvider(
-                model=ChatAnthropic(model=model_name, temperature=temperature),
-                name=model_name,
-            ),
-            "google": ChatModelProvider(
-                model=ChatVertexAI(model=model_name, temperature=temperature),
-                name=model_name,
-            ),
-        }
-        return chat_models[normalized_provider]
-    except KeyError:
+    if normalized_provider not in model_names:
         raise ValueError(
             f"Provider must be one of the following: {', '.join(model_names.keys())}"
         )
+    # Use the first model as default
+    model_name = model_names[normalized_provider][0]
+    rate_limiter = get_rate_limiter("llm")
+    # Only the selected provider is imported and instantiated
+    if normalized_provider == "anthropic":
+        from langchain_anthropic import ChatAnthropic
+
+        model = ChatAnthropic(
+            model=model_name, temperature=temperature, rate_limiter=rate_limiter
+        )
+    elif normalized_provider == "google":
+        from langchain_google_vertexai import ChatVertexAI
+
+        model = ChatVertexAI(
+            model=model_name, temperature=temperature, rate_limiter=rate_limiter
+        )
+    else:
+        model = ChatOpenAI(
+            model=model_name,
+            temperature=temperature,
+            rate_limiter=rate_limiter,
+            **get_model_http_clients(),
+        )
+    return ChatModelProvider(model=model, name=model_name)
+
+
+@lru_cache(maxsize=8)
+def get_openai_model(model: str = "gpt-4o", temperature: float = 0) -> ChatOpenAI:
+    """Returns the OpenAI chat model shared by the graph nodes, created on first use."""
+    return ChatOpenAI(
+        model=model,
+        temperature=temperature,
+        rate_limiter=get_rate_limiter("llm"),
+        **get_model_http_clients(),
+    )
@@ -1,12 +1,18 @@
-from IPython.display import display, Markdown, Image
-from langgraph.graph.graph import CompiledGraph
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from langgraph.graph.graph import CompiledGraph
 
 
 def print_markdown(markdown: str):
+    from IPython.display import display, Markdown
+
     display(Markdown(markdown))
 
 
-def print_graph(graph: CompiledGraph):
+def print_graph(graph: "CompiledGraph"):
+    from IPython.display import display, Image
+
     try:
         display(Image(graph.get_graph().draw_mermaid_png()))
     except Exception:
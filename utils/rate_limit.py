@@ -0,0 +1,61 @@
+"""
+Token-bucket rate limits per provider, shared by the HTTP layer and the chat models.
+
+Each provider has its own bucket, so a burst of LLM calls does not consume the budget of
+Tenderly, Etherscan or the RPC endpoint. Rates are in requests per second and can be
+set with the `RATE_LIMIT_<PROVIDER>` environment variables, e.g. `RATE_LIMIT_ETHERSCAN=5`.
+
+Functions:
+- get_rate_limiter: Returns the token bucket of a provider.
+- get_host_rate_limiter: Returns the token bucket of the provider serving a host, if any.
+"""
+
+import os
+from functools import lru_cache
+from typing import Dict, Optional
+
+from langchain_core.rate_limiters import InMemoryRateLimiter
+
+
+# Default requests per second of each provider
+RATE_LIMITS: Dict[str, float] = {
+    "llm": 5,
+    "tenderly": 10,
+    "etherscan": 5,
+    "rpc": 20,
+}
+
+# Provider serving each host, the LLM is limited by the chat models themselves
+HOST_PROVIDERS: Dict[str, str] = {
+    "mainnet.gateway.tenderly.co": "tenderly",
+    "api.etherscan.io": "etherscan",
+    "mainnet.infura.io": "rpc",
+}
+
+
+@lru_cache
+def get_rate_limiter(provider: str) -> InMemoryRateLimiter:
+    """
+    Returns the token bucket of a provider, shared by the process.
+
+    Args:
+        provider (str): One of `llm`, `tenderly`, `etherscan` or `rpc`.
+
+    Returns:
+        InMemoryRateLimiter: The token bucket, refilled at the provider's rate and holding
+        at most one second of requests.
+    """
+    if provider not in RATE_LIMITS:
+        raise ValueError(f"Provider must be one of: {', '.join(RATE_LIMITS.keys())}")
+    rate = float(os.getenv(f"RATE_LIMIT_{provider.upper()}", RATE_LIMITS[provider]))
+    return InMemoryRateLimiter(
+        requests_per_second=rate,
+        check_every_n_seconds=min(0.1, 1 / rate),
+        max_bucket_size=max(1, rate),
+    )
+
+
+def get_host_rate_limiter(host: str) -> Optional[InMemoryRateLimiter]:
+    """Returns the token bucket of the provider serving a host, or None if it is not limited."""
+    provider = HOST_PROVIDERS.get(host)
+    return get_rate_limiter(provider) if provider else None
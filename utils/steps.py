@@ -0,0 +1,90 @@
+"""
+Sync and async versions of a function, written once as a generator of I/O steps.
+
+The function is a generator: it yields the I/O it needs as an `Io`, the sync and the async
+function to call with their arguments, and receives the result, or the exception raised
+by the call at the `yield`, so fallbacks are written once too. `run` performs the I/O with
+the sync functions and `arun` awaits the async ones, so only the I/O call differs between
+the two versions. Steps compose with `yield from`.
+
+Example:
+    def _fetch_steps(url: str) -> Steps[dict]:
+        response = yield Io(request, arequest, "GET", url)
+        return response.json()
+
+    def fetch(url: str) -> dict:
+        return run(_fetch_steps(url))
+
+    async def afetch(url: str) -> dict:
+        return await arun(_fetch_steps(url))
+
+Classes:
+- Io: An I/O call, with its sync and async functions.
+
+Functions:
+- run: Runs the steps with the sync functions.
+- arun: Runs the steps with the async functions.
+"""
+
+from typing import Any, Awaitable, Callable, Generator, TypeVar
+
+T = TypeVar("T")
+
+
+class Io:
+    """
+    An I/O call of the steps.
+
+    Args:
+        func (Callable): The sync function.
+        afunc (Callable): The async function, called with the same arguments.
+        *args, **kwargs: The arguments of the call.
+    """
+
+    __slots__ = ("func", "afunc", "args", "kwargs")
+
+    def __init__(
+        self,
+        func: Callable[..., Any],
+        afunc: Callable[..., Awaitable[Any]],
+        *args,
+        **kwargs,
+    ):
+        self.func = func
+        self.afunc = afunc
+        self.args = args
+        self.kwargs = kwargs
+
+
+# Yields I/O calls, receives their results and returns a value
+Steps = Generator[Io, Any, T]
+
+
+def run(steps: Steps[T]) -> T:
+    """Run the steps, performing their I/O with the sync functions."""
+    try:
+        io = next(steps)
+        while True:
+            try:
+                result = io.func(*io.args, **io.kwargs)
+            except Exception as e:
+                io = steps.throw(e)
+            else:
+                io = steps.send(result)
+    except StopIteration as stop:
+        return stop.value
+
+
+async def arun(steps: Steps[T]) -> T:
+    """Run the steps, awaiting their I/O with the async functions."""
+    try:
+        io = next(steps)
+        while True:
+            try:
+                result = await io.afunc(*io.args, **io.kwargs)
+            except Exception as e:
+                io = steps.throw(e)
+            else:
+                io = steps.send(result)
+    except StopIteration as stop:
+        return stop.value